@@ -0,0 +1,205 @@
+"""
+Streamlit UI for the background replacement app.
+
+Run with ``streamlit run app.py`` from this directory.
+"""
+import streamlit as st
+from PIL import Image
+import numpy as np
+import os
+import matting
+from compositor import Compositor, Layer
+from encoding import ALPHA_FORMATS, encode_image
+from ingest import fit_size
+from presets import load_presets
+from image import (
+    blur_license_plate,
+    transparency_preview,
+    resize_and_center,
+    estimate_car_orientation,
+    create_realistic_shadow,
+    create_ground_reflection,
+    SHADOW_BLUR_RADIUS,
+)
+
+# Custom CSS to improve layout
+st.markdown("""
+<style>
+    .stApp {
+        max-width: 1200px;
+        margin: 0 auto;
+    }
+    .step-header {
+        font-size: 1.1em;
+        margin-bottom: 10px;
+        color: #262730;
+        text-align: center;
+    }
+    .step-container {
+        background-color: #f0f2f6;
+        border-radius: 10px;
+        padding: 10px;
+        margin: 5px;
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# Streamlit UI
+st.title("Background Replacement App")
+
+# Upload section with better spacing
+st.markdown("### Upload Images")
+upload_cols = st.columns([1, 0.2, 1])
+with upload_cols[0]:
+    foreground_file = st.file_uploader("Foreground (Car) Image", type=["jpg", "png", "jpeg", "webp"])
+with upload_cols[2]:
+    background_file = st.file_uploader("Background Image", type=["jpg", "png", "jpeg", "webp"])
+fast_preview = st.checkbox("Fast preview (quicker, rougher background removal)")
+presets = load_presets(os.environ.get('RENDER_PRESETS'))
+preset = presets[st.selectbox("Resolution", list(presets), index=list(presets).index('print'))]
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def remove_background(img_array, mode):
+    """RGBA array of the car; reruns with the same image and mode skip the model"""
+    # The remover itself is loaded once per process and shared by all sessions
+    return matting.process(img_array, threshold=0.75, mode=mode)
+
+
+if foreground_file is not None:
+    # Load foreground image
+    foreground = Image.open(foreground_file)
+    # Everything below runs at the preset's resolution
+    size = fit_size(foreground.size, preset.max_side)
+    render_scale = size[0] / foreground.size[0]
+    if size != foreground.size:
+        foreground = foreground.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    
+    # Add spacing
+    st.markdown("### Processing Steps")
+    
+    # Create columns for processing steps with spacing
+    cols = st.columns([1, 0.05, 1, 0.05, 1, 0.05, 1])
+    
+    # Step 1: Original
+    with cols[0]:
+        st.markdown("<p class='step-header'>1. Original</p>", unsafe_allow_html=True)
+        with st.container():
+            st.image(foreground, use_container_width=True)
+    
+    # Step 2: Plate Blurred
+    with cols[2]:
+        st.markdown("<p class='step-header'>2. Plate Blurred</p>", unsafe_allow_html=True)
+        with st.container():
+            foreground_blurred = blur_license_plate(foreground)
+            st.image(foreground_blurred, use_container_width=True)
+            foreground = foreground_blurred
+    
+    # Step 3: Background Removed
+    with cols[4]:
+        st.markdown("<p class='step-header'>3. Background Removed</p>", unsafe_allow_html=True)
+        with st.container():
+            with st.spinner('Processing...'):
+                # Convert PIL to numpy array
+                img_array = np.array(foreground)
+                
+                # Remove background and get mask with shadow preservation
+                # Base mode for better quality, unless a fast preview is enough
+                output = remove_background(img_array, 'fast' if fast_preview else 'base')
+                
+                # Convert back to PIL Image
+                foreground_removed = Image.fromarray(output)
+                
+                # Show a display-sized preview on a checkerboard background
+                preview = transparency_preview(foreground_removed)
+                st.image(preview, use_container_width=True)
+    
+    # Step 4: Final Result
+    with cols[6]:
+        st.markdown("<p class='step-header'>4. Final Result</p>", unsafe_allow_html=True)
+        if background_file is not None:
+            # Resized to the car image's size while compositing
+            background = Image.open(background_file)
+            foreground_removed = resize_and_center(foreground_removed, foreground.size)
+            
+            # Detect car angle and orientation
+            angle, orientation, _ = estimate_car_orientation(foreground_removed)
+            st.markdown(f"<p class='step-header'>Car Angle: {orientation.title()}, {angle:.1f}°</p>", unsafe_allow_html=True)
+            
+            # Resize foreground to be slightly smaller (80% of background height)
+            bg_w, bg_h = foreground.size
+            target_height = int(bg_h * 0.8)
+            scale = target_height / foreground_removed.size[1]
+            new_width = int(foreground_removed.size[0] * scale)
+            
+            foreground_resized = foreground_removed.resize(
+                (new_width, target_height),
+                Image.Resampling.LANCZOS
+            )
+            
+            # Center the car horizontally and place it lower to avoid floating appearance
+            paste_x = (bg_w - new_width) // 2
+            paste_y = (bg_h - target_height) // 2 + int(bg_h * 0.02)  # Slight downward shift to ground the car
+            
+            # Create shadow and reflection
+            shadowed_car = create_realistic_shadow(
+                foreground_resized, blur_radius=SHADOW_BLUR_RADIUS * render_scale, offset=round(5 * render_scale)
+            )
+            reflection = create_ground_reflection(
+                foreground_resized, 
+                reflection_height_ratio=0.6,  # 70% of car height for reflection
+                fade_factor=0.6,              # Fade factor (higher = faster fade)
+                blur_radius=8 * render_scale,  # Blur amount for reflection
+                opacity=0.8                   # Overall opacity (lower = lighter reflection)
+            )
+            
+            # Shadow and car, with the reflection directly below the car with no gap
+            # Adjust reflection position based on car angle
+            if angle < 70 and angle > 10:
+                reflection_y = paste_y + target_height - round(150 * render_scale)
+            elif angle < 10 or angle > 9:
+                reflection_y = paste_y + target_height - round(390 * render_scale)  # Less overlap for smaller angles
+            elif angle > 70 and angle < 110:
+                reflection_y = paste_y + target_height - round(390 * render_scale)  # More space for larger angles
+            elif angle > 110:
+                reflection_y = paste_y + target_height - round(400 * render_scale)  # More space for larger angles
+            
+            # Composite in one pass, slightly increasing color saturation and contrast
+            final_image = Compositor().render(
+                background,
+                [Layer(shadowed_car, (paste_x, paste_y)), Layer(reflection, (paste_x, reflection_y))],
+                size=foreground.size,
+                color=1.1,
+                contrast=1.05,
+            )
+            
+            with st.container():
+                st.image(final_image, use_container_width=True)
+            
+            # Download section
+            st.markdown("""<div style='height: 10px'></div>""", unsafe_allow_html=True)
+            download_cols = st.columns(2)
+            
+            # Encoded as the preset says; the car keeps its alpha, so no JPEG
+            car_format = preset.output_format if preset.output_format in ALPHA_FORMATS else 'png'
+            final_bytes, final_type = encode_image(final_image, preset.output_format, preset.quality, preset.compress_level)
+            car_bytes, car_type = encode_image(foreground_removed, car_format, preset.quality, preset.compress_level)
+            
+            with download_cols[0]:
+                st.download_button(
+                    label="⬇️ Final Image",
+                    data=final_bytes,
+                    file_name=f"final_image.{final_type.split('/')[1]}",
+                    mime=final_type
+                )
+            
+            with download_cols[1]:
+                st.download_button(
+                    label="⬇️ Car Only",
+                    data=car_bytes,
+                    file_name=f"car_only.{car_type.split('/')[1]}",
+                    mime=car_type,
+                    key="fg_download"
+                )
+        else:
+            st.info("👆 Upload a background image")
@@ -0,0 +1,264 @@
+"""
+Registered background assets, prepared once per canvas size.
+
+Showroom backgrounds are reused across many requests. A background is
+registered once (its upload is kept on disk under an id derived from its
+content) and requests then refer to it by id. For each canvas size it is
+composited at, the background is decoded, resized and converted to RGBA once
+(see compositor.prepare_background); the buffer is saved as a .npy file and
+kept in a size-bounded LRU. Buffers are memory-mapped from those files by
+default, so worker processes share one copy in the page cache. A repeated
+(background, size) pair then costs a dictionary lookup, plus a stat of the
+background's metadata to notice that another process deleted it.
+"""
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import ingest
+from cache import HASH_CHUNK_BYTES, content_digest
+from compositor import prepare_background
+
+# Prepared sizes kept on disk per background; the least recently used go first
+MAX_SIZES_PER_BACKGROUND = 8
+
+
+class UnknownBackground(KeyError):
+    """Raised for a background id that is not registered"""
+
+
+class BackgroundStore:
+    """
+    Registered backgrounds and their prepared buffers.
+    Args:
+        directory (str): Holds one subdirectory per background: the upload,
+            its metadata and the prepared buffers.
+        max_bytes (int): Memory budget of the LRU of prepared buffers.
+        max_pixels (int): Largest background accepted at registration.
+        mmap (bool): Memory-map prepared buffers from disk instead of
+            reading them into this process.
+    Buffers are shared between callers and read-only.
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_pixels=64_000_000, mmap=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.mmap = mmap
+        os.makedirs(directory, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # One lock per (id, size) being prepared, so it is only prepared once
+        self._preparing = {}
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _dir(self, background_id):
+        # Ids are hex digests; anything else cannot name a registered background
+        if not background_id.isalnum():
+            raise UnknownBackground(background_id)
+        return os.path.join(self.directory, background_id)
+
+    def register(self, source):
+        """
+        Register a background upload (bytes or file), once per distinct content.
+        Raises ingest.InvalidImage or ingest.ImageTooLarge for bad uploads.
+        Returns:
+            tuple: (info dict, whether it was newly registered)
+        """
+        background_id = content_digest(source)[:32]
+        info = self.info(background_id)
+        if info is not None:
+            return info, False
+
+        # Decoding the whole image validates it and gives its upright size
+        image = ingest.decode_image(source, self.max_pixels)
+        info = {"background_id": background_id, "width": image.width, "height": image.height}
+        del image
+
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.register-')
+        try:
+            with open(os.path.join(staging, 'source'), 'wb') as f:
+                _copy(source, f)
+            with open(os.path.join(staging, 'meta.json'), 'w') as f:
+                json.dump(info, f)
+            os.rename(staging, self._dir(background_id))
+        except OSError:
+            # Registered concurrently by another request or process
+            if self.info(background_id) is None:
+                raise
+            return self.info(background_id), False
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return info, True
+
+    def info(self, background_id):
+        """Id, width and height of a registered background, or None"""
+        try:
+            with open(os.path.join(self._dir(background_id), 'meta.json')) as f:
+                return json.load(f)
+        except (OSError, UnknownBackground):
+            return None
+
+    def delete(self, background_id):
+        """Forget a background and its prepared buffers; False if it was not registered"""
+        if self.info(background_id) is None:
+            return False
+        self._forget(background_id)
+        # Mapped buffers stay readable until released
+        shutil.rmtree(self._dir(background_id), ignore_errors=True)
+        return True
+
+    def buffer(self, background_id, size):
+        """
+        The background prepared for a canvas of size (width, height).
+        Returns:
+            numpy.ndarray: Read-only (height, width, 4) uint8 RGBA, for Compositor.render.
+        Raises UnknownBackground if the id is not registered.
+        """
+        key = (background_id, tuple(size))
+        with self._lock:
+            buffer = self._entries.get(key)
+            if buffer is None:
+                preparing = self._preparing.setdefault(key, threading.Lock())
+        if buffer is not None:
+            # Another process (a job worker or server worker) may have deleted it
+            if not os.path.exists(os.path.join(self._dir(background_id), 'meta.json')):
+                self._forget(background_id)
+                raise UnknownBackground(background_id)
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+            return buffer
+
+        with preparing:
+            with self._lock:
+                buffer = self._entries.get(key)
+            if buffer is None:
+                buffer = self._load(key)
+                if buffer is None:
+                    buffer = self._prepare(key)
+                self._insert(key, buffer)
+        with self._lock:
+            self._preparing.pop(key, None)
+        return buffer
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current memory usage"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _forget(self, background_id):
+        """Drop a background's buffers from memory"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == background_id]:
+                self._bytes -= self._entries.pop(key).nbytes
+
+    def _path(self, key):
+        background_id, (width, height) = key
+        return os.path.join(self._dir(background_id), f"{width}x{height}.rgba.npy")
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            buffer = np.load(path, mmap_mode='r' if self.mmap else None)
+        except (OSError, ValueError):
+            return None
+        # Marks it as recently used when pruning sizes
+        os.utime(path)
+        with self._lock:
+            self.disk_hits += 1
+        return buffer
+
+    def _prepare(self, key):
+        background_id, size = key
+        source = os.path.join(self._dir(background_id), 'source')
+        try:
+            f = open(source, 'rb')
+        except FileNotFoundError:
+            raise UnknownBackground(background_id)
+        with f:
+            # JPEGs are decoded at a reduced scale when larger than the canvas
+            image = ingest.decode_image(f, self.max_pixels, size)
+        buffer = prepare_background(image, size)
+        del image
+        with self._lock:
+            self.misses += 1
+
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                np.save(f, buffer)
+            os.replace(tmp_path, path)
+        except OSError:
+            # Deleted meanwhile; the buffer is still good for this request
+            return _read_only(buffer)
+        self._prune_sizes(background_id)
+        if self.mmap:
+            # Drop the private copy in favour of the shared mapping
+            return np.load(path, mmap_mode='r')
+        return _read_only(buffer)
+
+    def _prune_sizes(self, background_id):
+        paths = glob.glob(os.path.join(self._dir(background_id), '*.rgba.npy'))
+        if len(paths) <= MAX_SIZES_PER_BACKGROUND:
+            return
+        paths.sort(key=_mtime)
+        for path in paths[:len(paths) - MAX_SIZES_PER_BACKGROUND]:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _insert(self, key, buffer):
+        if buffer.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = buffer
+            self._bytes += buffer.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                self.evictions += 1
+
+
+def _copy(source, f):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        f.write(source)
+        return
+    source.seek(0)
+    for chunk in iter(lambda: source.read(HASH_CHUNK_BYTES), b''):
+        f.write(chunk)
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _read_only(buffer):
+    buffer.flags.writeable = False
+    return buffer
@@ -0,0 +1,129 @@
+"""
+Dynamic micro-batching for background removal.
+
+Concurrent requests submit single images; the batcher collects them for up to
+``max_wait`` seconds or until ``max_batch_size`` images are waiting, runs one
+batched call, and hands each caller its own result. It also owns admission
+control for matting: it counts images (not batches) that are waiting or
+running and raises StageBusy once ``max_pending`` is reached.
+"""
+import asyncio
+import logging
+import math
+import time
+
+from pipeline import StageBusy
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Collect concurrent items into batches for a batched coroutine.
+    Args:
+        name (str): Name reported in errors and stats.
+        run_batch (coroutine function): Called with a list of items, must
+            return a list of results in the same order.
+        max_batch_size (int): Largest batch to form.
+        max_wait (float): Seconds to wait for a batch to fill once the first
+            item has arrived.
+        max_pending (int): Maximum number of items waiting or running, or None
+            for no limit.
+        workers (int): Number of batches that can run at once, used for the
+            Retry-After estimate.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size=4, max_wait=0.01, max_pending=None, workers=1):
+        self.name = name
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_pending = max_pending
+        self.workers = workers
+        self._waiting = []
+        self._timer = None
+        # Running batches: the event loop only keeps weak references to tasks
+        self._tasks = set()
+        self.pending = 0
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+        self.total_batch_seconds = 0.0
+
+    def full(self):
+        return self.max_pending is not None and self.pending >= self.max_pending
+
+    def retry_after(self):
+        """Estimate in seconds until a newly queued item would start"""
+        average = self.total_batch_seconds / self.batches if self.batches else 1.0
+        queued_batches = math.ceil(self.pending / self.max_batch_size)
+        return max(1, math.ceil(average * queued_batches / self.workers))
+
+    def check_capacity(self):
+        if self.full():
+            self.rejected += 1
+            raise StageBusy(self.name, self.retry_after())
+
+    async def submit(self, item):
+        """Queue one item and wait for its result"""
+        self.check_capacity()
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.append((item, future))
+        self.pending += 1
+        try:
+            if len(self._waiting) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+            return await future
+        finally:
+            self.pending -= 1
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._waiting = self._waiting[:self.max_batch_size], self._waiting[self.max_batch_size:]
+        if self._waiting:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._finished)
+
+    def _finished(self, task):
+        self._tasks.discard(task)
+        # Errors of run_batch go to the callers; anything else is a bug here
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('%s batch failed', self.name, exc_info=task.exception())
+
+    async def _run(self, batch):
+        start = time.perf_counter()
+        try:
+            results = await self.run_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.batches += 1
+        self.items += len(batch)
+        self.total_batch_seconds += time.perf_counter() - start
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self):
+        batches = self.batches or 1
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(1000 * self.max_wait, 2),
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "waiting": len(self._waiting),
+            "batches": self.batches,
+            "items": self.items,
+            "rejected": self.rejected,
+            "avg_batch_size": round(self.items / batches, 2),
+            "avg_batch_ms": round(1000 * self.total_batch_seconds / batches, 2),
+        }
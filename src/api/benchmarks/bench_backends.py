@@ -0,0 +1,141 @@
+"""
+Background removal backends: eager PyTorch against ONNX Runtime, fp32 and int8.
+
+Runs every backend's remover for one mode on the same car images and reports
+the median latency of one image, the throughput of --batch images in one call,
+and the IoU of each backend's matte with the eager Remover's (alpha above
+127 counted as car). Exits with an error if a backend's lowest IoU is below
+--min-iou, so it doubles as the parity check before switching
+MATTING_BACKEND. Needs the real model (transparent-background with torch)
+and onnxruntime; graphs are exported to ONNX_MODEL_DIR on first use. Use
+--images with real car photos for a meaningful IoU; the default synthetic
+cars only exercise the code path. It first checks that the backends do not
+share matte cache entries, which --keys-only runs alone, without the model.
+
+Usage:
+    python benchmarks/bench_backends.py [--mode base] [--images car.jpg ...] [--threads 4] [--batch 4] [--min-iou 0.95]
+    python benchmarks/bench_backends.py --keys-only
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+import matting  # noqa: E402
+import onnx_backend  # noqa: E402
+from benchmarks.fixtures import car_scene  # noqa: E402
+from cache import MatteCache  # noqa: E402
+from onnx_backend import OnnxRemover, matte_iou  # noqa: E402
+
+THRESHOLD = 0.75
+
+
+def load_images(paths, sizes):
+    if paths:
+        return [np.asarray(Image.open(path).convert('RGB')) for path in paths]
+    return [car_scene(*size, seed=seed)[0] for seed, size in enumerate(sizes)]
+
+
+def check_cache_keys(mode):
+    """Failure messages if a matte cached with one backend would be served to another"""
+    content = b'car photo'
+    backend, quantize = matting.MATTING_BACKEND, onnx_backend.ONNX_QUANTIZE
+    keys = {}
+    try:
+        for name, (matting.MATTING_BACKEND, onnx_backend.ONNX_QUANTIZE) in (
+            ('eager', ('eager', False)), ('onnx', ('onnx', False)), ('onnx-int8', ('onnx', True)),
+        ):
+            keys[name] = MatteCache.key(content, THRESHOLD, mode, matting.backend_key())
+    finally:
+        matting.MATTING_BACKEND, onnx_backend.ONNX_QUANTIZE = backend, quantize
+
+    failures = []
+    with tempfile.TemporaryDirectory() as directory:
+        # A disk tier outlives the process, and so a switch of backend
+        stored = MatteCache(max_bytes=0, disk_dir=directory)
+        blurred = Image.new('RGB', (8, 8))
+        stored.put(keys['eager'], blurred, Image.new('RGBA', (8, 8)))
+        reopened = MatteCache(max_bytes=0, disk_dir=directory)
+        for name, key in keys.items():
+            if name != 'eager' and reopened.get(key) is not None:
+                failures.append(f"{name}: served the eager backend's cached matte")
+        if reopened.get(keys['eager']) is None:
+            failures.append("eager: cached matte not found again")
+    return failures
+
+
+def backends(mode, threads):
+    """name -> remover, eager first"""
+    import torch
+    from transparent_background import Remover
+
+    torch.set_num_threads(threads)
+    return {
+        'eager': Remover(mode=mode, jit=False, device='cpu'),
+        'onnx': OnnxRemover(mode, quantize=False, threads=threads),
+        'onnx-int8': OnnxRemover(mode, quantize=True, threads=threads),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--mode', default='base')
+    parser.add_argument('--images', nargs='*', help='car photos (default: synthetic cars)')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help='intra-op threads')
+    parser.add_argument('--batch', type=int, default=4, help='images per call when measuring throughput')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-iou', type=float, default=0.95)
+    parser.add_argument('--keys-only', action='store_true', help='only check the matte cache keys (no model needed)')
+    args = parser.parse_args()
+
+    failures = check_cache_keys(args.mode)
+    print(f"matte cache keys per backend: {'FAIL' if failures else 'ok'}")
+    if args.keys_only or failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1 if failures else 0)
+
+    images = load_images(args.images, [(1600, 1200), (1200, 900), (2000, 1500)])
+    removers = backends(args.mode, args.threads)
+    eager_mattes = [removers['eager'].process(image, threshold=THRESHOLD) for image in images]
+
+    print(f"{'backend':<10} {'ms/image':>9} {'images/s':>9} {'min IoU':>8} {'mean IoU':>9}")
+    for name, remover in removers.items():
+        mattes = [remover.process(image, threshold=THRESHOLD) for image in images]
+        ious = [matte_iou(matte, eager) for matte, eager in zip(mattes, eager_mattes)]
+
+        latencies = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            remover.process(images[0], threshold=THRESHOLD)
+            latencies.append(time.perf_counter() - start)
+
+        batch = [images[i % len(images)] for i in range(args.batch)]
+        start = time.perf_counter()
+        if hasattr(remover, 'process_batch'):
+            remover.process_batch(batch, threshold=THRESHOLD)
+        else:
+            for image in batch:
+                remover.process(image, threshold=THRESHOLD)
+        throughput = len(batch) / (time.perf_counter() - start)
+
+        print(f"{name:<10} {1000 * statistics.median(latencies):>9.1f} {throughput:>9.2f} "
+              f"{min(ious):>8.4f} {statistics.mean(ious):>9.4f}")
+        if min(ious) < args.min_iou:
+            failures.append(f"{name}: IoU {min(ious):.4f} with eager is below {args.min_iou}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
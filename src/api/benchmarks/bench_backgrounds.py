@@ -0,0 +1,62 @@
+"""
+Per-request background cost: uploaded vs registered backgrounds.
+
+An uploaded background is decoded (at a reduced scale where possible) and
+resized while it is composited, on every request. A registered background is
+prepared once per canvas size ("cold") and then looked up ("warm"). Each
+method renders the background alone, so the times are the background's share
+of a request.
+
+Usage:
+    python benchmarks/bench_backgrounds.py [--background 24] [--sizes 2 12] [--repeat 5]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backgrounds import BackgroundStore  # noqa: E402
+from benchmarks.fixtures import background_scene, best_time, dimensions  # noqa: E402
+from compositor import Compositor  # noqa: E402
+from ingest import decode_image  # noqa: E402
+
+MAX_PIXELS = 10 ** 9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--background', type=float, default=24, help='background megapixels')
+    parser.add_argument('--sizes', type=float, nargs='+', default=[2, 12], help='canvas megapixels')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    buffered = io.BytesIO()
+    background_scene(*dimensions(args.background), seed=0).save(buffered, format='JPEG', quality=90)
+    content = buffered.getvalue()
+    compositor = Compositor()
+
+    print(f"{'canvas':>7} {'method':<16} {'ms':>8} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        store = BackgroundStore(directory, max_pixels=MAX_PIXELS)
+        background_id = store.register(content)[0]['background_id']
+        for megapixels in args.sizes:
+            size = dimensions(megapixels)
+
+            def upload():
+                compositor.render(decode_image(content, MAX_PIXELS, size), size=size)
+
+            def registered():
+                compositor.render(store.buffer(background_id, size), size=size)
+
+            uploaded, _ = best_time(upload, args.repeat)
+            cold, _ = best_time(registered, 1)
+            warm, _ = best_time(registered, args.repeat)
+            for name, seconds in (('upload', uploaded), ('registered cold', cold), ('registered warm', warm)):
+                print(f"{megapixels:>6}M {name:<16} {1000 * seconds:>8.1f} {uploaded / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Load benchmark for micro-batched background removal.
+
+Drives a MicroBatcher with a fixed number of concurrent clients, each sending
+requests back to back, and reports throughput and p50/p99 latency for every
+(max batch size, max wait) combination.
+
+By default the real Remover runs in-process (needs transparent_background and
+torch). Pass --simulate FIXED_MS,PER_ITEM_MS to replace the model with a sleep
+of FIXED_MS + PER_ITEM_MS * batch size, which is useful to explore the
+trade-off without a model.
+
+With the real Remover, it first checks that one batched forward pass
+(matting.process_batch) gives the same mattes as Remover.process on each
+image alone, and exits with an error below --min-iou or if process_batch
+fell back to process() because the Remover's internals changed.
+--check-only runs only that check.
+
+Usage:
+    python benchmarks/bench_batching.py --clients 8 --requests 64 \
+        --configs 1:0 2:10 4:10 4:25 8:25 [--size 1024x768] [--simulate 400,60]
+    python benchmarks/bench_batching.py --check-only [--mode fast]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matting  # noqa: E402
+from batching import MicroBatcher  # noqa: E402
+from benchmarks.fixtures import car_scene  # noqa: E402
+from onnx_backend import matte_iou  # noqa: E402
+
+
+def percentile(values, q):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * len(values)) - 1))
+    return values[index]
+
+
+def check_batched_forward(mode, threshold, min_iou):
+    """Failure messages if a batched forward pass differs from Remover.process on the same images"""
+    remover = matting.get_remover(mode)
+    if not matting._can_forward_batch(remover):
+        return [f"{type(remover).__name__} lacks the internals of a batched forward pass"]
+    # Different sizes, as batches of concurrent requests have
+    images = [car_scene(*size, seed=seed)[0] for seed, size in enumerate(((1024, 768), (800, 600), (1280, 720)))]
+    batched = matting._forward_batch(remover, images, threshold)
+    if batched is None:
+        return ["the batched forward pass fell back to process()"]
+    failures = []
+    for index, (image, result) in enumerate(zip(images, batched)):
+        alone = remover.process(image, threshold=threshold)
+        iou = matte_iou(result, alone)
+        differing = np.mean(result[..., 3] != alone[..., 3])
+        print(f"image {index}: IoU {iou:.4f}, {100 * differing:.3f}% of alpha values differ")
+        if iou < min_iou or not np.array_equal(result[..., :3], alone[..., :3]):
+            failures.append(f"image {index}: IoU {iou:.4f} with process() is below {min_iou}")
+    return failures
+
+
+def make_model(simulate, threshold, mode='base'):
+    if simulate:
+        fixed_ms, per_item_ms = (float(v) for v in simulate.split(','))
+
+        def run(img_arrays):
+            time.sleep((fixed_ms + per_item_ms * len(img_arrays)) / 1000)
+            return [a for a in img_arrays]
+        return run
+
+    def run(img_arrays):
+        return matting.process_batch(img_arrays, threshold, mode)
+    return run
+
+
+async def run_config(model, image, clients, requests, max_batch_size, max_wait_ms):
+    executor = ThreadPoolExecutor(max_workers=1)
+    loop = asyncio.get_running_loop()
+
+    async def run_batch(items):
+        return await loop.run_in_executor(executor, model, items)
+
+    batcher = MicroBatcher('matting', run_batch, max_batch_size=max_batch_size, max_wait=max_wait_ms / 1000)
+    latencies = []
+    remaining = [requests]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            start = time.perf_counter()
+            await batcher.submit(image)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    executor.shutdown()
+    return elapsed, latencies, batcher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64)
+    parser.add_argument('--configs', nargs='+', default=['1:0', '2:10', '4:10', '4:25', '8:25'],
+                        help='max_batch_size:max_wait_ms pairs')
+    parser.add_argument('--size', default='1024x768', help='input WIDTHxHEIGHT')
+    parser.add_argument('--threshold', type=float, default=0.75)
+    parser.add_argument('--simulate', help='FIXED_MS,PER_ITEM_MS instead of the real model')
+    parser.add_argument('--mode', default='base', help='Remover mode')
+    parser.add_argument('--min-iou', type=float, default=0.999, help='of batched mattes with process()')
+    parser.add_argument('--check-only', action='store_true', help='only compare batched and single mattes')
+    args = parser.parse_args()
+
+    if not args.simulate:
+        failures = check_batched_forward(args.mode, args.threshold, args.min_iou)
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            sys.exit(1)
+        if args.check_only:
+            return
+
+    width, height = (int(v) for v in args.size.split('x'))
+    image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    model = make_model(args.simulate, args.threshold, args.mode)
+    # Load the model (and warm it up) outside of the measurements
+    model([image])
+
+    print(f"{'batch':>5} {'wait ms':>8} {'img/s':>7} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+    for config in args.configs:
+        max_batch_size, max_wait_ms = config.split(':')
+        elapsed, latencies, stats = asyncio.run(run_config(
+            model, image, args.clients, args.requests, int(max_batch_size), float(max_wait_ms),
+        ))
+        latencies_ms = [1000 * v for v in latencies]
+        print(f"{max_batch_size:>5} {max_wait_ms:>8} {len(latencies) / elapsed:>7.2f} "
+              f"{statistics.median(latencies_ms):>8.1f} {percentile(latencies_ms, 99):>8.1f} "
+              f"{stats['avg_batch_size']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Final-composite benchmark: Compositor.render vs the chain of PIL calls.
+
+The PIL chain is what the Streamlit app did: convert and resize the background,
+paste the shadowed car and the reflection, then ImageEnhance.Color and
+ImageEnhance.Contrast, each a full-canvas pass. Both render the same layers on
+synthetic fixtures; the table shows the fastest time of each and the largest
+color difference from the PIL chain (8-bit math should be 0).
+
+Usage:
+    python benchmarks/bench_compositor.py [--sizes 2 12 24] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+from PIL import Image, ImageEnhance
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import background_scene, best_time, car_cutout, dimensions  # noqa: E402
+from compositor import Compositor, Layer  # noqa: E402
+from image import create_ground_reflection, create_realistic_shadow  # noqa: E402
+
+COLOR = 1.1
+CONTRAST = 1.05
+
+
+def make_layers(width, height):
+    # A smaller background, so both paths resize it
+    background = background_scene(width * 3 // 4, height * 3 // 4, seed=0)
+    car = car_cutout(width * 2 // 3, height // 2, seed=1)
+    layers = [
+        Layer(create_realistic_shadow(car), (width // 6, height // 3)),
+        Layer(create_ground_reflection(car, 0.6, 0.6, 8, 0.8), (width // 6, height * 3 // 4)),
+    ]
+    return background, layers
+
+
+def pil_chain(background, layers, size):
+    final = background.convert('RGBA').resize(size, Image.Resampling.LANCZOS)
+    for layer in layers:
+        final.paste(layer.image, layer.position, layer.image)
+    final = ImageEnhance.Color(final).enhance(COLOR)
+    return ImageEnhance.Contrast(final).enhance(CONTRAST)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[2, 12, 24], help='canvas megapixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    methods = {
+        'pil': pil_chain,
+        'uint8': lambda *a: Compositor('uint8').render(*a, color=COLOR, contrast=CONTRAST),
+        'float32': lambda *a: Compositor('float32').render(*a, color=COLOR, contrast=CONTRAST),
+    }
+    print(f"{'size':>6} {'method':<8} {'ms':>9} {'speedup':>8} {'max diff':>9}")
+    for megapixels in args.sizes:
+        size = dimensions(megapixels)
+        background, layers = make_layers(*size)
+        reference = None
+        for name, method in methods.items():
+            seconds, result = best_time(lambda: method(background, layers, size), args.repeat)
+            pixels = np.asarray(result, dtype=np.int16)[..., :3]
+            if reference is None:
+                reference, reference_seconds = pixels, seconds
+            diff = int(np.abs(pixels - reference).max())
+            print(f"{megapixels:>5}M {name:<8} {1000 * seconds:>9.1f} {reference_seconds / seconds:>7.2f}x {diff:>9}")
+            del result, pixels
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Upload decode benchmark: full-resolution vs reduced (draft mode) JPEG decoding.
+
+Encodes synthetic backgrounds as JPEG and decodes them with ingest.decode_image,
+first without a target size, then for composites 1/2, 1/4 and 1/8 of the
+image's width and height. Reports the fastest decode time and the decoded
+image's size, which is what the server holds in memory until compositing.
+
+Usage:
+    python benchmarks/bench_decode.py [--sizes 12 24 48] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import background_scene, best_time, dimensions  # noqa: E402
+from ingest import decode_image  # noqa: E402
+
+FACTORS = (1, 2, 4, 8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[12, 24, 48], help='megapixels')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size':>6} {'target':>11} {'decoded':>11} {'ms':>8} {'MB':>7} {'speedup':>8}")
+    for megapixels in args.sizes:
+        width, height = dimensions(megapixels)
+        buffered = io.BytesIO()
+        background_scene(width, height, seed=0).save(buffered, format='JPEG', quality=90)
+        content = buffered.getvalue()
+        full = None
+        for factor in FACTORS:
+            target = None if factor == 1 else (width // factor, height // factor)
+            seconds, image = best_time(lambda: decode_image(content, 10 ** 9, target), args.repeat)
+            full = full or seconds
+            label = 'full' if target is None else f"{target[0]}x{target[1]}"
+            nbytes = image.width * image.height * len(image.getbands())
+            print(f"{megapixels:>5}M {label:>11} {f'{image.width}x{image.height}':>11} {1000 * seconds:>8.1f} "
+                  f"{nbytes / 2 ** 20:>7.1f} {full / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Response encoding benchmark.
+
+Encodes a synthetic car cut-out and composite the way /api/process-images
+does in each response mode and output format, and reports encode time,
+response bytes and peak Python heap allocations (tracemalloc).
+
+Usage:
+    python benchmarks/bench_encoding.py [--size 4000x3000]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoding import encode_base64, encode_image, multipart_end, multipart_json_part, multipart_part  # noqa: E402
+
+CASES = [
+    ('json', 'png', {}),
+    ('multipart', 'png', {}),
+    ('multipart', 'png', {'compress_level': 1}),
+    ('multipart', 'webp', {'quality': 90}),
+    ('multipart', 'jpeg', {'quality': 90}),
+]
+
+
+def make_images(width, height):
+    """A smooth RGBA car-like cut-out and an opaque composite of the same size"""
+    yy, xx = np.mgrid[:height, :width]
+    rgb = np.stack([xx * 255 // width, yy * 255 // height, (xx + yy) * 127 // (width + height)], axis=-1)
+    inside = ((xx - width / 2) / (width * 0.4)) ** 2 + ((yy - height / 2) / (height * 0.3)) ** 2 < 1
+    car = np.dstack([rgb, np.where(inside, 255, 0)]).astype(np.uint8)
+    final = np.dstack([rgb[..., ::-1], np.full((height, width), 255)]).astype(np.uint8)
+    return Image.fromarray(car, 'RGBA'), Image.fromarray(final, 'RGBA')
+
+
+def json_body(car, final, output_format, options):
+    """Build the whole JSON response and return its size in bytes"""
+    car_format = 'png' if output_format == 'jpeg' else output_format
+    response = {
+        "success": True,
+        "car_only": encode_base64(car, car_format, **options),
+        "final_image": encode_base64(final, output_format, **options),
+    }
+    return len(json.dumps(response).encode('utf-8'))
+
+
+def multipart_body(car, final, output_format, options):
+    """Produce the multipart stream chunk by chunk, as the server sends it, and return its size"""
+    car_format = 'png' if output_format == 'jpeg' else output_format
+    total = 0
+    for chunk in multipart_json_part('b', {"success": True}):
+        total += len(chunk)
+    for name, image, fmt in (('car_only', car, car_format), ('final_image', final, output_format)):
+        content, media_type = encode_image(image, fmt, **options)
+        for chunk in multipart_part('b', content, media_type, name):
+            total += len(chunk)
+        del content
+    total += len(multipart_end('b'))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', default='4000x3000', help='WIDTHxHEIGHT')
+    args = parser.parse_args()
+    width, height = (int(v) for v in args.size.split('x'))
+    car, final = make_images(width, height)
+
+    print(f"{'mode':<10} {'format':<6} {'options':<20} {'seconds':>8} {'bytes':>12} {'peak MB':>8}")
+    for mode, output_format, options in CASES:
+        tracemalloc.start()
+        start = time.perf_counter()
+        body = json_body if mode == 'json' else multipart_body
+        size = body(car, final, output_format, options)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{mode:<10} {output_format:<6} {json.dumps(options):<20} {elapsed:>8.2f} {size:>12} {peak / 2**20:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+Matting worker handoff: pickled arrays vs shared-memory frames.
+
+Sends RGB images to a spawned worker process and gets RGBA results back, the
+way the server's matting stage does. The worker runs a pass-through remover
+that only adds an alpha channel, so the times are the cost of getting pixels
+to and from the worker. "pickled" is matting.process_batch on arrays, as
+with MATTING_SHARED_MEMORY=0. "frames" is matting.process_frames on frames
+from a FramePool, including copying the image in and viewing the result as a
+PIL image.
+
+Usage:
+    python benchmarks/bench_frames.py [--sizes 2 12 24] [--repeat 5]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import matting  # noqa: E402
+from benchmarks.fixtures import best_time, dimensions  # noqa: E402
+from frames import FramePool  # noqa: E402
+
+
+class PassthroughRemover:
+    """Adds an opaque alpha channel: no model, only the data movement"""
+
+    def __init__(self, mode='base', **kwargs):
+        self.mode = mode
+
+    def process(self, img, type='rgba', threshold=None):
+        return np.dstack([img, np.full(img.shape[:2], 255, dtype=np.uint8)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[2, 12, 24], help='image megapixels')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn'))
+    pool = FramePool()
+    rng = np.random.default_rng(0)
+
+    def pickled(rgb):
+        result = executor.submit(matting.process_batch, [rgb], 0.5).result()[0]
+        return Image.fromarray(result)
+
+    def shared(rgb):
+        frame = pool.acquire(rgb.shape)
+        frame.array[...] = rgb
+        output = pool.acquire(rgb.shape[:2] + (4,))
+        executor.submit(matting.process_frames, [frame], [output], 0.5).result()
+        pool.release(frame)
+        return pool.image(output, 'RGBA')
+
+    print(f"{'size':>6} {'method':<8} {'ms':>8} {'speedup':>8}")
+    try:
+        for megapixels in args.sizes:
+            width, height = dimensions(megapixels)
+            rgb = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+            # Start the worker and check both give the same result
+            assert np.array_equal(np.asarray(pickled(rgb)), np.asarray(shared(rgb)))
+            reference, _ = best_time(lambda: pickled(rgb), args.repeat)
+            for name, method in (('pickled', pickled), ('frames', shared)):
+                seconds = reference if name == 'pickled' else best_time(lambda: method(rgb), args.repeat)[0]
+                print(f"{megapixels:>5}M {name:<8} {1000 * seconds:>8.1f} {reference / seconds:>7.2f}x")
+    finally:
+        executor.shutdown()
+        pool.close()
+
+
+if __name__ == '__main__':
+    # Read by the worker process when it loads its remover
+    os.environ['REMOVER_FACTORY'] = 'benchmarks.bench_frames:PassthroughRemover'
+    main()
@@ -0,0 +1,284 @@
+"""
+Benchmark suite and golden-image regression check for image.py.
+
+Times create_checkerboard, transparency_preview, blur_license_plate,
+create_realistic_shadow, create_ground_reflection, detect_car_angle,
+estimate_car_orientation, resize_and_center, Compositor.render and the whole
+/api/process-images request on synthetic car fixtures at several resolutions.
+The request runs with the deterministic stub remover (benchmarks/stub_remover.py)
+and without the matte cache, so the suite needs no model, GPU or network.
+
+Timings are compared with benchmarks/baselines.json; a case fails when it is
+more than --max-slowdown times (plus --slack-ms) slower than its baseline.
+Outputs at GOLDEN_SIZE are compared with benchmarks/golden/; an image fails
+below --min-psnr dB or above --max-diff levels, other values must match
+exactly. Baselines are machine-specific: refresh them on the reference machine
+with --update-baselines. Refresh goldens with --update-golden only after an
+intended output change.
+
+Usage:
+    python benchmarks/bench_image.py [--sizes 0.5 2 12] [--cases shadow reflection] [--repeat 5]
+    python benchmarks/bench_image.py --sizes 0.5 2 12 24 50 --update-baselines
+    python benchmarks/bench_image.py --golden-only [--update-golden]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, API_DIR)
+
+from benchmarks.fixtures import background_scene, best_time, car_cutout, car_scene, dimensions  # noqa: E402
+from compositor import Compositor, Layer  # noqa: E402
+from image import (  # noqa: E402
+    blur_license_plate,
+    create_checkerboard,
+    create_ground_reflection,
+    create_realistic_shadow,
+    detect_car_angle,
+    estimate_car_orientation,
+    resize_and_center,
+    transparency_preview,
+)
+
+BASELINES_PATH = os.path.join(BENCH_DIR, 'baselines.json')
+GOLDEN_DIR = os.path.join(BENCH_DIR, 'golden')
+GOLDEN_SIZE = (1024, 768)
+
+
+def png_bytes(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format='PNG', compress_level=1)
+    return buffered.getvalue()
+
+
+def decode_data_uri(uri):
+    return Image.open(io.BytesIO(base64.b64decode(uri.split(',', 1)[1])))
+
+
+# Each case takes (width, height), builds its inputs and returns a function
+# running the code under test, which returns {output name: image or value}
+
+
+def checkerboard_case(width, height):
+    return lambda: {'image': create_checkerboard((width, height))}
+
+
+def preview_case(width, height):
+    car = car_cutout(width, height, seed=1)
+    return lambda: {'image': transparency_preview(car)}
+
+
+def plate_blur_case(width, height):
+    scene = Image.fromarray(car_scene(width, height, seed=1)[0])
+    return lambda: {'image': blur_license_plate(scene)}
+
+
+def shadow_case(width, height):
+    car = car_cutout(width, height, seed=2)
+    return lambda: {'image': create_realistic_shadow(car)}
+
+
+def reflection_case(width, height):
+    car = car_cutout(width, height, seed=2)
+    return lambda: {'image': create_ground_reflection(car, 0.6, 0.6, 8, 0.35)}
+
+
+def angle_case(width, height):
+    car = car_cutout(width, height, seed=3)
+
+    def run():
+        angle, orientation = detect_car_angle(car)
+        return {'angle': float(angle), 'orientation': orientation}
+    return run
+
+
+def orientation_case(width, height):
+    car = car_cutout(width, height, seed=3)
+
+    def run():
+        angle, orientation, confidence = estimate_car_orientation(car)
+        return {'angle': float(angle), 'orientation': orientation, 'confidence': confidence}
+    return run
+
+
+def resize_and_center_case(width, height):
+    car = car_cutout(width // 2, height * 2 // 3, seed=4)
+    return lambda: {'image': resize_and_center(car, (width, height))}
+
+
+def compositor_case(width, height):
+    # A smaller background, so it is resized while compositing
+    background = background_scene(width * 3 // 4, height * 3 // 4, seed=5)
+    car = car_cutout(width * 2 // 3, height // 2, seed=5)
+    layers = [
+        Layer(create_realistic_shadow(car), (width // 6, height // 3)),
+        Layer(create_ground_reflection(car, 0.6, 0.6, 8, 0.35), (width // 6, height * 3 // 4)),
+    ]
+    return lambda: {'image': Compositor().render(background, layers, (width, height), color=1.1, contrast=1.05)}
+
+
+def process_images_case(width, height):
+    from fastapi.testclient import TestClient
+    import server
+
+    client = _client(TestClient, server)
+    files = {
+        'foreground': ('car.png', png_bytes(Image.fromarray(car_scene(width, height, seed=0)[0]))),
+        'background': ('background.png', png_bytes(background_scene(width, height, seed=0))),
+    }
+
+    def run():
+        response = client.post('/api/process-images', files=files)
+        response.raise_for_status()
+        body = response.json()
+        return {
+            'car_only': decode_data_uri(body['car_only']),
+            'final_image': decode_data_uri(body['final_image']),
+            'angle': float(body['car_angle']),
+            'orientation': body['car_orientation'],
+            'confidence': body['car_orientation_confidence'],
+        }
+    return run
+
+
+_clients = {}
+
+
+def _client(TestClient, server):
+    """One client for all sizes, so the matting workers start only once"""
+    if 'client' not in _clients:
+        _clients['client'] = TestClient(server.app).__enter__()
+    return _clients['client']
+
+
+CASES = {
+    'checkerboard': checkerboard_case,
+    'transparency_preview': preview_case,
+    'plate_blur': plate_blur_case,
+    'shadow': shadow_case,
+    'reflection': reflection_case,
+    'angle': angle_case,
+    'orientation': orientation_case,
+    'resize_and_center': resize_and_center_case,
+    'compositor': compositor_case,
+    'process_images': process_images_case,
+}
+
+
+def compare_images(actual, expected):
+    """PSNR in dB (inf when identical) and max absolute difference of two images"""
+    a = np.asarray(actual.convert('RGBA'), dtype=np.int16)
+    b = np.asarray(expected.convert('RGBA'), dtype=np.int16)
+    if a.shape != b.shape:
+        return 0.0, 255
+    diff = np.abs(a - b)
+    mse = np.mean(diff.astype(np.float64) ** 2)
+    psnr = float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+    return psnr, int(diff.max())
+
+
+def check_golden(case, outputs, values, args):
+    """Compare one case's outputs with the goldens (or replace them); returns failure messages"""
+    failures = []
+    for name, output in outputs.items():
+        key = f"{case}.{name}"
+        if not isinstance(output, Image.Image):
+            if args.update_golden:
+                values[key] = output
+            elif values.get(key) != output:
+                failures.append(f"{key}: {output!r} != golden {values.get(key)!r}")
+            continue
+        path = os.path.join(GOLDEN_DIR, f"{case}-{name}.png")
+        if args.update_golden:
+            output.save(path)
+            continue
+        if not os.path.exists(path):
+            failures.append(f"{key}: no golden image {os.path.relpath(path, API_DIR)}")
+            continue
+        psnr, max_diff = compare_images(output, Image.open(path))
+        print(f"  golden {key:<28} psnr {psnr:>6.1f} dB  max diff {max_diff}")
+        if psnr < args.min_psnr or max_diff > args.max_diff:
+            failures.append(f"{key}: psnr {psnr:.1f} dB, max diff {max_diff}")
+    return failures
+
+
+def load_json(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.5, 2, 12], help='megapixels')
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-slowdown', type=float, default=2.0)
+    parser.add_argument('--slack-ms', type=float, default=5, help='absolute slowdown always tolerated')
+    parser.add_argument('--min-psnr', type=float, default=45)
+    parser.add_argument('--max-diff', type=int, default=4)
+    parser.add_argument('--golden-only', action='store_true', help='skip the timings')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--update-golden', action='store_true')
+    args = parser.parse_args()
+
+    baselines = load_json(BASELINES_PATH)
+    values_path = os.path.join(GOLDEN_DIR, 'values.json')
+    values = load_json(values_path)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    failures = []
+
+    print("golden images")
+    for case in args.cases:
+        _, outputs = best_time(CASES[case](*GOLDEN_SIZE), 1)
+        failures += check_golden(case, outputs, values, args)
+    if args.update_golden:
+        save_json(values_path, values)
+
+    if not args.golden_only:
+        print(f"{'case':<20} {'size':>7} {'ms':>9} {'baseline':>9} {'ratio':>6}")
+        for megapixels in args.sizes:
+            width, height = dimensions(megapixels)
+            for case in args.cases:
+                seconds, _ = best_time(CASES[case](width, height), args.repeat)
+                key = f"{case}@{megapixels}MP"
+                baseline = baselines.get(key)
+                ratio = f"{seconds / baseline:>6.2f}" if baseline else f"{'new':>6}"
+                print(f"{case:<20} {megapixels:>6}M {1000 * seconds:>9.1f} "
+                      f"{1000 * baseline if baseline else 0:>9.1f} {ratio}")
+                if args.update_baselines:
+                    baselines[key] = round(seconds, 4)
+                elif baseline and seconds > baseline * args.max_slowdown + args.slack_ms / 1000:
+                    failures.append(f"{key}: {1000 * seconds:.1f} ms, baseline {1000 * baseline:.1f} ms")
+        if args.update_baselines:
+            save_json(BASELINES_PATH, baselines)
+
+    for client in _clients.values():
+        client.__exit__(None, None, None)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    # Set up before the server module is imported: a stub model in every
+    # matting worker and no matte cache, so each request does the full work
+    os.environ.setdefault('REMOVER_FACTORY', 'benchmarks.stub_remover:StubRemover')
+    os.environ.setdefault('MATTE_CACHE_BYTES', '0')
+    main()
@@ -0,0 +1,68 @@
+"""
+Import-time benchmark for the API worker.
+
+Each scenario is imported in a fresh interpreter, the way a uvicorn worker
+starts, and the wall time and number of loaded modules are reported. The
+"legacy" scenario imports what `from image import ...` used to pull in before
+the Streamlit UI moved to app.py (streamlit, requests, transparent_background).
+
+Usage:
+    python benchmarks/bench_import.py [--repeat 5]
+"""
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+SCENARIOS = {
+    'image': ['image'],
+    'server': ['server'],
+    'legacy image': ['image', 'streamlit', 'requests', 'transparent_background'],
+}
+
+PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "modules": len(sys.modules)}}))
+'''
+
+
+def measure(modules, repeat):
+    """Import modules in `repeat` fresh interpreters and return the samples"""
+    samples = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(modules=modules)],
+            cwd=API_DIR, capture_output=True, text=True, check=True,
+        )
+        samples.append(json.loads(out.stdout))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<14} {'median ms':>10} {'min ms':>8} {'modules':>8}")
+    for name, modules in SCENARIOS.items():
+        missing = [m for m in modules if importlib.util.find_spec(m) is None]
+        if missing:
+            print(f"{name:<14} skipped (not installed: {', '.join(missing)})")
+            continue
+        samples = measure(modules, args.repeat)
+        times = [s['seconds'] * 1000 for s in samples]
+        print(f"{name:<14} {statistics.median(times):>10.1f} {min(times):>8.1f} {samples[0]['modules']:>8}")
+
+
+if __name__ == '__main__':
+    main()
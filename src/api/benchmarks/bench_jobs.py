@@ -0,0 +1,85 @@
+"""
+Job queue throughput: jobs per second against the number of worker processes.
+
+Queues the same synthetic cars and backgrounds for each worker count and
+times how long the workers take to drain the queue, after one warm-up job per
+worker so process start-up and model loading are not counted. Scaling is the
+throughput relative to one worker; with a core per worker it should stay
+close to the worker count.
+
+Usage:
+    python benchmarks/bench_jobs.py [--workers 1 2 4] [--jobs 24] [--size 1600x1200]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import background_scene, car_scene  # noqa: E402
+from jobs import DONE, FAILED, JobStore, JobWorkers  # noqa: E402
+
+OPTIONS = {"output_format": "jpeg", "quality": 90, "compress_level": 6, "preview": False}
+
+
+def png_bytes(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format='PNG', compress_level=1)
+    return buffered.getvalue()
+
+
+def drain(store, inputs):
+    """Queue inputs and wait until every job has finished; returns the seconds taken"""
+    start = time.perf_counter()
+    ids = [store.submit(job_inputs, OPTIONS)[0]['id'] for job_inputs in inputs]
+    while True:
+        statuses = [store.get(job_id)['status'] for job_id in ids]
+        if FAILED in statuses:
+            raise RuntimeError(f"job failed: {store.get(ids[statuses.index(FAILED)])['error']}")
+        if all(status == DONE for status in statuses):
+            return time.perf_counter() - start
+        time.sleep(0.05)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--jobs', type=int, default=24)
+    parser.add_argument('--size', default='1600x1200')
+    args = parser.parse_args()
+    width, height = map(int, args.size.split('x'))
+
+    background = png_bytes(background_scene(width, height, seed=0))
+    inputs = [
+        {"foreground": png_bytes(Image.fromarray(car_scene(width, height, seed=seed)[0])), "background": background}
+        for seed in range(args.jobs + max(args.workers))
+    ]
+    warm_up, inputs = inputs[:max(args.workers)], inputs[max(args.workers):]
+
+    print(f"{'workers':>7} {'jobs':>5} {'seconds':>8} {'jobs/s':>7} {'scaling':>8}")
+    single = None
+    for count in args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            store = JobStore(directory)
+            workers = JobWorkers(store, 'render:run_job', count, 'render:init_worker', (('base',),))
+            workers.ensure_running()
+            try:
+                drain(store, warm_up[:count])
+                seconds = drain(store, inputs)
+            finally:
+                workers.stop()
+        rate = len(inputs) / seconds
+        single = single or rate / count
+        print(f"{count:>7} {len(inputs):>5} {seconds:>8.2f} {rate:>7.2f} {rate / single:>7.2f}x")
+
+
+if __name__ == '__main__':
+    # Set before the workers import the server: a stub model and no matte cache
+    os.environ.setdefault('REMOVER_FACTORY', 'benchmarks.stub_remover:StubRemover')
+    os.environ.setdefault('MATTE_CACHE_BYTES', '0')
+    main()
@@ -0,0 +1,176 @@
+"""
+Peak-memory regression check for compositing and encoding.
+
+Composites a car of fixed footprint onto canvases of increasing size and
+streams the result as a strip-encoded PNG, in a fresh subprocess per run.
+Peak RSS above the inputs is sampled from /proc (Linux). For comparison the
+"full" path resizes, shadows and reflects the whole car image and encodes
+the PNG in one piece, as the server did before region compositing.
+
+"Overhead" is the peak beyond the output canvas itself. The check fails (exit
+status 1) if the region path's overhead exceeds --max-overhead-mb at any size,
+or grows by more than --max-bytes-per-pixel per added canvas pixel between the
+smallest and largest size, i.e. if memory starts scaling with the canvas
+rather than the car. (Finding the car's bounding box reads the alpha channel,
+about one byte per pixel.)
+
+Usage:
+    python benchmarks/bench_memory.py [--sizes 12 24 48] [--car 1600x900] \
+        [--max-overhead-mb 256] [--max-bytes-per-pixel 2]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import io
+import time
+
+from PIL import Image
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PeakSampler(threading.Thread):
+    """Sample RSS in the background and keep the maximum"""
+
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            time.sleep(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def make_inputs(canvas_megapixels, car_size):
+    import numpy as np
+    from PIL import Image
+
+    width = int((canvas_megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    car_w, car_h = car_size
+    # Car image the size of the canvas, opaque only over the car's footprint
+    car = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+    yy, xx = np.mgrid[:car_h, :car_w]
+    body = ((xx - car_w / 2) / (car_w / 2)) ** 2 + ((yy - car_h / 2) / (car_h / 2)) ** 2 < 1
+    pixels = np.dstack([xx * 255 // car_w, yy * 255 // car_h, np.full_like(xx, 128), body * 255]).astype(np.uint8)
+    car.paste(Image.fromarray(pixels, 'RGBA'), ((width - car_w) // 2, height - car_h - height // 10))
+    background = Image.new('RGB', (width, height), (90, 110, 130))
+    return car, background
+
+
+def full_path(car, background):
+    """Composite on the whole car image and encode in one piece (previous behaviour)"""
+    final = background.convert('RGBA').resize(car.size, Image.Resampling.LANCZOS)
+    target_height = int(final.height * 0.95)
+    new_width = int(car.width * target_height / car.height)
+    resized = car.resize((new_width, target_height), Image.Resampling.LANCZOS)
+    shadowed = create_realistic_shadow(resized)
+    reflection = create_ground_reflection(resized, 0.6, 0.6, 8, 0.35)
+    final.paste(shadowed, ((final.width - new_width) // 2, 0), shadowed)
+    final.paste(reflection, ((final.width - new_width) // 2, target_height - 400), reflection)
+    buffered = io.BytesIO()
+    final.save(buffered, format='PNG')
+    return len(buffered.getvalue())
+
+
+def region_path(car, background):
+    """Composite as the server does and stream a strip-encoded PNG"""
+    final = composite_car(car, background)[0]
+    return sum(len(chunk) for chunk in encode_png_strips(final))
+
+
+def child(path, canvas_megapixels, car_size):
+    # Import everything up front so module loading is not measured
+    global composite_car, create_ground_reflection, create_realistic_shadow, encode_png_strips
+    from encoding import encode_png_strips
+    from image import create_ground_reflection, create_realistic_shadow
+    from server import composite_car
+
+    car, background = make_inputs(canvas_megapixels, car_size)
+    start = rss_bytes()
+    sampler = PeakSampler()
+    sampler.start()
+    began = time.perf_counter()
+    encoded = (full_path if path == 'full' else region_path)(car, background)
+    elapsed = time.perf_counter() - began
+    sampler.stop()
+    print(json.dumps({
+        "peak_bytes": sampler.peak - start,
+        "canvas_bytes": car.width * car.height * 4,
+        "encoded_bytes": encoded,
+        "seconds": elapsed,
+    }))
+
+
+def measure(path, canvas_megapixels, car_size):
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', path, str(canvas_megapixels), f"{car_size[0]}x{car_size[1]}"],
+        cwd=API_DIR, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[12, 24, 48], help='canvas megapixels')
+    parser.add_argument('--car', default='1600x900', help='car footprint WIDTHxHEIGHT')
+    parser.add_argument('--max-overhead-mb', type=float, default=256)
+    parser.add_argument('--max-bytes-per-pixel', type=float, default=2)
+    parser.add_argument('--skip-full', action='store_true', help='only measure the region path')
+    parser.add_argument('--child', nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        path, megapixels, car = args.child
+        child(path, float(megapixels), tuple(int(v) for v in car.split('x')))
+        return
+
+    car_size = tuple(int(v) for v in args.car.split('x'))
+    paths = ['region'] if args.skip_full else ['full', 'region']
+    mb = 2 ** 20
+    region = {}
+    print(f"{'canvas':>7} {'path':<7} {'peak MB':>8} {'overhead MB':>12} {'seconds':>8}")
+    for megapixels in sorted(args.sizes):
+        for path in paths:
+            result = measure(path, megapixels, car_size)
+            overhead = result['peak_bytes'] - result['canvas_bytes']
+            print(f"{megapixels:>6}M {path:<7} {result['peak_bytes'] / mb:>8.1f} {overhead / mb:>12.1f} "
+                  f"{result['seconds']:>8.2f}")
+            if path == 'region':
+                region[megapixels] = (result['canvas_bytes'] / 4, overhead)
+
+    failures = []
+    worst = max(overhead for _, overhead in region.values())
+    if worst > args.max_overhead_mb * mb:
+        failures.append(f"overhead {worst / mb:.1f} MB exceeds {args.max_overhead_mb} MB")
+    if len(region) > 1:
+        (small_pixels, small), (large_pixels, large) = region[min(region)], region[max(region)]
+        per_pixel = (large - small) / (large_pixels - small_pixels)
+        print(f"region overhead growth: {per_pixel:.2f} bytes per canvas pixel")
+        if per_pixel > args.max_bytes_per_pixel:
+            failures.append(f"overhead grows {per_pixel:.2f} bytes per pixel, more than {args.max_bytes_per_pixel}")
+    for failure in failures:
+        print(f"FAIL: region path {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Car orientation benchmark: estimate_car_orientation vs detect_car_angle.
+
+Accuracy is measured on synthetic car cut-outs rotated by known angles, both
+side-on and squeezed to a front-like aspect ratio. For each method it reports
+the mean and max angle error against the rotation (in OpenCV's (0, 90]
+minAreaRect convention), how often the orientation is right and how often the
+reflection offset picked from the angle matches the one from the true angle.
+Then both methods are timed on full-size cut-outs.
+
+Usage:
+    python benchmarks/bench_orientation.py [--sizes 12 24 50] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import best_time, car_cutout, dimensions  # noqa: E402
+from image import detect_car_angle, estimate_car_orientation, reflection_offset  # noqa: E402
+
+ROTATIONS = (0, 2, -2, 4, -4, 8, -8, 11, -11, 15, -15, 25, -25, 40)
+SEEDS = range(5)
+
+
+def expected_angle(rotation):
+    """minAreaRect angle of an upright rectangle rotated counter-clockwise by rotation degrees"""
+    angle = -rotation % 90
+    return angle or 90.0
+
+
+def angle_error(a, b):
+    """Difference of two rectangle angles, which repeat every 90 degrees"""
+    d = abs(a - b) % 90
+    return min(d, 90 - d)
+
+
+def accuracy_fixtures(width, height):
+    for seed in SEEDS:
+        car = car_cutout(width, height, seed)
+        # Squeezed horizontally, the car's box has a front-like aspect ratio
+        front = car.resize((width * 2 // 5, height), Image.Resampling.LANCZOS)
+        for view, image in (('side', car), ('front', front)):
+            for rotation in ROTATIONS:
+                rotated = image.rotate(rotation, resample=Image.Resampling.BICUBIC, expand=True)
+                yield view, rotation, rotated
+
+
+def accuracy(methods, width, height):
+    results = {name: {'errors': [], 'orientation': 0, 'offset': 0} for name in methods}
+    count = 0
+    for view, rotation, image in accuracy_fixtures(width, height):
+        count += 1
+        truth = expected_angle(rotation)
+        for name, method in methods.items():
+            angle, orientation = method(image)[:2]
+            result = results[name]
+            result['errors'].append(angle_error(angle, truth))
+            result['orientation'] += orientation == view
+            result['offset'] += reflection_offset(angle)[0] == reflection_offset(truth)[0]
+    return results, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[12, 24, 50], help='megapixels for timing')
+    parser.add_argument('--accuracy-size', default='1600x1200', help='WIDTHxHEIGHT of the accuracy fixtures')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    methods = {
+        'detect_car_angle': detect_car_angle,
+        'estimate_car_orientation': estimate_car_orientation,
+    }
+    width, height = (int(v) for v in args.accuracy_size.split('x'))
+    results, count = accuracy(methods, width, height)
+    print(f"accuracy on {count} rotated fixtures ({args.accuracy_size})")
+    print(f"{'method':<26} {'mean err':>9} {'max err':>8} {'orientation':>12} {'offset':>7}")
+    for name, result in results.items():
+        errors = result['errors']
+        print(f"{name:<26} {sum(errors) / len(errors):>8.2f}° {max(errors):>7.2f}° "
+              f"{result['orientation'] / count:>12.0%} {result['offset'] / count:>7.0%}")
+
+    print(f"\n{'size':>6} {'detect ms':>10} {'estimate ms':>12} {'speedup':>8}")
+    for megapixels in args.sizes:
+        car = car_cutout(*dimensions(megapixels), seed=1)
+        legacy, _ = best_time(lambda: detect_car_angle(car), args.repeat)
+        fast, _ = best_time(lambda: estimate_car_orientation(car), args.repeat)
+        print(f"{megapixels:>5}M {1000 * legacy:>10.1f} {1000 * fast:>12.2f} {legacy / fast:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
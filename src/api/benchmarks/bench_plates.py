@@ -0,0 +1,79 @@
+"""
+License plate detection benchmark and recall check.
+
+Times blur_license_plate's detection at full resolution and on the
+downscaled pyramid for several image sizes, then checks recall (a plate
+counts as found when a detection overlaps it with IoU >= 0.3) on a synthetic
+fixture set, or on real images listed in a boxes.json file.
+
+Usage:
+    python benchmarks/bench_plates.py [--sizes 0.5 2 12 24 50] [--max-side 1600]
+    python benchmarks/bench_plates.py --fixtures DIR   # DIR/boxes.json: {"file.jpg": [[x, y, w, h], ...]}
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import best_time, box_iou, dimensions, plate_scene  # noqa: E402
+from plates import DETECTION_MAX_SIDE, detect_plates  # noqa: E402
+
+
+def synthetic_fixtures():
+    """Plates from about 4% to 15% of the image width at several resolutions"""
+    for megapixels in (0.5, 2, 12):
+        width, height = dimensions(megapixels)
+        for i, plate_ratio in enumerate((0.04, 0.06, 0.09, 0.12, 0.15)):
+            img, box = plate_scene(width, height, max(64, int(width * plate_ratio)), seed=i)
+            yield f"{megapixels}MP plate {plate_ratio:.0%}", img, [box]
+
+
+def file_fixtures(directory):
+    with open(os.path.join(directory, 'boxes.json')) as f:
+        boxes = json.load(f)
+    for name, plate_boxes in boxes.items():
+        img = np.array(Image.open(os.path.join(directory, name)).convert('RGB'))
+        yield name, img, [tuple(b) for b in plate_boxes]
+
+
+def recall(fixtures, max_side):
+    found = total = 0
+    for _, img, boxes in fixtures:
+        detections = detect_plates(img, max_side=max_side)
+        total += len(boxes)
+        found += sum(any(box_iou(box, d) >= 0.3 for d in detections) for box in boxes)
+    return found, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.5, 2, 12, 24, 50], help='megapixels')
+    parser.add_argument('--max-side', type=int, default=DETECTION_MAX_SIDE)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--fixtures', help='directory with images and boxes.json')
+    args = parser.parse_args()
+
+    # Load the cascade outside of the measurements
+    detect_plates(np.zeros((64, 64, 3), dtype=np.uint8))
+
+    print(f"{'size':>12} {'full ms':>9} {'pyramid ms':>11} {'speedup':>8}")
+    for megapixels in args.sizes:
+        width, height = dimensions(megapixels)
+        img, _ = plate_scene(width, height, width // 10)
+        full, _ = best_time(lambda: detect_plates(img, max_side=None), args.repeat)
+        pyramid, _ = best_time(lambda: detect_plates(img, max_side=args.max_side), args.repeat)
+        print(f"{width}x{height:<6} {full * 1000:>9.1f} {pyramid * 1000:>11.1f} {full / pyramid:>7.1f}x")
+
+    fixtures = list(file_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures())
+    for label, max_side in (('full resolution', None), (f'max side {args.max_side}', args.max_side)):
+        found, total = recall(fixtures, max_side)
+        print(f"recall at {label}: {found}/{total} ({found / total:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Request time per render preset: previews against the full-resolution render.
+
+Times /api/process-images on a synthetic car photo and background with each
+preset, with the stub background removal model and no matte cache, so every
+request runs plate blur, matting, shadow, reflection, compositing and
+encoding at the preset's resolution.
+
+Usage:
+    python benchmarks/bench_presets.py [--sizes 2 12] [--presets thumbnail web print] [--repeat 3]
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image  # noqa: E402
+
+from benchmarks.fixtures import background_scene, best_time, car_scene, dimensions  # noqa: E402
+
+
+def jpeg_bytes(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=90)
+    return buffered.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[2, 12], help='upload megapixels')
+    parser.add_argument('--presets', nargs='+', default=['thumbnail', 'web', 'print'])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    import server
+
+    print(f"{'upload':>7} {'preset':<10} {'output':>11} {'ms':>8} {'KB':>8} {'speedup':>8}")
+    with TestClient(server.app) as client:
+        for megapixels in args.sizes:
+            width, height = dimensions(megapixels)
+            files = {
+                'foreground': ('car.jpg', jpeg_bytes(Image.fromarray(car_scene(width, height, seed=0)[0]))),
+                'background': ('background.jpg', jpeg_bytes(background_scene(width, height, seed=0))),
+            }
+            results = {}
+            for preset in args.presets:
+                def run():
+                    response = client.post('/api/process-images', files=files, data={'preset': preset})
+                    response.raise_for_status()
+                    results[preset] = response.json()
+
+                seconds, _ = best_time(run, args.repeat)
+                final_image = results[preset]['final_image']
+                output = Image.open(io.BytesIO(base64.b64decode(final_image.split(',', 1)[1])))
+                results[preset] = (seconds, output.size, len(final_image) * 3 // 4)
+
+            full_seconds = results[args.presets[-1]][0]
+            for preset in args.presets:
+                seconds, size, nbytes = results[preset]
+                print(f"{megapixels:>6}M {preset:<10} {size[0]:>5}x{size[1]:<5} {1000 * seconds:>8.1f} "
+                      f"{nbytes / 1024:>8.0f} {full_seconds / seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    # Set up before the server module is imported: a stub model in every
+    # matting worker and no matte cache, so each request does the full work
+    os.environ.setdefault('REMOVER_FACTORY', 'benchmarks.stub_remover:StubRemover')
+    os.environ.setdefault('MATTE_CACHE_BYTES', '0')
+    main()
@@ -0,0 +1,93 @@
+"""
+Spin sets: /api/process-spin against sending every frame to /api/process-images.
+
+Times a synthetic turntable spin composited onto a background both ways,
+with the stub background removal model and no matte cache, so every frame
+is plate blurred, matted, composited and encoded. Reports the time per
+frame, the work the spin reused (from its summary line) and the IoU of its
+mattes with the independently processed ones (alpha above 127 counted as
+car).
+
+Usage:
+    python benchmarks/bench_spin.py [--size 1600 1200] [--frames 24] [--preset web]
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from benchmarks.fixtures import background_scene, spin_frames  # noqa: E402
+
+
+def jpeg_bytes(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=90)
+    return buffered.getvalue()
+
+
+def car_pixels(data_uri):
+    image = Image.open(io.BytesIO(base64.b64decode(data_uri.split(',', 1)[1])))
+    return np.asarray(image)[..., 3] > 127
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, nargs=2, default=[1600, 1200], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--frames', type=int, default=24)
+    parser.add_argument('--preset', default='web')
+    args = parser.parse_args()
+
+    from fastapi.testclient import TestClient
+    import server
+
+    width, height = args.size
+    frames = [jpeg_bytes(Image.fromarray(frame)) for frame in spin_frames(width, height, args.frames)]
+    background = ('background.jpg', jpeg_bytes(background_scene(width, height)))
+    data = {'preset': args.preset}
+
+    with TestClient(server.app) as client:
+        start = time.perf_counter()
+        independent = []
+        for frame in frames:
+            response = client.post(
+                '/api/process-images', files={'foreground': ('car.jpg', frame), 'background': background}, data=data
+            )
+            response.raise_for_status()
+            independent.append(response.json())
+        independent_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        files = [('frames', (f"frame-{i}.jpg", frame)) for i, frame in enumerate(frames)] + [('background', background)]
+        response = client.post('/api/process-spin', files=files, data=data)
+        response.raise_for_status()
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        spin_seconds = time.perf_counter() - start
+
+    results, summary = lines[:-1], lines[-1]['summary']
+    ious = []
+    for result, single in zip(results, independent):
+        a, b = car_pixels(result['car_only']), car_pixels(single['car_only'])
+        ious.append((a & b).sum() / max(1, (a | b).sum()))
+
+    print(f"{args.frames} frames of {width}x{height}, preset {args.preset}")
+    print(f"{'mode':<12} {'ms/frame':>9} {'speedup':>8}")
+    print(f"{'independent':<12} {1000 * independent_seconds / args.frames:>9.1f} {1:>7.1f}x")
+    print(f"{'spin':<12} {1000 * spin_seconds / args.frames:>9.1f} {independent_seconds / spin_seconds:>7.1f}x")
+    print(' '.join(f"{name}={value}" for name, value in summary.items()))
+    print(f"matte IoU with independent frames: min {min(ious):.4f} mean {np.mean(ious):.4f}")
+
+
+if __name__ == '__main__':
+    # Set up before the server module is imported: a stub model in every
+    # matting worker and no matte cache, so each frame does the full work
+    os.environ.setdefault('REMOVER_FACTORY', 'benchmarks.stub_remover:StubRemover')
+    os.environ.setdefault('MATTE_CACHE_BYTES', '0')
+    main()
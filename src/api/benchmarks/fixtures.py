@@ -0,0 +1,172 @@
+"""
+Deterministic synthetic fixtures and timing helpers for the benchmark scripts.
+
+Everything is generated from a seed so benchmarks run offline and produce the
+same inputs on every machine.
+"""
+import time
+
+import cv2
+import numpy as np
+
+PLATE_TEXTS = ['A123BC77', 'X 777 XX', 'B 456 OP 99', 'K 001 MM', 'E 245 TT 50']
+
+
+def dimensions(megapixels):
+    """4:3 width and height for a pixel count in megapixels"""
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    return width, width * 3 // 4
+
+
+def best_time(fn, repeat):
+    """Fastest of repeat runs of fn, and the last run's result"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def render_plate(width, text, aspect=0.22):
+    """Render a white plate with a black border and fitted black text"""
+    height = max(8, int(width * aspect))
+    plate = np.full((height, width, 3), 240, dtype=np.uint8)
+    cv2.rectangle(plate, (0, 0), (width - 1, height - 1), (10, 10, 10), max(2, width // 90))
+    thickness = max(2, width // 90)
+    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 1, thickness)
+    font_scale = min(width * 0.9 / text_w, height * 0.7 / text_h)
+    (text_w, text_h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, font_scale, thickness)
+    cv2.putText(plate, text, ((width - text_w) // 2, (height + text_h) // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, font_scale, (10, 10, 10), thickness)
+    return plate
+
+
+def plate_scene(width, height, plate_width, seed=0):
+    """
+    An RGB scene with one license plate on a smooth, noisy car-like body.
+    Returns:
+        tuple: The (height, width, 3) uint8 image and the plate's (x, y, w, h) box.
+    """
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:height, :width].astype(np.float32)
+    base = 70 + 60 * (yy / height) + 20 * np.sin(xx / width * np.pi * (1 + seed % 3))
+    img = np.repeat(base[..., None], 3, axis=2) + rng.normal(0, 6, (height, width, 3))
+    img = np.clip(img, 0, 255).astype(np.uint8)
+
+    plate = render_plate(plate_width, PLATE_TEXTS[seed % len(PLATE_TEXTS)])
+    plate_h = plate.shape[0]
+    x = int(rng.integers(width // 4, max(width // 4 + 1, 3 * width // 4 - plate_width)))
+    y = int(rng.integers(height // 2, max(height // 2 + 1, 7 * height // 8 - plate_h)))
+    img[y:y+plate_h, x:x+plate_width] = plate
+    return img, (x, y, plate_width, plate_h)
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax1, ay1, bx1, by1 = a[0] + a[2], a[1] + a[3], b[0] + b[2], b[1] + b[3]
+    iw = max(0, min(ax1, bx1) - max(a[0], b[0]))
+    ih = max(0, min(ay1, by1) - max(a[1], b[1]))
+    inter = iw * ih
+    union = a[2] * a[3] + b[2] * b[3] - inter
+    return inter / union if union else 0.0
+
+
+CAR_COLORS = [(150, 20, 30), (20, 50, 130), (30, 30, 35), (200, 200, 205), (40, 110, 60)]
+
+
+def _row_gradient(height, width, top, bottom):
+    """A (height, width, 3) image blending from the top color to the bottom color"""
+    t = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    rows = (np.array(top, np.float32) * (1 - t) + np.array(bottom, np.float32) * t).astype(np.uint8)
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:] = rows[:, None, :]
+    return img
+
+
+def _draw_car(img, mask, width, height, seed):
+    """Draw a side-on car (body, cabin, windows, wheels, plate) into img and its silhouette into mask"""
+    rng = np.random.default_rng(seed)
+    color = CAR_COLORS[seed % len(CAR_COLORS)]
+    car_w = int(width * rng.uniform(0.6, 0.75))
+    car_h = int(car_w * 0.38)
+    x0 = (width - car_w) // 2 + int(rng.integers(-width // 20, width // 20 + 1))
+    y1 = int(height * 0.82)
+    y0 = y1 - car_h
+    wheel_r = int(car_h * 0.22)
+    body_top = y0 + int(car_h * 0.4)
+    cabin = np.array([
+        (x0 + int(car_w * 0.2), body_top), (x0 + int(car_w * 0.33), y0),
+        (x0 + int(car_w * 0.68), y0), (x0 + int(car_w * 0.82), body_top),
+    ], dtype=np.int32)
+    body = (x0, body_top, x0 + car_w, y1 - wheel_r // 2)
+    wheels = [(x0 + int(car_w * f), y1 - wheel_r) for f in (0.2, 0.8)]
+
+    for target, fill in ((mask, 255), (img, color)):
+        cv2.fillPoly(target, [cabin], fill)
+        cv2.rectangle(target, body[:2], body[2:], fill, -1)
+    windows = cabin + np.array([(8, 6), (6, 6), (-6, 6), (-8, 6)]) * max(1, car_w // 400)
+    cv2.fillPoly(img, [windows], (40, 60, 80))
+    for center in wheels:
+        cv2.circle(mask, center, wheel_r, 255, -1)
+        cv2.circle(img, center, wheel_r, (20, 20, 20), -1)
+        cv2.circle(img, center, wheel_r // 2, (160, 160, 165), -1)
+
+    plate = render_plate(max(32, car_w // 6), PLATE_TEXTS[seed % len(PLATE_TEXTS)])
+    px, py = x0 + car_w - plate.shape[1] - car_w // 40, body[3] - plate.shape[0] - car_h // 12
+    img[py:py+plate.shape[0], px:px+plate.shape[1]] = plate
+
+
+def car_scene(width, height, seed=0):
+    """
+    A car-like photo: a side-on car with a license plate on a light studio backdrop.
+    Returns:
+        tuple: The (height, width, 3) uint8 RGB image and the car's (height, width) uint8 mask.
+    """
+    img = _row_gradient(height, width, (246, 246, 244), (222, 222, 220))
+    mask = np.zeros((height, width), dtype=np.uint8)
+    _draw_car(img, mask, width, height, seed)
+    return img, mask
+
+
+def car_cutout(width, height, seed=0):
+    """The car of car_scene as an RGBA PIL image with a transparent background"""
+    from PIL import Image
+
+    img, mask = car_scene(width, height, seed)
+    return Image.fromarray(np.dstack([img, mask]), 'RGBA')
+
+
+def spin_frames(width, height, count, seed=0):
+    """
+    A car_scene turning on a turntable: each frame squeezes the car
+    horizontally about the image centre, as a side-on car narrows when it
+    turns towards the camera, and shifts it slightly.
+    Returns:
+        list: count (height, width, 3) uint8 RGB frames.
+    """
+    img, _ = car_scene(width, height, seed)
+    frames = []
+    for i in range(count):
+        turn = 2 * np.pi * i / count
+        squeeze = 0.7 + 0.3 * abs(np.cos(turn))
+        shift = width * 0.02 * np.sin(turn)
+        matrix = np.float32([[squeeze, 0, (1 - squeeze) * width / 2 + shift], [0, 1, 0]])
+        frames.append(cv2.warpAffine(img, matrix, (width, height), borderMode=cv2.BORDER_REPLICATE))
+    return frames
+
+
+def background_scene(width, height, seed=0):
+    """An RGB PIL background: sky and ground gradients with a horizon and a road"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    horizon = int(height * rng.uniform(0.45, 0.6))
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    img[:horizon] = _row_gradient(horizon, width, (90, 140, 210), (200, 220, 235))
+    img[horizon:] = _row_gradient(height - horizon, width, (110, 120, 100), (70, 75, 65))
+    road = np.array([(0, height), (width // 2 - width // 20, horizon), (width // 2 + width // 20, horizon),
+                     (width, height)], dtype=np.int32)
+    cv2.fillPoly(img, [road], (60, 60, 62))
+    cv2.circle(img, (int(width * rng.uniform(0.1, 0.9)), horizon // 3), max(4, height // 12), (250, 240, 200), -1)
+    return Image.fromarray(img)
@@ -0,0 +1,35 @@
+"""
+Deterministic stand-in for transparent_background's Remover.
+
+Treats everything connected to the image border that is close to the border's
+median color as background, which separates the cars of benchmarks.fixtures
+from their studio backdrop without a model, GPU or network. Use it through
+matting's REMOVER_FACTORY:
+
+    REMOVER_FACTORY=benchmarks.stub_remover:StubRemover
+"""
+import cv2
+import numpy as np
+
+# Maximum per-channel distance from the backdrop color counted as backdrop
+BACKDROP_TOLERANCE = 16
+
+
+class StubRemover:
+    def __init__(self, mode='base', **kwargs):
+        self.mode = mode
+
+    def process(self, img, type='rgba', threshold=None):
+        """Return the RGB image with the estimated car mask as alpha"""
+        rgb = np.asarray(img.convert('RGB') if hasattr(img, 'convert') else img)[..., :3]
+        border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+        backdrop = np.median(border, axis=0)
+        # Close to the backdrop color, allowing for its gradient
+        near = (np.abs(rgb.astype(np.int16) - backdrop.astype(np.int16)).max(axis=2) <= BACKDROP_TOLERANCE)
+        near = near.astype(np.uint8)
+        # Only backdrop-colored regions touching the border are background
+        _, labels = cv2.connectedComponents(near, connectivity=4)
+        edge_labels = np.unique(np.concatenate([labels[0], labels[-1], labels[:, 0], labels[:, -1]]))
+        background = np.isin(labels, edge_labels[edge_labels > 0])
+        alpha = np.where(background, 0, 255).astype(np.uint8)
+        return np.dstack([rgb, alpha])
@@ -0,0 +1,317 @@
+"""
+Offline bulk processing of a directory tree of car photos.
+
+Runs the same steps as a job (render.run_job: plate blur, background
+removal, compositing, encoding) without the HTTP server, in a pool of
+worker processes, each with its own model and its share of the cores.
+Workers read their image from disk and write the results straight next to
+it in the output tree, so no pixels are pickled between processes, and the
+main process only keeps --max-in-flight images queued at a time: memory
+stays bounded however large the tree is.
+
+    python bulk.py INPUT OUTPUT_DIR [--background bg.jpg | --background-id ID]
+        [--preset print] [--output-format webp] [--workers 8] [--max-in-flight 16]
+
+INPUT is a directory, searched recursively for images, or a text file
+listing one image path per line (relative to the file). OUTPUT_DIR mirrors
+the input tree, with car/photo.jpg giving car/photo.car_only.png and, with
+a background, car/photo.final_image.png. Listed paths whose outputs would
+land outside OUTPUT_DIR, such as ../photo.jpg, are counted as failed.
+
+Progress is appended to a manifest (OUTPUT_DIR/manifest.jsonl unless
+--manifest is given), one JSON line per finished image with a hash of its
+content, the background and the options. A rerun skips images whose hash
+is in the manifest with their outputs still on disk, so an interrupted run
+resumes where it stopped, while changed photos or options are processed
+again; failed images are retried. With MATTE_CACHE_DIR set, workers share
+the matte cache with the server and jobs, so re-rendering the same photos
+onto a new background skips the model. A summary of the throughput and the
+time spent per step is printed at the end.
+"""
+import argparse
+import collections
+import concurrent.futures
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+from cache import content_digest
+from encoding import MEDIA_TYPES
+from presets import load_presets
+
+logger = logging.getLogger(__name__)
+
+# Files taken from an input directory
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tif', '.tiff')
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def list_inputs(source, output_dir=None):
+    """
+    The images to process.
+    Args:
+        source (str): A directory, searched recursively, or a text file listing image paths.
+        output_dir (str): Not searched, when it is inside the input directory.
+    Yields:
+        tuple: (path, path relative to the input, used for its outputs), in sorted order.
+    """
+    if os.path.isdir(source):
+        skip = os.path.realpath(output_dir) if output_dir else None
+        for root, dirs, files in os.walk(source):
+            dirs[:] = sorted(d for d in dirs if os.path.realpath(os.path.join(root, d)) != skip)
+            for name in sorted(files):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, source)
+        return
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        for line in f:
+            listed = line.strip()
+            if listed and not listed.startswith('#'):
+                # Absolute paths keep their whole path under the output directory
+                yield os.path.join(base, listed), os.path.normpath(listed.lstrip('/\\'))
+
+
+def output_stem(output_dir, relative):
+    """Path of an input's outputs without their suffix, or None if it is not inside output_dir"""
+    stem = os.path.join(output_dir, os.path.splitext(relative)[0])
+    # Resolved, so neither .. nor a symlinked directory leads out of the tree
+    root, resolved = os.path.realpath(output_dir), os.path.realpath(stem)
+    if resolved == root or os.path.commonpath([root, resolved]) != root:
+        return None
+    return stem
+
+
+def image_key(path, options, background_digest=None):
+    """Hash of an image's content together with everything else that changes its outputs"""
+    with open(path, 'rb') as f:
+        sha = hashlib.sha256(content_digest(f).encode('ascii'))
+    sha.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+    if background_digest:
+        sha.update(background_digest.encode('ascii'))
+    return sha.hexdigest()[:32]
+
+
+def load_manifest(path):
+    """The latest manifest entry of each input, by relative path; none if there is no manifest yet"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path) as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line of a run that was killed while writing it
+                continue
+            entries[entry['input']] = entry
+    return entries
+
+
+def is_done(entry, key, output_dir):
+    """Whether a manifest entry records this exact work as finished, with its outputs still there"""
+    return (
+        entry is not None and entry.get('key') == key and 'error' not in entry
+        and all(os.path.exists(os.path.join(output_dir, output)) for output in entry['outputs'].values())
+    )
+
+
+def init_worker(threads, preview):
+    """Worker initializer: share the cores and load the model before the first image"""
+    import jobs
+
+    if threads:
+        jobs.limit_threads(threads)
+    import render
+
+    render.init_worker((render.PREVIEW_REMOVER_MODE if preview else render.REMOVER_MODE,))
+
+
+def process_image(path, output_stem, inputs, options):
+    """
+    Process one image in a worker and write its outputs.
+    Args:
+        path (str): The car image.
+        output_stem (str): Outputs are written to output_stem.<name>.<extension>.
+        inputs (dict): Other inputs of render.run_job (the background).
+        options (dict): render.run_job options.
+    Returns:
+        tuple: (result metadata, name -> output path, seconds per step)
+    """
+    import metrics
+    import render
+
+    breakdown = metrics.start_breakdown()
+    result, images = render.run_job(dict(inputs, foreground=path), options)
+    outputs = {}
+    with metrics.timed('write'):
+        for name, (content, media_type) in images.items():
+            extension = 'jpg' if media_type == 'image/jpeg' else media_type.split('/')[1]
+            outputs[name] = f"{output_stem}.{name}.{extension}"
+            # Written under a temporary name, so an output is never left half written
+            tmp_path = f"{outputs[name]}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, outputs[name])
+    return result, outputs, breakdown.seconds
+
+
+class Summary:
+    """Counts and per-step seconds of a run"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.counts = collections.Counter(done=0, skipped=0, failed=0)
+        self.seconds = collections.Counter()
+
+    def add(self, steps):
+        self.counts['done'] += 1
+        self.seconds.update(steps)
+
+    def report(self, workers):
+        elapsed = time.perf_counter() - self.start
+        done = self.counts['done']
+        lines = [
+            f"{done} processed, {self.counts['skipped']} skipped, {self.counts['failed']} failed "
+            f"in {elapsed:.1f}s on {workers} workers: {done / elapsed if elapsed else 0:.2f} images/s",
+        ]
+        if done:
+            total = sum(self.seconds.values())
+            lines.append(f"{'step':<18} {'ms/image':>9} {'share':>6}")
+            for step, seconds in self.seconds.most_common():
+                lines.append(f"{step:<18} {1000 * seconds / done:>9.1f} {100 * seconds / total:>5.1f}%")
+        return '\n'.join(lines)
+
+
+def run(args):
+    """Process every input not yet done, keeping at most args.max_in_flight images queued"""
+    presets = load_presets(os.environ.get('RENDER_PRESETS'))
+    if args.preset not in presets:
+        raise SystemExit(f"--preset must be one of {', '.join(presets)}")
+    preset = presets[args.preset]
+    options = {
+        "output_format": args.output_format or preset.output_format,
+        "quality": preset.quality if args.quality is None else args.quality,
+        "compress_level": preset.compress_level if args.compress_level is None else args.compress_level,
+        "preview": args.preview,
+    }
+    if not 1 <= options["quality"] <= 100 or not 0 <= options["compress_level"] <= 9:
+        raise SystemExit("--quality must be 1-100 and --compress-level 0-9")
+    if preset.max_side:
+        options["max_side"] = preset.max_side
+    inputs, background_digest = {}, None
+    if args.background:
+        inputs["background"] = os.path.abspath(args.background)
+        with open(args.background, 'rb') as f:
+            background_digest = content_digest(f)
+    elif args.background_id:
+        options["background_id"] = args.background_id
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = args.manifest or os.path.join(args.output_dir, MANIFEST_NAME)
+    finished = load_manifest(manifest_path)
+    summary = Summary()
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    max_in_flight = args.max_in_flight or 2 * args.workers
+
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.workers,
+        # Spawned like the matting workers, each loading the model itself
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+        initargs=(threads, args.preview),
+    )
+    in_flight = {}
+
+    def record(future):
+        relative, key = in_flight.pop(future)
+        entry = {"input": relative, "key": key}
+        try:
+            result, outputs, steps = future.result()
+        except Exception as e:
+            summary.counts['failed'] += 1
+            entry["error"] = f"{type(e).__name__}: {e}"
+            logger.warning('%s failed: %s', relative, entry["error"])
+        else:
+            summary.add(steps)
+            entry.update(
+                result,
+                outputs={name: os.path.relpath(path, args.output_dir) for name, path in outputs.items()},
+                seconds=round(sum(steps.values()), 3),
+            )
+            logger.info('%s done', relative)
+        # One line per image, flushed at once, so a killed run loses nothing it finished
+        manifest.write(json.dumps(entry) + "\n")
+        manifest.flush()
+
+    with open(manifest_path, 'a') as manifest:
+        try:
+            for path, relative in list_inputs(args.input, args.output_dir):
+                stem = output_stem(args.output_dir, relative)
+                if stem is None:
+                    summary.counts['failed'] += 1
+                    logger.warning('%s skipped: its outputs would be outside %s', relative, args.output_dir)
+                    continue
+                try:
+                    key = image_key(path, options, background_digest)
+                except OSError as e:
+                    summary.counts['failed'] += 1
+                    logger.warning('%s unreadable: %s', relative, e)
+                    continue
+                if is_done(finished.get(relative), key, args.output_dir):
+                    summary.counts['skipped'] += 1
+                    continue
+                os.makedirs(os.path.dirname(stem), exist_ok=True)
+                # Wait for a free slot before reading further into the tree
+                while len(in_flight) >= max_in_flight:
+                    done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        record(future)
+                future = executor.submit(process_image, path, stem, inputs, options)
+                in_flight[future] = (relative, key)
+            for future in concurrent.futures.as_completed(list(in_flight)):
+                record(future)
+        finally:
+            # Interrupted: drop what has not started; the next run picks it up
+            executor.shutdown(wait=True, cancel_futures=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('input', help='directory of car images, or a text file listing them')
+    parser.add_argument('output_dir')
+    background = parser.add_mutually_exclusive_group()
+    background.add_argument('--background', help='background image composited behind every car')
+    background.add_argument('--background-id', help='registered background (in BACKGROUNDS_DIR) instead')
+    parser.add_argument('--preset', default='print', help='render preset (see RENDER_PRESETS)')
+    parser.add_argument('--output-format', choices=sorted(MEDIA_TYPES), help="default: the preset's")
+    parser.add_argument('--quality', type=int)
+    parser.add_argument('--compress-level', type=int)
+    parser.add_argument('--preview', action='store_true', help='use the faster PREVIEW_REMOVER_MODE model')
+    parser.add_argument('--manifest', help=f"progress file (default: OUTPUT_DIR/{MANIFEST_NAME})")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes, each with its own model')
+    parser.add_argument('--threads', type=int, help='threads per worker (default: cores / workers)')
+    parser.add_argument('--max-in-flight', type=int, help='images queued at once (default: 2 per worker)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='log every image')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format='%(asctime)s %(message)s')
+
+    try:
+        summary = run(args)
+    except KeyboardInterrupt:
+        print('Interrupted; run again to resume', file=sys.stderr)
+        sys.exit(130)
+    print(summary.report(args.workers))
+    if summary.counts['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Content-addressed cache for plate-blur and background-removal results.
+
+Entries are keyed on a hash of the uploaded bytes plus the parameters that
+affect the output (inference backend, matting threshold and Remover mode),
+so re-uploading the same car photo skips both the cascade detection and the model.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+# Read size when hashing uploads from a file
+HASH_CHUNK_BYTES = 1 << 20
+
+
+def content_digest(content):
+    """SHA-256 hex digest of upload bytes, or of a file of them read in chunks"""
+    if isinstance(content, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(content).hexdigest()
+    # Hash a spooled upload in chunks rather than reading it into memory
+    sha = hashlib.sha256()
+    content.seek(0)
+    for chunk in iter(lambda: content.read(HASH_CHUNK_BYTES), b''):
+        sha.update(chunk)
+    return sha.hexdigest()
+
+
+def image_nbytes(image):
+    """Approximate in-memory size of a decoded PIL image"""
+    return image.width * image.height * len(image.getbands())
+
+
+class MatteCache:
+    """
+    Two-tier cache of (blurred foreground, RGBA matte) pairs.
+    Args:
+        max_bytes (int): Memory budget of the LRU tier. Least recently used
+            entries are evicted once the decoded images exceed it.
+        disk_dir (str): Optional directory for an on-disk tier. Entries evicted
+            from memory stay on disk and are promoted back on the next hit.
+    Cached images are shared between callers and must not be modified in place.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(content, threshold, mode, backend):
+        """Build the cache key for raw upload bytes, or a file of them, and matting parameters"""
+        return f"{content_digest(content)}-{backend}-{mode}-{threshold}"
+
+    @staticmethod
+    def scaled_key(key, max_side):
+        """Key of the same upload's results rendered to fit max_side (None: full resolution)"""
+        return key if max_side is None else f"{key}-{max_side}"
+
+    def get(self, key):
+        """Return the cached (blurred, removed) pair for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+
+        entry = self._load(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._insert(key, *entry)
+        return entry
+
+    def put(self, key, blurred, removed):
+        """Store a (blurred, removed) pair in memory and, if enabled, on disk"""
+        self._insert(key, blurred, removed)
+        self._save(key, blurred, removed)
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current memory usage"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _insert(self, key, blurred, removed):
+        size = image_nbytes(blurred) + image_nbytes(removed)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[2]
+            self._entries[key] = (blurred, removed, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _load(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                return Image.fromarray(data["blurred"]), Image.fromarray(data["removed"])
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save(self, key, blurred, removed):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        # Uncompressed so a disk hit costs a read rather than a decode
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, blurred=np.asarray(blurred), removed=np.asarray(removed))
+        os.replace(tmp_path, path)
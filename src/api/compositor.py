@@ -0,0 +1,354 @@
+"""
+Single-pass compositing of a background, image layers and global adjustments.
+
+A composite is described declaratively: a background image (resized to the
+canvas), Layer objects placed on it and optional color saturation and contrast
+factors. Compositor.render produces it into one output buffer, working through
+the canvas in strips of rows. Each strip gets its background rows (resized on
+the fly), every layer overlapping it and the color adjustment, so the output
+canvas is the only full-size allocation. A contrast adjustment needs the mean
+brightness of the whole image and adds a second, table-lookup pass.
+
+Layers are composited with the "over" operator in premultiplied alpha, either
+in 8-bit integer math or in float32. In 8-bit math a straight-alpha layer over
+an opaque background matches PIL's Image.paste(layer, position, layer) in the
+color channels, and the adjustments match ImageEnhance.Color and
+ImageEnhance.Contrast. Unlike paste, the result stays opaque where the
+background is. Scratch buffers are kept per thread and reused across strips
+and renders.
+
+A background rendered many times at the same size can be prepared once with
+prepare_background; rendering on the prepared buffer copies its rows instead
+of resizing and converting the image again.
+"""
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Pixels per strip: bounds the scratch buffers (16 bytes per pixel in float32)
+STRIP_PIXELS = 1 << 20
+
+# ITU-R 601-2 luma weights in 16-bit fixed point, as PIL's RGB to L conversion
+LUMA_WEIGHTS = (19595, 38470, 7471)
+
+_local = threading.local()
+
+
+def _scratch(name, shape, dtype):
+    """A per-thread buffer of at least the given shape, reused across calls"""
+    buffers = getattr(_local, 'buffers', None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    size = int(np.prod(shape))
+    buffer = buffers.get(name)
+    if buffer is None or buffer.dtype != dtype or buffer.size < size:
+        buffer = buffers[name] = np.empty(size, dtype=dtype)
+    return buffer[:size].reshape(shape)
+
+
+def _div255(values, tmp):
+    """Divide uint16 values by 255 in place with rounding, as PIL does"""
+    values += 128
+    np.right_shift(values, 8, out=tmp)
+    values += tmp
+    values >>= 8
+
+
+def _luma(rgb, out):
+    """PIL's 8-bit L of an RGB array, computed into out (uint32)"""
+    tmp = _scratch('luma_term', out.shape, np.uint32)
+    np.multiply(rgb[..., 0], LUMA_WEIGHTS[0], out=out, dtype=np.uint32)
+    for channel in (1, 2):
+        np.multiply(rgb[..., channel], LUMA_WEIGHTS[channel], out=tmp, dtype=np.uint32)
+        out += tmp
+    out += 0x8000
+    out >>= 16
+    return out
+
+
+def prepare_background(background, size):
+    """
+    Resize and convert a background once, for any number of renders at size.
+    Args:
+        background (PIL.Image.Image): The background image.
+        size (tuple): (width, height) of the canvas.
+    Returns:
+        numpy.ndarray: (height, width, 4) uint8 RGBA, opaque where the image was.
+    """
+    width, height = size = tuple(size)
+    background = Compositor._background_source(background, size)
+    if background.size != size:
+        background = background.resize(size, Image.Resampling.LANCZOS)
+    out = np.empty((height, width, 4), dtype=np.uint8)
+    Compositor._fill_background(out, background, size, 0, height)
+    return out
+
+
+class Layer:
+    """
+    An image placed on the canvas.
+    Args:
+        image (PIL.Image.Image): RGBA (straight alpha) or RGBa (premultiplied)
+            image; other modes are converted to RGBA.
+        position (tuple): (x, y) of its top-left corner on the canvas; it may
+            lie partly outside.
+        opacity (float): Multiplies the layer's alpha.
+    """
+
+    def __init__(self, image, position, opacity=1.0):
+        self.image = image
+        self.position = position
+        self.opacity = opacity
+
+
+class _Placed:
+    """A layer's pixels clipped to the canvas"""
+
+    def __init__(self, pixels, x, y, premultiplied):
+        self.pixels = pixels
+        self.x = x
+        self.y = y
+        self.premultiplied = premultiplied
+
+
+class Compositor:
+    """
+    Render backgrounds, layers and adjustments in strips.
+    Args:
+        precision (str): 'uint8' for 8-bit integer blending (matches PIL), or
+            'float32' to blend all layers of a strip before rounding once.
+        strip_pixels (int): Pixels per strip.
+    """
+
+    PRECISIONS = ('uint8', 'float32')
+
+    def __init__(self, precision='uint8', strip_pixels=STRIP_PIXELS):
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"precision must be one of {', '.join(self.PRECISIONS)}")
+        self.precision = precision
+        self.strip_pixels = strip_pixels
+
+    def render(self, background, layers=(), size=None, color=1.0, contrast=1.0):
+        """
+        Composite layers over a background.
+        Args:
+            background (PIL.Image.Image or numpy.ndarray): Resized (LANCZOS)
+                to size if needed, or a prepare_background buffer of that size.
+            layers (list): Layer objects, bottom first.
+            size (tuple): (width, height) of the result; the background's size by default.
+            color (float): Saturation factor, as ImageEnhance.Color.
+            contrast (float): Contrast factor, as ImageEnhance.Contrast (the
+                alpha channel is left alone).
+        Returns:
+            PIL.Image.Image: The RGBA composite.
+        """
+        if isinstance(background, np.ndarray):
+            width, height = size = tuple(size or (background.shape[1], background.shape[0]))
+            if background.shape != (height, width, 4):
+                raise ValueError(f"prepared background is {background.shape[1]}x{background.shape[0]}, not {width}x{height}")
+            opaque = False
+        else:
+            width, height = size = tuple(size or background.size)
+            background = self._background_source(background, size)
+            opaque = background.mode in ('RGB', 'L')
+        placed = [p for p in (self._place(layer, size) for layer in layers) if p is not None]
+
+        out = np.empty((height, width, 4), dtype=np.uint8)
+        rows = max(1, self.strip_pixels // width)
+        luma_total = 0
+        for y0 in range(0, height, rows):
+            y1 = min(height, y0 + rows)
+            strip = out[y0:y1]
+            self._fill_background(strip, background, size, y0, y1)
+            strip_opaque = opaque or strip[..., 3].min() == 255
+            overlapping = [p for p in placed if p.y < y1 and p.y + p.pixels.shape[0] > y0]
+            if self.precision == 'float32':
+                self._composite_float(strip, y0, overlapping, strip_opaque, color)
+            else:
+                self._composite_uint8(strip, y0, overlapping, strip_opaque)
+                if color != 1.0:
+                    self._adjust_color_uint8(strip, color)
+            if contrast != 1.0:
+                luma_total += int(_luma(strip, _scratch('luma', strip.shape[:2], np.uint32)).sum())
+
+        if contrast != 1.0:
+            self._adjust_contrast(out, luma_total / (width * height), contrast)
+        return Image.fromarray(out, 'RGBA')
+
+    @staticmethod
+    def _background_source(background, size):
+        """The background in a mode that can be resized and copied strip by strip"""
+        if background.mode not in ('RGB', 'RGBA', 'L'):
+            background = background.convert('RGBA')
+        if background.mode == 'RGBA' and background.size != size:
+            # PIL resizes RGBA premultiplied; convert once rather than per strip
+            background = background.convert('RGBa')
+        return background
+
+    @staticmethod
+    def _fill_background(strip, background, size, y0, y1):
+        width, height = size
+        if isinstance(background, np.ndarray):
+            strip[:] = background[y0:y1]
+            return
+        if background.size == size:
+            part = background.crop((0, y0, width, y1))
+        else:
+            # Resampling a box of the source gives these rows of the full resize
+            # (within one level, where the strip's sample positions round differently)
+            scale = background.height / height
+            part = background.resize(
+                (width, y1 - y0),
+                Image.Resampling.LANCZOS,
+                box=(0, y0 * scale, background.width, y1 * scale),
+            )
+            if part.mode == 'RGBa':
+                part = part.convert('RGBA')
+        if part.mode == 'L':
+            strip[..., :3] = np.asarray(part)[..., None]
+        else:
+            # Raw RGBX and RGBA bytes are laid out as the strip: a single copy
+            raw = part.tobytes('raw', 'RGBX' if part.mode == 'RGB' else 'RGBA')
+            strip.reshape(-1)[:] = np.frombuffer(raw, dtype=np.uint8)
+            if part.mode == 'RGBA':
+                return
+        strip[..., 3] = 255
+
+    @staticmethod
+    def _place(layer, size):
+        """Clip a layer to its visible pixels on the canvas, or None if there are none"""
+        image = layer.image
+        if image.mode not in ('RGBA', 'RGBa'):
+            image = image.convert('RGBA')
+        # Fully transparent borders (shadow margins, faded reflection rows) change nothing
+        bbox = image.getchannel('A').getbbox()
+        if bbox is None or layer.opacity <= 0:
+            return None
+        x, y = layer.position
+        x0, y0 = max(0, x + bbox[0]), max(0, y + bbox[1])
+        x1, y1 = min(size[0], x + bbox[2]), min(size[1], y + bbox[3])
+        if x0 >= x1 or y0 >= y1:
+            return None
+        if (x1 - x0, y1 - y0) != image.size:
+            image = image.crop((x0 - x, y0 - y, x1 - x, y1 - y))
+        pixels = np.asarray(image)
+        premultiplied = image.mode == 'RGBa'
+        if layer.opacity < 1.0:
+            channels = slice(None) if premultiplied else slice(3, 4)
+            pixels = pixels.copy()
+            pixels[..., channels] = np.rint(pixels[..., channels] * layer.opacity)
+        return _Placed(pixels, x0, y0, premultiplied)
+
+    @staticmethod
+    def _layer_rows(placed, y0, y1):
+        """The part of a layer within canvas rows y0..y1, and its strip-relative top"""
+        top = max(y0, placed.y)
+        bottom = min(y1, placed.y + placed.pixels.shape[0])
+        return placed.pixels[top - placed.y:bottom - placed.y], top - y0
+
+    def _composite_uint8(self, strip, y0, placed, opaque):
+        if not placed:
+            return
+        y1 = y0 + strip.shape[0]
+        if not opaque:
+            self._premultiply_uint8(strip)
+        for layer in placed:
+            src, top = self._layer_rows(layer, y0, y1)
+            dst = strip[top:top + src.shape[0], layer.x:layer.x + src.shape[1]]
+            acc = _scratch('acc', src.shape, np.uint16)
+            tmp = _scratch('tmp', src.shape, np.uint16)
+            inverse = _scratch('inverse', src.shape[:2] + (1,), np.uint16)
+            alpha = src[..., 3:]
+            np.subtract(255, alpha, out=inverse, dtype=np.uint16)
+            if layer.premultiplied:
+                np.multiply(src, 255, out=acc, dtype=np.uint16)
+            else:
+                np.multiply(src, alpha, out=acc, dtype=np.uint16)
+                np.multiply(alpha, 255, out=acc[..., 3:], dtype=np.uint16)
+            np.multiply(dst, inverse, out=tmp, dtype=np.uint16)
+            acc += tmp
+            _div255(acc, tmp)
+            np.copyto(dst, acc, casting='unsafe')
+        if not opaque:
+            self._unpremultiply_uint8(strip)
+
+    @staticmethod
+    def _premultiply_uint8(strip):
+        acc = _scratch('acc', strip.shape, np.uint16)
+        tmp = _scratch('tmp', strip.shape, np.uint16)
+        np.multiply(strip, strip[..., 3:], out=acc, dtype=np.uint16)
+        _div255(acc, tmp)
+        np.copyto(strip[..., :3], acc[..., :3], casting='unsafe')
+
+    @staticmethod
+    def _unpremultiply_uint8(strip):
+        alpha = strip[..., 3:].astype(np.uint32)
+        rgb = strip[..., :3].astype(np.uint32) * 255 + alpha // 2
+        np.floor_divide(rgb, np.maximum(alpha, 1), out=rgb)
+        np.minimum(rgb, 255, out=rgb)
+        np.copyto(strip[..., :3], rgb, casting='unsafe')
+
+    @staticmethod
+    def _adjust_color_uint8(strip, factor):
+        """ImageEnhance.Color: blend each pixel with its gray level, truncating as PIL"""
+        gray = _scratch('gray', strip.shape[:2], np.float32)
+        value = _scratch('value', strip.shape[:2], np.float32)
+        np.copyto(gray, _luma(strip, _scratch('luma', strip.shape[:2], np.uint32)), casting='unsafe')
+        factor = np.float32(factor)
+        for channel in range(3):
+            np.subtract(strip[..., channel], gray, out=value, dtype=np.float32)
+            value *= factor
+            value += gray
+            np.clip(value, 0, 255, out=value)
+            np.copyto(strip[..., channel], value, casting='unsafe')
+
+    def _composite_float(self, strip, y0, placed, opaque, color):
+        if not placed and color == 1.0:
+            return
+        y1 = y0 + strip.shape[0]
+        # Without a color adjustment only the area under the layers changes
+        left, right = 0, strip.shape[1]
+        if color == 1.0:
+            left = min(layer.x for layer in placed)
+            right = max(layer.x + layer.pixels.shape[1] for layer in placed)
+        target = strip[:, left:right]
+        canvas = _scratch('canvas', target.shape, np.float32)
+        np.copyto(canvas, target, casting='unsafe')
+        if not opaque:
+            canvas[..., :3] *= canvas[..., 3:] / 255
+        for layer in placed:
+            src, top = self._layer_rows(layer, y0, y1)
+            dst = canvas[top:top + src.shape[0], layer.x - left:layer.x - left + src.shape[1]]
+            alpha = _scratch('alpha', src.shape[:2] + (1,), np.float32)
+            tmp = _scratch('layer', src.shape, np.float32)
+            np.multiply(src[..., 3:], np.float32(1 / 255), out=alpha, dtype=np.float32)
+            np.copyto(tmp, src, casting='unsafe')
+            if not layer.premultiplied:
+                tmp[..., :3] *= alpha
+            dst *= 1 - alpha
+            dst += tmp
+        if not opaque:
+            np.divide(canvas[..., :3] * 255, canvas[..., 3:], out=canvas[..., :3], where=canvas[..., 3:] > 0)
+        if color != 1.0:
+            gray = _scratch('gray', canvas.shape[:2] + (1,), np.float32)
+            np.multiply(canvas[..., :1], np.float32(LUMA_WEIGHTS[0] / 65536), out=gray)
+            for channel in (1, 2):
+                gray += canvas[..., channel:channel + 1] * np.float32(LUMA_WEIGHTS[channel] / 65536)
+            canvas[..., :3] -= gray
+            canvas[..., :3] *= np.float32(color)
+            canvas[..., :3] += gray
+        np.rint(canvas, out=canvas)
+        np.clip(canvas, 0, 255, out=canvas)
+        np.copyto(target, canvas, casting='unsafe')
+
+    @staticmethod
+    def _adjust_contrast(out, mean, factor):
+        """ImageEnhance.Contrast as a lookup table, given the mean gray level"""
+        import cv2
+
+        mean = np.float32(int(mean + 0.5))
+        levels = np.arange(256, dtype=np.float32)
+        lut = np.clip(mean + np.float32(factor) * (levels - mean), 0, 255).astype(np.uint8)
+        table = np.dstack([lut, lut, lut, levels.astype(np.uint8)])
+        cv2.LUT(out, table, dst=out)
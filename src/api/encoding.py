@@ -0,0 +1,133 @@
+"""
+Output encoding for processed images.
+
+Images can be returned as PNG (with a tunable zlib level), WebP or JPEG, either
+base64-embedded in JSON or as parts of a streamed ``multipart/mixed`` body.
+PNGs can also be encoded strip by strip, so the encoded image never has to be
+held in memory at once.
+"""
+import base64
+import io
+import json
+import struct
+import uuid
+import zlib
+
+import numpy as np
+
+MEDIA_TYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+# Formats that keep the alpha channel; JPEG is only used for opaque images
+ALPHA_FORMATS = ('png', 'webp')
+
+
+def encode_image(image, output_format='png', quality=90, compress_level=6):
+    """
+    Encode a PIL image.
+    Args:
+        image (PIL.Image.Image): The image to encode.
+        output_format (str): One of 'png', 'webp' or 'jpeg'.
+        quality (int): WebP/JPEG quality (1-100).
+        compress_level (int): PNG zlib level (0-9); lower is faster and larger.
+    Returns:
+        tuple: The encoded bytes and their media type.
+    """
+    buffered = io.BytesIO()
+    if output_format == 'png':
+        image.save(buffered, format='PNG', compress_level=compress_level)
+    elif output_format == 'webp':
+        image.save(buffered, format='WEBP', quality=quality)
+    elif output_format == 'jpeg':
+        image.convert('RGB').save(buffered, format='JPEG', quality=quality)
+    else:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return buffered.getvalue(), MEDIA_TYPES[output_format]
+
+
+def encode_base64(image, output_format='png', quality=90, compress_level=6):
+    """Encode a PIL image as a base64 data URI"""
+    content, media_type = encode_image(image, output_format, quality, compress_level)
+    return f"data:{media_type};base64,{base64.b64encode(content).decode('utf-8')}"
+
+
+# PNG color types by PIL mode
+PNG_COLOR_TYPES = {'L': 0, 'RGB': 2, 'RGBA': 6}
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def _png_chunk(chunk_type, data):
+    crc = zlib.crc32(data, zlib.crc32(chunk_type))
+    return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', crc)
+
+
+def encode_png_strips(image, compress_level=6, strip_rows=256):
+    """
+    Yield a PNG encoding of image in chunks, strip_rows rows at a time.
+    Each strip is copied out of the image, filtered (PNG "Up" filter) and fed to
+    a streaming zlib compressor, so memory stays proportional to the strip
+    instead of the encoded file. Output is typically slightly larger than PIL's
+    adaptively filtered PNG.
+    """
+    if image.mode not in PNG_COLOR_TYPES:
+        image = image.convert('RGBA')
+    width, height = image.size
+    yield PNG_SIGNATURE
+    yield _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, PNG_COLOR_TYPES[image.mode], 0, 0, 0))
+
+    compressor = zlib.compressobj(compress_level)
+    previous = None
+    for top in range(0, height, strip_rows):
+        rows = np.asarray(image.crop((0, top, width, min(height, top + strip_rows)))).reshape(
+            min(strip_rows, height - top), -1
+        )
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        # uint8 arithmetic wraps modulo 256, as the filter requires
+        filtered[0, 1:] = rows[0] if previous is None else rows[0] - previous
+        filtered[1:, 1:] = rows[1:] - rows[:-1]
+        previous = rows[-1].copy()
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            yield _png_chunk(b'IDAT', data)
+    yield _png_chunk(b'IDAT', compressor.flush())
+    yield _png_chunk(b'IEND', b'')
+
+
+def multipart_boundary():
+    return uuid.uuid4().hex
+
+
+def multipart_part_header(boundary, media_type, name, filename=None, length=None):
+    """Header of one multipart/mixed body part; length may be unknown for streamed parts"""
+    disposition = f'attachment; name="{name}"'
+    if filename:
+        disposition += f'; filename="{filename}"'
+    header = (
+        f"--{boundary}\r\n"
+        f"Content-Type: {media_type}\r\n"
+        f"Content-Disposition: {disposition}\r\n"
+    )
+    if length is not None:
+        header += f"Content-Length: {length}\r\n"
+    return (header + "\r\n").encode('utf-8')
+
+
+def multipart_part(boundary, content, media_type, name, filename=None):
+    """Yield the chunks of one multipart/mixed body part without copying content"""
+    yield multipart_part_header(boundary, media_type, name, filename, len(content))
+    yield content
+    yield b"\r\n"
+
+
+def multipart_json_part(boundary, metadata):
+    """Yield the chunks of a JSON metadata part"""
+    return multipart_part(boundary, json.dumps(metadata).encode('utf-8'), 'application/json', 'metadata')
+
+
+def multipart_end(boundary):
+    return f"--{boundary}--\r\n".encode('utf-8')
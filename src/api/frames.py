@@ -0,0 +1,221 @@
+"""
+Image frames in shared memory, handed to worker processes by reference.
+
+Pickling a full-resolution image to a matting worker and the matte back copies
+each of them several times (into the pickle, through the pipe, out of it).
+A Frame is an array-shaped view of a multiprocessing.shared_memory segment
+instead: it pickles as the segment's name, so a worker attaches to the same
+memory, reads its input and writes its output in place. NumPy views, and PIL
+views for modes PIL stores as they are laid out (L, RGBA, RGBX), share the
+buffer without copying.
+
+Frames come from a FramePool, which recycles segments: acquire() a frame,
+release() it when done, or let pool.image() tie it to the lifetime of a PIL
+view so it is recycled once the image is garbage-collected. Released
+segments are kept for reuse up to max_idle_bytes and unlinked beyond that.
+With shared=False the pool hands out frames in ordinary process memory, for
+setups where shared memory is too small (e.g. a container's /dev/shm).
+"""
+import collections
+import threading
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+from PIL import Image
+
+# Modes PIL can view a buffer in without copying, and their channels
+VIEW_MODES = {'L': 1, 'RGBA': 4, 'RGBX': 4}
+
+# A released segment is reused for frames needing at least this share of it
+MIN_REUSE_FILL = 0.5
+
+
+class _SharedMemory(shared_memory.SharedMemory):
+    def __del__(self):
+        # Views may outlive the segment object at interpreter exit; the
+        # mapping then goes away with the process
+        try:
+            self.close()
+        except (OSError, BufferError):
+            pass
+
+
+class _Segment:
+    """A block of memory: a shared memory segment, or a bytearray when not shared"""
+
+    def __init__(self, nbytes, shared):
+        self.nbytes = nbytes
+        if shared:
+            self.shm = _SharedMemory(create=True, size=nbytes)
+            self.name = self.shm.name
+            self.buf = self.shm.buf
+        else:
+            self.shm = None
+            self.name = None
+            self.buf = memoryview(bytearray(nbytes))
+
+    @classmethod
+    def attach(cls, name):
+        segment = cls.__new__(cls)
+        segment.shm = _SharedMemory(name=name)
+        segment.name = name
+        segment.buf = segment.shm.buf
+        segment.nbytes = segment.shm.size
+        return segment
+
+    def close(self):
+        """Unmap the segment; False while views of it are still alive"""
+        if self.shm is None:
+            return True
+        try:
+            self.shm.close()
+        except BufferError:
+            return False
+        return True
+
+    def unlink(self):
+        if self.shm is not None:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class Frame:
+    """
+    An array of a given shape and dtype stored in a segment.
+    Pickles by reference when the segment is shared: unpickling attaches to
+    the same memory, which the receiver should close() when done with it.
+    """
+
+    def __init__(self, segment, shape, dtype=np.uint8):
+        self.segment = segment
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.nbytes = int(np.prod(self.shape)) * self.dtype.itemsize
+
+    @property
+    def array(self):
+        """A NumPy view of the frame"""
+        return np.ndarray(self.shape, self.dtype, buffer=self.segment.buf)
+
+    def image(self, mode):
+        """A PIL view of the frame; it shares the memory, so it is read-only"""
+        channels = VIEW_MODES.get(mode)
+        height, width = self.shape[:2]
+        if channels is None or self.dtype != np.uint8 or self.shape[2:] not in ((), (channels,)):
+            raise ValueError(f"a {self.shape} {self.dtype} frame cannot be viewed as {mode}")
+        return Image.frombuffer(mode, (width, height), self.segment.buf, 'raw', mode, 0, 1)
+
+    def close(self):
+        """Detach an unpickled frame from the memory (the owner's pool unlinks it)"""
+        return self.segment.close()
+
+    def __reduce__(self):
+        if self.segment.name is None:
+            raise TypeError("frames not in shared memory cannot be sent to another process")
+        return _attach, (self.segment.name, self.shape, self.dtype.str)
+
+
+def _attach(name, shape, dtype):
+    return Frame(_Segment.attach(name), shape, dtype)
+
+
+class FramePool:
+    """
+    Frames backed by recycled segments.
+    Args:
+        shared (bool): Put frames in shared memory, so they can be passed to
+            worker processes by reference.
+        max_idle_bytes (int): Released segments kept for reuse; beyond this
+            the least recently released ones are unlinked.
+    """
+
+    def __init__(self, shared=True, max_idle_bytes=256 * 1024 * 1024):
+        self.shared = shared
+        self.max_idle_bytes = max_idle_bytes
+        self._idle = collections.OrderedDict()
+        self._idle_bytes = 0
+        self._in_use = {}
+        # Appended to by finalizers, which must not take the lock
+        self._orphans = collections.deque()
+        self._closing = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, shape, dtype=np.uint8):
+        """A frame of shape and dtype; its contents are undefined"""
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        with self._lock:
+            self._collect()
+            # The smallest idle segment that fits without wasting most of it
+            fits = [s for s in self._idle.values() if nbytes <= s.nbytes and nbytes >= s.nbytes * MIN_REUSE_FILL]
+            if fits:
+                segment = min(fits, key=lambda s: s.nbytes)
+                del self._idle[id(segment)]
+                self._idle_bytes -= segment.nbytes
+                self.reused += 1
+            else:
+                segment = None
+        if segment is None:
+            segment = _Segment(nbytes, self.shared)
+            with self._lock:
+                self.created += 1
+        with self._lock:
+            self._in_use[id(segment)] = segment
+        return Frame(segment, shape, dtype)
+
+    def release(self, frame):
+        """Return a frame's segment for reuse; no views of the frame may be used afterwards"""
+        with self._lock:
+            self._release(frame.segment)
+            self._collect()
+
+    def image(self, frame, mode):
+        """A PIL view of frame (see Frame.image); the frame is released once the image is collected"""
+        image = frame.image(mode)
+        weakref.finalize(image, self._orphans.append, frame.segment)
+        return image
+
+    def stats(self):
+        with self._lock:
+            self._collect()
+            return {
+                "shared": self.shared,
+                "in_use": len(self._in_use),
+                "in_use_bytes": sum(s.nbytes for s in self._in_use.values()),
+                "idle": len(self._idle),
+                "idle_bytes": self._idle_bytes,
+                "created": self.created,
+                "reused": self.reused,
+            }
+
+    def close(self):
+        """Unlink every segment; frames still in use stay readable until released"""
+        with self._lock:
+            self._collect()
+            for segment in list(self._idle.values()) + list(self._in_use.values()):
+                segment.unlink()
+            self._closing.extend(self._idle.values())
+            self._idle.clear()
+            self._idle_bytes = 0
+            self._collect()
+
+    def _release(self, segment):
+        if self._in_use.pop(id(segment), None) is None:
+            return
+        self._idle[id(segment)] = segment
+        self._idle_bytes += segment.nbytes
+        while self._idle_bytes > self.max_idle_bytes:
+            _, evicted = self._idle.popitem(last=False)
+            self._idle_bytes -= evicted.nbytes
+            evicted.unlink()
+            self._closing.append(evicted)
+
+    def _collect(self):
+        """Release segments of collected images; unmap unlinked ones no longer viewed"""
+        while self._orphans:
+            self._release(self._orphans.popleft())
+        self._closing = [segment for segment in self._closing if not segment.close()]
@@ -1,91 +1,181 @@
-import streamlit as st
+"""
+Image processing functions shared by the FastAPI server and the Streamlit app.
+
+This module must stay free of UI code and heavy imports at module level so the
+API server can import it cheaply. OpenCV is imported inside the functions that
+need it.
+"""
+import functools
+
 from PIL import Image, ImageEnhance, ImageFilter
 import numpy as np
-import cv2
-import io
-import requests
-import os
-from transparent_background import Remover
-
-def download_cascade_file():
-    """Download the license plate cascade classifier if not exists"""
-    cascade_path = 'haarcascade_russian_plate_number.xml'
-    if not os.path.exists(cascade_path):
-        url = 'https://raw.githubusercontent.com/opencv/opencv/master/data/haarcascades/haarcascade_russian_plate_number.xml'
-        response = requests.get(url)
-        with open(cascade_path, 'wb') as f:
-            f.write(response.content)
-    return cascade_path
+
+# Blur radius of the car shadow
+SHADOW_BLUR_RADIUS = 20
+
+# Transparent pixels kept around the car when working on its region only:
+# enough for the shadow blur (PIL's Gaussian blur reaches about 3 radii) so the
+# region's edges stay fully transparent, exactly as in the full image
+REGION_MARGIN = 3 * SHADOW_BLUR_RADIUS + 4
+
+# Longest side of the alpha mask estimate_car_orientation works on
+ORIENTATION_MAX_SIDE = 512
+
+# Longest side of UI previews: each of the four Streamlit step columns is at
+# most a few hundred CSS pixels wide, so this still covers high-DPI screens
+PREVIEW_MAX_SIDE = 800
+
+
+@functools.lru_cache(maxsize=8)
+def _checkerboard_tile(square_size):
+    """One period of the checkerboard: light gray, white / white, darker gray squares"""
+    tile = np.full((2 * square_size, 2 * square_size, 4), 255, dtype=np.uint8)
+    # Light gray squares
+    tile[:square_size, :square_size, :3] = 235
+    # Darker gray squares for contrast
+    tile[square_size:, square_size:, :3] = 215
+    tile.setflags(write=False)
+    return tile
 
 
 def create_checkerboard(size, square_size=15):
+    """RGBA checkerboard of the given size, tiled from a cached base tile"""
     width, height = size
-    pattern = np.zeros((height, width, 4), dtype=np.uint8)
-    pattern.fill(255)
-    
-    # Create more visible checkerboard pattern
-    for i in range(0, height, square_size*2):
-        for j in range(0, width, square_size*2):
-            # Light gray squares
-            pattern[i:i+square_size, j:j+square_size] = [235, 235, 235, 255]
-            if i + square_size < height and j + square_size < width:
-                # Darker gray squares for contrast
-                pattern[i+square_size:i+square_size*2, j+square_size:j+square_size*2] = [215, 215, 215, 255]
-    
-    return Image.fromarray(pattern)
+    tile = _checkerboard_tile(square_size)
+    period = 2 * square_size
+    pattern = np.tile(tile, (-(-height // period), -(-width // period), 1))[:height, :width]
+    return Image.fromarray(np.ascontiguousarray(pattern))
 
 
-def blur_license_plate(image):
-    """Detect and blur license plate in the image"""
-    # Convert PIL Image to OpenCV format
-    img_cv = np.array(image)
-    img_cv = img_cv[:, :, :3]  # Remove alpha channel if exists
-    img_cv = cv2.cvtColor(img_cv, cv2.COLOR_RGB2BGR)
-    
-    # Load the cascade classifier
-    cascade_path = download_cascade_file()
-    plate_cascade = cv2.CascadeClassifier(cascade_path)
-    
-    # Detect license plates
-    plates = plate_cascade.detectMultiScale(img_cv, scaleFactor=1.1, minNeighbors=5)
-    
+def transparency_preview(image, max_side=PREVIEW_MAX_SIDE, square_size=15):
+    """
+    Show an RGBA image on a checkerboard, downscaled to display resolution.
+    Args:
+        image (PIL.Image.Image): The image with an alpha channel.
+        max_side (int): Longest side of the preview; images less than twice as
+            large keep their size.
+        square_size (int): Checkerboard square size in preview pixels.
+    Returns:
+        PIL.Image.Image: The RGBA preview.
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    scale = max_side / max(image.size)
+    # Images less than twice the preview size are cheap to composite as they are
+    if scale < 0.5:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Average 2x2 sampled source pixels per preview pixel: reads only a
+        # small part of a large image but still smooths the edges
+        image = image.resize((2 * size[0], 2 * size[1]), Image.Resampling.NEAREST)
+        image = image.convert('RGBa').reduce(2).convert('RGBA')
+    return Image.alpha_composite(create_checkerboard(image.size, square_size), image)
+
+
+def blur_license_plate(image, out=None):
+    """
+    Detect and blur license plate in the image.
+    Args:
+        image (PIL.Image.Image): The car photo.
+        out (numpy.ndarray): Optional (height, width, 3) uint8 array, such as
+            a shared-memory frame, that receives the blurred RGB pixels.
+    Returns:
+        PIL.Image.Image: The blurred image.
+    """
+    from plates import blur_regions, detect_plates
+
+    # Blurring is per channel, so the RGB array is used as is; no BGR round-trip
+    rgb = image if image.mode == 'RGB' else image.convert('RGB')
+    if out is None:
+        img = np.array(rgb)
+    else:
+        img = out
+        # Copied element-wise, so a view that is not C-contiguous gets the pixels too
+        np.copyto(img, np.asarray(rgb))
+
+    # Detect license plates on a downscaled copy, boxes are in full resolution
+    plates = detect_plates(img)
+
     # Blur each detected plate
-    for (x, y, w, h) in plates:
-        # Apply strong Gaussian blur to the plate region
-        roi = img_cv[y:y+h, x:x+w]
-        blurred = cv2.GaussianBlur(roi, (99, 99), 30)
-        img_cv[y:y+h, x:x+w] = blurred
-    
-    # Convert back to PIL Image
-    img_cv = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-    return Image.fromarray(img_cv)
+    blur_regions(img, plates)
+
+    return Image.fromarray(img)
+
+
+def shadow_alpha(alpha, top=0, height=None):
+    """
+    Compute the shadow opacity for a uint8 alpha channel.
+    Args:
+        alpha (np.ndarray): Alpha channel with shape (rows, width).
+        top (int): Row of the full car image that alpha starts at.
+        height (int): Height of the full car image; defaults to the alpha height.
+    """
+    height = height or alpha.shape[0]
+    # Shadow gets stronger near the bottom (0 at top, 1 at bottom)
+    ramp = (200 * ((top + np.arange(alpha.shape[0])) / height) ** 0.7).astype(np.uint8)
+    return np.where(alpha > 0, ramp[:, None], 0).astype(np.uint8)
 
 
-def create_realistic_shadow(car_image):
-    """Create a realistic shadow effect using PIL"""
+def reflection_rgba(rgba, reflection_height_ratio=0.3, fade_factor=0.6, opacity=1.0, height=None):
+    """
+    Compute the faded, lightened reflection pixels for a uint8 RGBA array.
+    Args:
+        rgba (np.ndarray): Car pixels with shape (rows, width, 4).
+        reflection_height_ratio (float): The height of the reflection as a ratio of car height.
+        fade_factor (float): How quickly the reflection fades (0.0 to 1.0).
+        opacity (float): Overall opacity of the reflection (0.0 to 1.0).
+        height (int): Height of the full car image when rgba only holds its
+            bottom rows; defaults to the rgba height.
+    Returns:
+        np.ndarray: The unblurred reflection with shape (reflection height, width, 4),
+            or only as many rows as rgba provides when it is a partial image.
+    """
+    rgba_rows, width = rgba.shape[:2]
+    height = height or rgba_rows
+    mask_height = int(height * reflection_height_ratio)
+    out_rows = mask_height if rgba_rows == height else min(mask_height, rgba_rows)
+    result = np.zeros((out_rows, width, 4), dtype=np.uint8)
+    rows = min(out_rows, rgba_rows)
+    if rows == 0:
+        return result
+
+    # Only the rows that survive the final crop of the flipped image are needed
+    flipped = rgba[::-1][:rows]
+
+    # Fade values per mask row, then looked up for each reflection row
+    mask_rows = (255 * (1 - (np.arange(mask_height) / mask_height) ** fade_factor)).astype(np.int64)
+    mask_y = ((np.arange(rows) / height) * mask_height).astype(np.int64)
+    mask_alpha = mask_rows[mask_y] / 255.0
+
+    visible = flipped[..., 3] > 0
+    # Apply both the mask fade and the overall opacity
+    new_alpha = (flipped[..., 3] * mask_alpha[:, None] * opacity).astype(np.uint8)
+    # Make the reflection colors lighter too
+    lighter = np.minimum(flipped[..., :3] * 1.2, 255).astype(np.uint8)
+
+    result[:rows, :, :3] = np.where(visible[..., None], lighter, 0)
+    result[:rows, :, 3] = np.where(visible, new_alpha, 0)
+    return result
+
+
+def create_realistic_shadow(car_image, blur_radius=SHADOW_BLUR_RADIUS, offset=5):
+    """
+    Create a realistic shadow effect using PIL
+    Args:
+        car_image (PIL.Image.Image): The car image with an alpha channel.
+        blur_radius (float): Shadow blur; smaller for cars rendered downscaled.
+        offset (int): How far the shadow is moved down, in pixels.
+    """
     # Convert to RGBA if not already
     car_image = car_image.convert('RGBA')
     width, height = car_image.size
 
-    # Create shadow mask from car alpha channel
-    shadow = Image.new('RGBA', car_image.size, (0, 0, 0, 0))
-    shadow_data = []
-    car_data = car_image.getdata()
-
-    for i, pixel in enumerate(car_data):
-        if pixel[3] > 0:  # If pixel is not transparent
-            # Calculate y position (0 at top, 1 at bottom)
-            y = (i // width) / height
-            # Shadow gets stronger near the bottom
-            opacity = int(200 * (y ** 0.7))  # Further increased shadow intensity
-            shadow_data.append((0, 0, 0, opacity))
-        else:
-            shadow_data.append((0, 0, 0, 0))
-
-    shadow.putdata(shadow_data)
+    # Create shadow mask from car alpha channel. The shadow is pure black, so only
+    # its alpha needs blurring and resizing; RGB stays zero through both steps.
+    alpha = np.asarray(car_image.getchannel('A'))
+    shadow = Image.fromarray(shadow_alpha(alpha), 'L')
 
     # Apply gaussian blur to the shadow
-    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=20))  # Adjusted blur
+    shadow = shadow.filter(ImageFilter.GaussianBlur(radius=blur_radius))  # Adjusted blur
 
     # Stretch the shadow vertically to create perspective effect
     shadow = shadow.resize((width, int(height * 1.1)), Image.LANCZOS)  # Less stretch for more realistic appearance
@@ -94,8 +184,10 @@ def create_realistic_shadow(car_image):
     result = Image.new('RGBA', car_image.size, (0, 0, 0, 0))
 
     # Place shadow with minimal offset to avoid floating appearance
-    shadow_crop = shadow.crop((0, 0, width, height))
-    result.paste(shadow_crop, (0, 5), shadow_crop)  # Reduced offset to make car appear grounded
+    shadow_mask = shadow.crop((0, 0, width, height))
+    black = Image.new('L', shadow_mask.size, 0)
+    shadow_crop = Image.merge('RGBA', (black, black, black, shadow_mask))
+    result.paste(shadow_crop, (0, offset), shadow_crop)  # Reduced offset to make car appear grounded
 
     # Add the car on top of the shadow
     result.paste(car_image, (0, 0), car_image)
@@ -116,54 +208,169 @@ def create_ground_reflection(car_image, reflection_height_ratio=0.3, fade_factor
         PIL.Image.Image: An RGBA image containing the reflection.
     """
     car_image = car_image.convert('RGBA')
-    width, height = car_image.size
 
-    # Flip the car image vertically for reflection
-    reflection = car_image.transpose(Image.FLIP_TOP_BOTTOM)
-
-    # Create a mask for fading the reflection
-    mask = Image.new('L', (width, int(height * reflection_height_ratio)), 0)
-    for y in range(mask.height):
-        alpha = int(255 * (1 - (y / mask.height) ** fade_factor))
-        for x in range(mask.width):
-            mask.putpixel((x, y), alpha)
-
-    # Apply the fading mask to the reflection's alpha channel
-    reflection_data = reflection.getdata()
-    reflection_faded_data = []
-    for i, pixel in enumerate(reflection_data):
-        if pixel[3] > 0:  # If original pixel is not transparent
-            y = i // width
-            # Calculate the corresponding y in the mask, scaled to reflection height
-            mask_y = int((y / height) * mask.height)
-            if mask_y < mask.height:
-                original_alpha = pixel[3]
-                mask_alpha = mask.getpixel((i % width, mask_y))
-                # Apply both the mask fade and the overall opacity
-                new_alpha = int(original_alpha * (mask_alpha / 255.0) * opacity)
-                # Make the reflection colors lighter too
-                reflection_faded_data.append((min(255, int(pixel[0] * 1.2)), 
-                                            min(255, int(pixel[1] * 1.2)), 
-                                            min(255, int(pixel[2] * 1.2)), 
-                                            new_alpha))
-            else:
-                reflection_faded_data.append((0, 0, 0, 0))  # Fully transparent outside reflection area
-        else:
-            reflection_faded_data.append((0, 0, 0, 0))
-
-    reflection.putdata(reflection_faded_data)
-
-    # Crop reflection to desired height and blur it
-    reflection = reflection.crop((0, 0, width, int(height * reflection_height_ratio)))
+    # Flip, fade and lighten the car pixels, cropped to the reflection height
+    reflection = reflection_rgba(
+        np.asarray(car_image),
+        reflection_height_ratio=reflection_height_ratio,
+        fade_factor=fade_factor,
+        opacity=opacity,
+    )
+    reflection = Image.fromarray(reflection, 'RGBA')
+
+    # Blur the cropped reflection
     reflection = reflection.filter(ImageFilter.GaussianBlur(radius=blur_radius))
 
     return reflection
 
 
+def car_bbox(image, padding=0):
+    """Bounding box of the non-transparent pixels of an RGBA image, or None"""
+    bbox = image.getchannel('A').getbbox()
+    if bbox is None or not padding:
+        return bbox
+    x0, y0, x1, y1 = bbox
+    return (max(0, x0 - padding), max(0, y0 - padding),
+            min(image.width, x1 + padding), min(image.height, y1 + padding))
+
+
+def car_region_box(bbox, source_size, size, margin=REGION_MARGIN):
+    """
+    Region of a car image resized from source_size to size that the car, its
+    shadow and its reflection can touch.
+    Args:
+        bbox (tuple): The car's bounding box in the source image.
+        source_size (tuple): (width, height) of the source image.
+        size (tuple): (width, height) the image is resized to.
+        margin (int): Transparent pixels to keep around the car.
+    Returns:
+        tuple: (x0, y0, x1, y1) in resized coordinates. The region always extends
+            to the bottom row, which the shadow stretch and reflection read.
+    """
+    scale_x = size[0] / source_size[0]
+    scale_y = size[1] / source_size[1]
+    # LANCZOS spreads a source pixel over 3 output pixels, more when upscaling
+    spread_x = 3 * max(1.0, scale_x) + 1
+    spread_y = 3 * max(1.0, scale_y) + 1
+    return (
+        max(0, int(bbox[0] * scale_x - spread_x) - margin),
+        max(0, int(bbox[1] * scale_y - spread_y) - margin),
+        min(size[0], int(np.ceil(bbox[2] * scale_x + spread_x)) + margin),
+        size[1],
+    )
+
+
+def resize_region(image, size, region, resample=Image.Resampling.LANCZOS):
+    """
+    Return one region of image.resize(size) without resizing the whole image.
+    Only the source pixels reachable by the resampling filter are cropped and
+    resized, so memory scales with the region rather than the full image.
+    Args:
+        image (PIL.Image.Image): The source image.
+        size (tuple): Full (width, height) the image would be resized to.
+        region (tuple): (x0, y0, x1, y1) of the wanted output pixels.
+    """
+    x0, y0, x1, y1 = region
+    scale_x = image.width / size[0]
+    scale_y = image.height / size[1]
+    box = (x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y)
+
+    # LANCZOS reaches 3 source pixels, or 3 output pixels when downscaling
+    support_x = 3 * max(1.0, scale_x) + 2
+    support_y = 3 * max(1.0, scale_y) + 2
+    crop = (
+        max(0, int(box[0] - support_x)),
+        max(0, int(box[1] - support_y)),
+        min(image.width, int(np.ceil(box[2] + support_x))),
+        min(image.height, int(np.ceil(box[3] + support_y))),
+    )
+    source = image.crop(crop)
+    return source.resize(
+        (x1 - x0, y1 - y0),
+        resample,
+        box=(box[0] - crop[0], box[1] - crop[1], box[2] - crop[0], box[3] - crop[1]),
+    )
+
+
+def create_realistic_shadow_region(car_region, top, height, blur_radius=SHADOW_BLUR_RADIUS, offset=5):
+    """
+    Region equivalent of create_realistic_shadow.
+    Args:
+        car_region (PIL.Image.Image): Rows top..height of a car image of the
+            given height, cropped horizontally to the car plus REGION_MARGIN.
+        top (int): First row of the region in the full car image.
+        height (int): Height of the full car image.
+        blur_radius (float): Shadow blur; at most SHADOW_BLUR_RADIUS, which
+            REGION_MARGIN is sized for. Smaller for cars rendered downscaled.
+        offset (int): How far the shadow is moved down, in pixels.
+    Returns:
+        PIL.Image.Image: The same pixels create_realistic_shadow would produce
+            for this region of the full car image.
+    """
+    car_region = car_region.convert('RGBA')
+    width, rows = car_region.size
+    result = Image.new('RGBA', car_region.size, (0, 0, 0, 0))
+
+    stretched_height = int(height * 1.1)
+    # Rows of the stretched shadow that land in the region after the offset
+    out_top = max(0, top - offset)
+    out_bottom = height - offset
+    if out_bottom > out_top:
+        # The stretch samples blurred rows above the region, which are empty but
+        # must exist so the filter is not clipped; 4 rows cover LANCZOS support
+        src_top = max(0, int(out_top * height / stretched_height) - 4)
+        alpha = np.zeros((height - src_top, width), dtype=np.uint8)
+        alpha[top - src_top:] = shadow_alpha(np.asarray(car_region.getchannel('A')), top=top, height=height)
+
+        shadow = Image.fromarray(alpha, 'L')
+        shadow = shadow.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+        shadow = shadow.resize(
+            (width, out_bottom - out_top),
+            Image.LANCZOS,
+            box=(0, out_top * height / stretched_height - src_top,
+                 width, out_bottom * height / stretched_height - src_top),
+        )
+
+        black = Image.new('L', shadow.size, 0)
+        shadow_crop = Image.merge('RGBA', (black, black, black, shadow))
+        result.paste(shadow_crop, (0, out_top + offset - top), shadow_crop)
+
+    # Add the car on top of the shadow
+    result.paste(car_region, (0, 0), car_region)
+
+    return result
+
+
+def create_ground_reflection_region(car_region, height, reflection_height_ratio=0.3, fade_factor=0.6,
+                                    blur_radius=5, opacity=1.0):
+    """
+    Region equivalent of create_ground_reflection.
+    Args:
+        car_region (PIL.Image.Image): The bottom rows of a car image of the given
+            height, cropped horizontally to the car plus REGION_MARGIN.
+        height (int): Height of the full car image.
+        Other arguments are as for create_ground_reflection.
+    Returns:
+        PIL.Image.Image: The top rows of the reflection create_ground_reflection
+            would produce, for the same columns. Rows further down are empty.
+    """
+    reflection = reflection_rgba(
+        np.asarray(car_region.convert('RGBA')),
+        reflection_height_ratio=reflection_height_ratio,
+        fade_factor=fade_factor,
+        opacity=opacity,
+        height=height,
+    )
+    reflection = Image.fromarray(reflection, 'RGBA')
+    return reflection.filter(ImageFilter.GaussianBlur(radius=blur_radius))
+
+
 def detect_car_angle(image):
     """Detect car angle and orientation"""
-    # Convert to numpy array and get grayscale
-    img_np = np.array(image)
+    import cv2
+
+    # Read-only view of the pixels and grayscale
+    img_np = np.asarray(image)
     if img_np.shape[2] == 4:  # RGBA
         gray = cv2.cvtColor(img_np[:,:,:3], cv2.COLOR_RGB2GRAY)
         mask = img_np[:,:,3] > 0
@@ -201,6 +408,92 @@ def detect_car_angle(image):
     return angle, orientation
 
 
+def estimate_car_orientation(image, max_side=ORIENTATION_MAX_SIDE, bbox=None):
+    """
+    Estimate car angle and orientation from the alpha matte.
+    A fast alternative to detect_car_angle: the rectangle is fitted to the
+    outline of the thresholded alpha channel, sampled down to at most max_side
+    pixels, instead of to Canny edges of the full-resolution image.
+    Args:
+        image (PIL.Image.Image): The car with a transparent background.
+        max_side (int): Longest side of the sampled mask.
+        bbox (tuple): The car's bounding box if already known (see car_bbox);
+            sampling only the box keeps more detail of small cars.
+    Returns:
+        tuple: (angle, orientation, confidence). angle and orientation are as
+            for detect_car_angle. confidence (0 to 1) is the share of the mask
+            inside the fitted outline, lowered when the aspect ratio is close
+            to the side/front threshold.
+    """
+    import cv2
+
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    box = bbox or (0, 0, image.width, image.height)
+    box_w, box_h = box[2] - box[0], box[3] - box[1]
+    scale = min(1.0, max_side / max(box_w, box_h))
+    size = (max(1, round(box_w * scale)), max(1, round(box_h * scale)))
+    # Nearest sampling only reads the pixels it keeps, however large the image
+    alpha = image.resize(size, Image.Resampling.NEAREST, box=box).getchannel('A')
+    mask = np.where(np.asarray(alpha) > 127, 255, 0).astype(np.uint8)
+    # A transparent border keeps outlines closed where the car touches the box
+    mask = cv2.copyMakeBorder(mask, 1, 1, 1, 1, cv2.BORDER_CONSTANT, value=0)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return 0, 'front', 0.0
+    main_contour = max(contours, key=cv2.contourArea)
+    rect = cv2.minAreaRect(main_contour)
+    width, height = rect[1]
+    if min(width, height) == 0:
+        return 0, 'front', 0.0
+
+    # OpenCV reports angles in (0, 90]; an upright rectangle can also come back
+    # as 0 (or -0), which is the same rectangle
+    angle = rect[2] if rect[2] > 0 else 90.0
+    # Sampling jitter can make a slightly tilted rectangle fit marginally
+    # better than the upright one; keep upright unless it is larger by more
+    # than two sampled pixels on each side
+    _, _, upright_w, upright_h = cv2.boundingRect(main_contour)
+    tolerance = 2 / upright_w + 2 / upright_h
+    if upright_w * upright_h <= width * height * (1 + tolerance):
+        angle, width, height = 90.0, upright_h, upright_w
+    aspect_ratio = max(width, height) / min(width, height)
+    orientation = 'side' if aspect_ratio > 2 else 'front'
+    coverage = min(1.0, cv2.contourArea(main_contour) / np.count_nonzero(mask))
+    decisiveness = min(1.0, abs(aspect_ratio - 2) / 0.5)
+    return angle, orientation, round(coverage * decisiveness, 3)
+
+
+def reflection_offset(angle):
+    """
+    How far above the bottom of the car the reflection starts, by car angle.
+    Returns:
+        tuple: The offset in pixels and a label of the angle range.
+    """
+    # Clear logical ranges for reflection positioning
+    if angle == 0:
+        return 200, 'Front view'
+    elif angle > 0 and angle < 5:
+        return 180, 'Front view'
+    elif angle >= 5 and angle < 10:  # Very small angles (front view)
+        return 390, 'Front view'
+    elif angle >= 10 and angle < 12:  # Special case for angles between 10-12
+        return 440, 'Special case 10-12'
+    elif angle >= 12 and angle < 70:  # Medium angles
+        return 490, 'Medium'
+    elif angle >= 70 and angle < 80:  # Side view angles
+        return 190, 'Side view'
+    elif angle >= 80 and angle < 85:  # Side view angles
+        return 370, 'Side view'
+    elif angle >= 85 and angle < 90:  # Side view angles
+        return 120, 'Side view'
+    elif angle >= 90 and angle < 110:  # Side view angles
+        return 150, 'Side view'
+    else:  # angle >= 110, large angles
+        return 400, 'Large'
+
+
 def resize_and_center(image, target_size):
     """Resize and center an image on a background of target size while preserving all content"""
     # Get dimensions
@@ -220,12 +513,18 @@ def resize_and_center(image, target_size):
     
     # Resize image using high-quality resampling
     # Use BICUBIC for better detail preservation
-    resized_image = image.resize((new_w, new_h), Image.Resampling.BICUBIC)
+    resized_image = image
+    if (new_w, new_h) != image.size:
+        resized_image = image.resize((new_w, new_h), Image.Resampling.BICUBIC)
     
     # Apply sharpening to maintain detail
     enhancer = ImageEnhance.Sharpness(resized_image)
     resized_image = enhancer.enhance(1.2)  # Slight sharpening
     
+    # Already filling the target: the sharpened image is the result
+    if (new_w, new_h) == tuple(target_size):
+        return resized_image if resized_image.mode == 'RGBA' else resized_image.convert('RGBA')
+    
     # Create new image with target size (transparent background)
     new_image = Image.new('RGBA', target_size, (0, 0, 0, 0))
     
@@ -237,180 +536,3 @@ def resize_and_center(image, target_size):
     new_image.paste(resized_image, (x, y))
     
     return new_image
-
-# Custom CSS to improve layout
-st.markdown("""
-<style>
-    .stApp {
-        max-width: 1200px;
-        margin: 0 auto;
-    }
-    .step-header {
-        font-size: 1.1em;
-        margin-bottom: 10px;
-        color: #262730;
-        text-align: center;
-    }
-    .step-container {
-        background-color: #f0f2f6;
-        border-radius: 10px;
-        padding: 10px;
-        margin: 5px;
-    }
-</style>
-""", unsafe_allow_html=True)
-
-# Streamlit UI
-st.title("Background Replacement App")
-
-# Upload section with better spacing
-st.markdown("### Upload Images")
-upload_cols = st.columns([1, 0.2, 1])
-with upload_cols[0]:
-    foreground_file = st.file_uploader("Foreground (Car) Image", type=["jpg", "png", "jpeg", "webp"])
-with upload_cols[2]:
-    background_file = st.file_uploader("Background Image", type=["jpg", "png", "jpeg", "webp"])
-
-if foreground_file is not None:
-    # Load foreground image
-    foreground = Image.open(foreground_file)
-    
-    # Add spacing
-    st.markdown("### Processing Steps")
-    
-    # Create columns for processing steps with spacing
-    cols = st.columns([1, 0.05, 1, 0.05, 1, 0.05, 1])
-    
-    # Step 1: Original
-    with cols[0]:
-        st.markdown("<p class='step-header'>1. Original</p>", unsafe_allow_html=True)
-        with st.container():
-            st.image(foreground, use_container_width=True)
-    
-    # Step 2: Plate Blurred
-    with cols[2]:
-        st.markdown("<p class='step-header'>2. Plate Blurred</p>", unsafe_allow_html=True)
-        with st.container():
-            foreground_blurred = blur_license_plate(foreground)
-            st.image(foreground_blurred, use_container_width=True)
-            foreground = foreground_blurred
-    
-    # Step 3: Background Removed
-    with cols[4]:
-        st.markdown("<p class='step-header'>3. Background Removed</p>", unsafe_allow_html=True)
-        with st.container():
-            with st.spinner('Processing...'):
-                # Initialize remover with CPU device
-                remover = Remover(mode='base')  # Use base mode for better quality
-                
-                # Convert PIL to numpy array
-                img_array = np.array(foreground)
-                
-                # Remove background and get mask with shadow preservation
-                # Lower threshold for better detail preservation
-                output = remover.process(img_array, threshold=0.75)
-                
-                # Convert back to PIL Image
-                foreground_removed = Image.fromarray(output)
-                
-                # Create checkerboard background
-                checkerboard = create_checkerboard(foreground_removed.size)
-                
-                # Composite the image onto checkerboard for preview
-                preview = Image.alpha_composite(checkerboard, foreground_removed)
-                
-                # Show preview with checkerboard background
-                st.image(preview, use_container_width=True)
-    
-    # Step 4: Final Result
-    with cols[6]:
-        st.markdown("<p class='step-header'>4. Final Result</p>", unsafe_allow_html=True)
-        if background_file is not None:
-            background = Image.open(background_file)
-            background = background.convert('RGBA')
-            background = background.resize(foreground.size, Image.Resampling.LANCZOS)
-            foreground_removed = resize_and_center(foreground_removed, background.size)
-            
-            # Detect car angle and orientation
-            angle, orientation = detect_car_angle(foreground_removed)
-            st.markdown(f"<p class='step-header'>Car Angle: {orientation.title()}, {angle:.1f}°</p>", unsafe_allow_html=True)
-            
-            # Resize foreground to be slightly smaller (80% of background height)
-            bg_w, bg_h = background.size
-            target_height = int(bg_h * 0.8)
-            scale = target_height / foreground_removed.size[1]
-            new_width = int(foreground_removed.size[0] * scale)
-            
-            foreground_resized = foreground_removed.resize(
-                (new_width, target_height),
-                Image.Resampling.LANCZOS
-            )
-            
-            # Center the car horizontally and place it lower to avoid floating appearance
-            paste_x = (bg_w - new_width) // 2
-            paste_y = (bg_h - target_height) // 2 + int(bg_h * 0.02)  # Slight downward shift to ground the car
-            
-            # Create shadow and reflection
-            shadowed_car = create_realistic_shadow(foreground_resized)
-            reflection = create_ground_reflection(
-                foreground_resized, 
-                reflection_height_ratio=0.6,  # 70% of car height for reflection
-                fade_factor=0.6,              # Fade factor (higher = faster fade)
-                blur_radius=8,               # Blur amount for reflection
-                opacity=0.8                   # Overall opacity (lower = lighter reflection)
-            )
-            
-            # Create final composite
-            final_image = background.copy()
-            
-            # Paste shadow and car
-            final_image.paste(shadowed_car, (paste_x, paste_y), shadowed_car)
-            
-            # Paste reflection directly below the car with no gap
-            # Adjust reflection position based on car angle
-            print(angle)
-            if angle < 70 and angle > 10:
-                reflection_y = paste_y + target_height - 150 
-            elif angle < 10 or angle > 9:
-                reflection_y = paste_y + target_height - 390  # Less overlap for smaller angles
-            elif angle > 70 and angle < 110:
-                reflection_y = paste_y + target_height - 390  # More space for larger angles
-            elif angle > 110:
-                reflection_y = paste_y + target_height - 400  # More space for larger angles
-            final_image.paste(reflection, (paste_x, reflection_y), reflection)
-            
-            # Apply final enhancements
-            final_image = ImageEnhance.Color(final_image).enhance(1.1)      # Increase color saturation
-            final_image = ImageEnhance.Contrast(final_image).enhance(1.05)  # Slightly increase contrast
-            
-            with st.container():
-                st.image(final_image, use_container_width=True)
-            
-            # Download section
-            st.markdown("""<div style='height: 10px'></div>""", unsafe_allow_html=True)
-            download_cols = st.columns(2)
-            
-            with download_cols[0]:
-                img_byte_arr = io.BytesIO()
-                final_image.save(img_byte_arr, format='PNG')
-                img_byte_arr = img_byte_arr.getvalue()
-                st.download_button(
-                    label="⬇️ Final Image",
-                    data=img_byte_arr,
-                    file_name="final_image.png",
-                    mime="image/png"
-                )
-            
-            with download_cols[1]:
-                fg_byte_arr = io.BytesIO()
-                foreground_removed.save(fg_byte_arr, format='PNG')
-                fg_byte_arr = fg_byte_arr.getvalue()
-                st.download_button(
-                    label="⬇️ Car Only",
-                    data=fg_byte_arr,
-                    file_name="car_only.png",
-                    mime="image/png",
-                    key="fg_download"
-                )
-        else:
-            st.info("👆 Upload a background image")
@@ -4,23 +4,49 @@
 
 const API_URL = 'http://localhost:8000/api';
 
+// How often a full render's job is polled; each poll waits server-side
+const JOB_WAIT_SECONDS = 10;
+
+export interface JobStatus {
+  job_id: string;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  error?: string;
+  results?: Record<string, string>;
+  car_angle?: number;
+  car_orientation?: string;
+}
+
 export interface ProcessedImages {
   success: boolean;
   car_only: string;
   final_image?: string;
   car_angle?: number;
   car_orientation?: string;
+  preset?: string;
+  // Job rendering the full-resolution result; null when this already is it
+  full_render?: JobStatus | null;
+  // File extension of each full-render object URL, from its content type
+  extensions?: Record<string, string>;
+}
+
+export interface ProcessOptions {
+  // Resolution and encoding preset: thumbnail, web or print (default)
+  preset?: string;
+  // Also queue the full-resolution render, see waitForFullRender
+  fullRender?: boolean;
 }
 
 /**
  * Process foreground and background images
  * @param foreground The car image
  * @param background Optional background image
+ * @param options Preset and whether to queue the full render
  * @returns Processed images as base64 strings
  */
 export const processImages = async (
   foreground: File,
-  background?: File
+  background?: File,
+  options: ProcessOptions = {}
 ): Promise<ProcessedImages> => {
   const formData = new FormData();
   formData.append('foreground', foreground);
@@ -28,6 +54,12 @@ export const processImages = async (
   if (background) {
     formData.append('background', background);
   }
+  if (options.preset) {
+    formData.append('preset', options.preset);
+  }
+  if (options.fullRender) {
+    formData.append('full_render', 'true');
+  }
   
   try {
     const response = await fetch(`${API_URL}/process-images`, {
@@ -46,3 +78,52 @@ export const processImages = async (
     throw error;
   }
 };
+
+/**
+ * Wait for the full render queued by processImages
+ * @param job The full_render status of a processImages response
+ * @param signal Aborts waiting, e.g. when new images are selected
+ * @returns The full-resolution images as object URLs, and the car angle;
+ *   the caller revokes the URLs once they are no longer shown
+ */
+export const waitForFullRender = async (
+  job: JobStatus,
+  signal?: AbortSignal
+): Promise<ProcessedImages> => {
+  while (job.status !== 'done') {
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Full render failed');
+    }
+    const response = await fetch(`${API_URL}/jobs/${job.job_id}?wait=${JOB_WAIT_SECONDS}`, { signal });
+    if (!response.ok) {
+      throw new Error('Failed to get the full render status');
+    }
+    job = await response.json();
+  }
+
+  const extensions: Record<string, string> = {};
+  const fetchResult = async (name: string) => {
+    const path = job.results?.[name];
+    if (!path) {
+      return undefined;
+    }
+    // Result paths are relative to the server root, API_URL ends in /api
+    const response = await fetch(`${API_URL.replace(/\/api$/, '')}${path}`, { signal });
+    if (!response.ok) {
+      throw new Error(`Failed to download ${name}`);
+    }
+    const blob = await response.blob();
+    extensions[name] = blob.type.match(/^image\/(\w+)/)?.[1] || 'png';
+    return URL.createObjectURL(blob);
+  };
+
+  return {
+    success: true,
+    car_only: (await fetchResult('car_only')) || '',
+    final_image: await fetchResult('final_image'),
+    car_angle: job.car_angle,
+    car_orientation: job.car_orientation,
+    full_render: null,
+    extensions,
+  };
+};
@@ -0,0 +1,120 @@
+"""
+Upload ingestion: validate image headers first, then decode at the size needed.
+
+Uploads are read from the temporary files the multipart parser spooled them
+to rather than copied into memory as a whole. Headers are checked before any
+pixel data is decoded, so oversized or unreadable images are rejected without
+the cost of decoding them. When the caller knows the size an image will be
+resized to, JPEGs are decoded at a reduced scale (draft mode: 1/2, 1/4 or 1/8
+of full resolution, never smaller than the target), which cuts decode time and
+memory by the square of that factor. EXIF orientation is applied, so phone
+photos come out upright.
+"""
+import io
+
+from PIL import Image, ImageOps
+
+# EXIF tag of the orientation, and the orientations that swap width and height
+ORIENTATION_TAG = 0x0112
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+# Formats with a reduced-resolution decoder (MPO is how PIL reports many phone JPEGs)
+DRAFT_FORMATS = ('JPEG', 'MPO')
+
+
+class InvalidImage(ValueError):
+    """Raised for uploads that are not a readable image"""
+
+
+class ImageTooLarge(ValueError):
+    """Raised for uploads with more pixels than allowed"""
+
+
+def _rewind(source):
+    """A readable file positioned at the start, for upload bytes or a file"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def open_image(source, max_pixels):
+    """
+    Open an image and check its header, without decoding pixel data.
+    Args:
+        source (bytes or file): The upload.
+        max_pixels (int): Largest width * height accepted.
+    Returns:
+        PIL.Image.Image: The lazily loaded image.
+    """
+    try:
+        image = Image.open(_rewind(source))
+    except (OSError, SyntaxError, ValueError):
+        raise InvalidImage("Upload is not a readable image")
+    if image.width * image.height > max_pixels:
+        raise ImageTooLarge(f"Image is {image.width}x{image.height}, more than the {max_pixels} pixel limit")
+    return image
+
+
+def orientation(image):
+    """EXIF orientation of an opened image, 1 (upright) when absent"""
+    try:
+        return image.getexif().get(ORIENTATION_TAG, 1)
+    except (OSError, SyntaxError, ValueError):
+        return 1
+
+
+def fit_size(size, max_side):
+    """size scaled down, keeping its aspect ratio, so neither side exceeds max_side"""
+    width, height = size
+    if not max_side or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def decode_image(source, max_pixels, target_size=None):
+    """
+    Decode an upload, upright.
+    Args:
+        source (bytes or file): The upload.
+        max_pixels (int): Largest width * height accepted.
+        target_size (tuple): (width, height) the caller will resize the image
+            to, if known. JPEGs are then decoded at the smallest scale that is
+            still at least this large.
+    Returns:
+        PIL.Image.Image: The fully loaded image, EXIF orientation applied.
+    """
+    image = open_image(source, max_pixels)
+    rotation = orientation(image)
+    if target_size is not None and image.format in DRAFT_FORMATS:
+        width, height = target_size
+        if rotation in TRANSPOSED_ORIENTATIONS:
+            # The target is upright; the stored image is not yet
+            width, height = height, width
+        image.draft(image.mode, (width, height))
+    try:
+        image.load()
+    except (OSError, SyntaxError, ValueError) as e:
+        raise InvalidImage(f"Could not decode image: {e}")
+    if rotation != 1:
+        image = ImageOps.exif_transpose(image)
+    return image
+
+
+def decode_fitted(source, max_pixels, max_side):
+    """
+    Decode an upload, upright and scaled down to fit within max_side.
+    JPEGs are decoded at a reduced scale first, the rest is a LANCZOS resize.
+    Returns:
+        PIL.Image.Image: The image, at most max_side on its longest side.
+    """
+    image = open_image(source, max_pixels)
+    width, height = image.size
+    if orientation(image) in TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    size = fit_size((width, height), max_side)
+    image = decode_image(source, max_pixels, size)
+    if image.size != size:
+        image = image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+    return image
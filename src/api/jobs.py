@@ -0,0 +1,512 @@
+"""
+Persistent job queue for asynchronous processing of large batches.
+
+Jobs live in a SQLite database next to their input and output files, so the
+queue survives restarts and needs no broker. Worker processes claim jobs with
+a lease they keep renewing while they work; a job whose worker died is claimed
+again once its lease expires. Failed attempts are retried with exponential
+backoff, up to max_attempts.
+
+A job's id is a hash of its inputs and options, so submitting the same photos
+with the same options again returns the existing job (and its results) rather
+than queueing the work twice. Resubmitting a failed job queues it again.
+
+Workers can run inside the API server (JobWorkers) or on their own:
+
+    python jobs.py --workers 4
+
+Handlers and initializers are given as "module:callable" strings and imported
+by each worker process.
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Job states; done and failed are final
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+STATES = (QUEUED, RUNNING, DONE, FAILED)
+
+# Read size when copying and hashing inputs
+COPY_CHUNK_BYTES = 1 << 20
+
+# How long an idle worker sleeps before looking for jobs again
+POLL_SECONDS = 0.5
+
+# How often an idle worker deletes finished jobs past their retention
+PURGE_INTERVAL_SECONDS = 60
+
+# The queue of the server and of `python jobs.py`: its database, inputs and
+# results live in JOBS_DIR. Failed attempts are retried up to
+# JOB_MAX_ATTEMPTS times, backing off from JOB_RETRY_SECONDS; a job is
+# claimed again JOB_LEASE_SECONDS after its worker stops renewing the lease.
+JOBS_DIR = os.environ.get('JOBS_DIR') or os.path.join(tempfile.gettempdir(), 'car-jobs')
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_RETRY_SECONDS = float(os.environ.get('JOB_RETRY_SECONDS', 5))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+JOB_RETENTION_HOURS = float(os.environ.get('JOB_RETENTION_HOURS', 24))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    options TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker TEXT,
+    error TEXT,
+    result TEXT,
+    outputs TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, available_at);
+"""
+
+
+class JobStore:
+    """
+    Jobs, their inputs and their outputs under one directory.
+    Args:
+        directory (str): Holds jobs.sqlite3 and one subdirectory per job.
+        max_attempts (int): Attempts before a job is marked failed.
+        retry_seconds (float): Delay before the first retry; doubles with each attempt.
+        lease_seconds (float): How long a claimed job stays with its worker
+            without a heartbeat before another worker may claim it.
+        retention_seconds (float): Finished jobs older than this are deleted
+            by purge(); 0 keeps them.
+    Every call opens its own connection, so a store can be shared by threads
+    and each process can open its own on the same directory.
+    """
+
+    def __init__(self, directory, max_attempts=3, retry_seconds=5.0, lease_seconds=60.0, retention_seconds=0):
+        self.directory = directory
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.lease_seconds = lease_seconds
+        self.retention_seconds = retention_seconds
+        self.path = os.path.join(directory, 'jobs.sqlite3')
+        os.makedirs(os.path.join(directory, 'incoming'), exist_ok=True)
+        with self._connect() as db:
+            # Readers do not block the writer (or each other) in WAL mode
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        return _Connection(db)
+
+    def job_dir(self, job_id):
+        return os.path.join(self.directory, job_id)
+
+    def output_path(self, job_id, name):
+        return os.path.join(self.job_dir(job_id), f"out-{name}")
+
+    def submit(self, inputs, options):
+        """
+        Queue a job, or return the existing one for the same inputs and options.
+        Args:
+            inputs (dict): Name -> upload bytes or file. Copied into the store.
+            options (dict): JSON-serializable options passed to the handler.
+        Returns:
+            tuple: (job dict, whether a new job was queued)
+        """
+        options_json = json.dumps(options, sort_keys=True)
+        sha = hashlib.sha256(options_json.encode('utf-8'))
+        staged = {}
+        try:
+            for name in sorted(inputs):
+                sha.update(name.encode('utf-8') + b'\0')
+                staged[name] = self._stage(inputs[name], sha)
+            job_id = sha.hexdigest()[:32]
+
+            job = self.get(job_id)
+            if job is not None and job['status'] != FAILED:
+                return job, False
+            os.makedirs(self.job_dir(job_id), exist_ok=True)
+            for name, path in staged.items():
+                os.replace(path, os.path.join(self.job_dir(job_id), f"in-{name}"))
+            staged = {}
+        finally:
+            for path in staged.values():
+                os.unlink(path)
+
+        now = time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            created = db.execute(
+                'INSERT OR IGNORE INTO jobs (id, status, inputs, options, available_at, created_at, updated_at)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, json.dumps(sorted(inputs)), options_json, now, now, now),
+            ).rowcount == 1
+            if not created:
+                # Only a failed job gets here: start it over
+                created = db.execute(
+                    'UPDATE jobs SET status = ?, attempts = 0, available_at = ?, error = NULL, updated_at = ?'
+                    ' WHERE id = ? AND status = ?',
+                    (QUEUED, now, now, job_id, FAILED),
+                ).rowcount == 1
+        return self.get(job_id), created
+
+    def _stage(self, source, sha):
+        """Copy an input into the store's incoming directory, hashing it as it is copied"""
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = _BytesReader(source)
+        else:
+            source.seek(0)
+        fd, path = tempfile.mkstemp(dir=os.path.join(self.directory, 'incoming'))
+        with os.fdopen(fd, 'wb') as f:
+            # Hash the length too, so input boundaries are unambiguous
+            size = 0
+            for chunk in iter(lambda: source.read(COPY_CHUNK_BYTES), b''):
+                sha.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+        sha.update(size.to_bytes(8, 'little'))
+        return path
+
+    def get(self, job_id):
+        """The job as a dict, or None if there is no such job"""
+        with self._connect() as db:
+            row = db.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return None if row is None else _job(row)
+
+    def claim(self, worker):
+        """Lease the oldest job that is ready to run to worker; None if there is none"""
+        while True:
+            now = time.time()
+            with self._connect() as db:
+                db.execute('BEGIN IMMEDIATE')
+                row = db.execute(
+                    'SELECT id, status, attempts FROM jobs'
+                    ' WHERE (status = ? AND available_at <= ?) OR (status = ? AND lease_until < ?)'
+                    ' ORDER BY available_at LIMIT 1',
+                    (QUEUED, now, RUNNING, now),
+                ).fetchone()
+                if row is None:
+                    return None
+                if row['status'] == RUNNING and row['attempts'] >= self.max_attempts:
+                    # Its last worker died while holding it
+                    db.execute(
+                        'UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+                        (FAILED, 'worker stopped responding', now, row['id']),
+                    )
+                    continue
+                db.execute(
+                    'UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, worker = ?, updated_at = ?'
+                    ' WHERE id = ?',
+                    (RUNNING, now + self.lease_seconds, worker, now, row['id']),
+                )
+            job = self.get(row['id'])
+            job['inputs'] = {name: os.path.join(self.job_dir(job['id']), f"in-{name}") for name in job['inputs']}
+            return job
+
+    def heartbeat(self, job_id, worker):
+        """Extend the lease of a running job; False if the worker no longer holds it"""
+        with self._connect() as db:
+            return db.execute(
+                'UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ? AND worker = ?',
+                (time.time() + self.lease_seconds, job_id, RUNNING, worker),
+            ).rowcount == 1
+
+    def complete(self, job_id, worker, result, outputs):
+        """
+        Store a job's outputs and mark it done.
+        Args:
+            result (dict): JSON-serializable metadata.
+            outputs (dict): Name -> (content bytes, media type).
+        Returns:
+            bool: False if the worker had lost the job to another one.
+        """
+        for name, (content, _) in outputs.items():
+            path = self.output_path(job_id, name)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(content)
+            os.replace(path + '.tmp', path)
+        with self._connect() as db:
+            return db.execute(
+                'UPDATE jobs SET status = ?, result = ?, outputs = ?, error = NULL, lease_until = NULL, updated_at = ?'
+                ' WHERE id = ? AND status = ? AND worker = ?',
+                (DONE, json.dumps(result), json.dumps({name: media for name, (_, media) in outputs.items()}),
+                 time.time(), job_id, RUNNING, worker),
+            ).rowcount == 1
+
+    def fail(self, job_id, worker, error, retry=True):
+        """Record a failed attempt: queue a retry after a backoff, or mark the job failed"""
+        now = time.time()
+        with self._connect() as db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute(
+                'SELECT attempts FROM jobs WHERE id = ? AND status = ? AND worker = ?', (job_id, RUNNING, worker)
+            ).fetchone()
+            if row is None:
+                return
+            if retry and row['attempts'] < self.max_attempts:
+                delay = self.retry_seconds * 2 ** (row['attempts'] - 1)
+                db.execute(
+                    'UPDATE jobs SET status = ?, available_at = ?, error = ?, lease_until = NULL, updated_at = ?'
+                    ' WHERE id = ?',
+                    (QUEUED, now + delay, error, now, job_id),
+                )
+            else:
+                db.execute(
+                    'UPDATE jobs SET status = ?, error = ?, lease_until = NULL, updated_at = ? WHERE id = ?',
+                    (FAILED, error, now, job_id),
+                )
+
+    def counts(self):
+        """Number of jobs in each state"""
+        with self._connect() as db:
+            rows = db.execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status').fetchall()
+        counts = dict.fromkeys(STATES, 0)
+        counts.update({row['status']: row['n'] for row in rows})
+        return counts
+
+    def purge(self):
+        """Delete finished jobs older than retention_seconds with their files; returns how many"""
+        if not self.retention_seconds:
+            return 0
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as db:
+            ids = [row['id'] for row in db.execute(
+                'SELECT id FROM jobs WHERE status IN (?, ?) AND updated_at < ?', (DONE, FAILED, cutoff)
+            )]
+            db.executemany('DELETE FROM jobs WHERE id = ?', [(job_id,) for job_id in ids])
+        for job_id in ids:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+        return len(ids)
+
+
+def default_store():
+    """The JobStore of JOBS_DIR and the other settings above"""
+    return JobStore(
+        JOBS_DIR,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        retry_seconds=JOB_RETRY_SECONDS,
+        lease_seconds=JOB_LEASE_SECONDS,
+        retention_seconds=JOB_RETENTION_HOURS * 3600,
+    )
+
+
+class _Connection:
+    """Closes the SQLite connection on exit (sqlite3's own context manager does not)"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.db.in_transaction:
+            if exc_type is None:
+                self.db.commit()
+            else:
+                self.db.rollback()
+        self.db.close()
+
+
+class _BytesReader:
+    def __init__(self, content):
+        self._view = memoryview(content)
+        self._offset = 0
+
+    def read(self, size):
+        chunk = bytes(self._view[self._offset:self._offset + size])
+        self._offset += len(chunk)
+        return chunk
+
+
+def _job(row):
+    job = dict(row)
+    for field in ('inputs', 'options', 'result', 'outputs'):
+        if job[field] is not None:
+            job[field] = json.loads(job[field])
+    return job
+
+
+def _import(reference):
+    module, name = reference.split(':')
+    return getattr(importlib.import_module(module), name)
+
+
+def limit_threads(threads):
+    """Give each worker process its share of the cores, before torch is imported"""
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[name] = str(threads)
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+
+def work(store_args, handler, initializer=None, initargs=(), threads=None, stop=None):
+    """
+    Worker process loop: claim jobs and run handler(inputs, options) on them.
+
+    The handler gets a dict of input name -> file path and the job's options,
+    and returns (result dict, outputs dict of name -> (bytes, media type)).
+    A ValueError means the input can never be processed, so the job fails
+    without retrying; other exceptions are retried.
+    Args:
+        store_args (dict): JobStore arguments.
+        handler (str): "module:callable" of the handler.
+        initializer (str): Optional "module:callable" run once with initargs.
+        threads (int): Threads for the image and model libraries of this process.
+        stop (multiprocessing.Event): Finish the current job and return once set.
+    """
+    if threads:
+        limit_threads(threads)
+    store = JobStore(**store_args)
+    handler = _import(handler)
+    if initializer:
+        _import(initializer)(*initargs)
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    logger.info('job worker %s ready', worker)
+
+    last_purge = 0.0
+    while stop is None or not stop.is_set():
+        job = store.claim(worker)
+        if job is None:
+            if time.monotonic() - last_purge > PURGE_INTERVAL_SECONDS:
+                store.purge()
+                last_purge = time.monotonic()
+            if stop is not None:
+                stop.wait(POLL_SECONDS)
+            else:
+                time.sleep(POLL_SECONDS)
+            continue
+        _run(store, worker, job, handler)
+
+
+def _run(store, worker, job, handler):
+    # Keep the lease while the handler runs, however long it takes
+    done = threading.Event()
+
+    def heartbeat():
+        while not done.wait(store.lease_seconds / 3):
+            store.heartbeat(job['id'], worker)
+
+    beat = threading.Thread(target=heartbeat, name='job-heartbeat', daemon=True)
+    beat.start()
+    start = time.perf_counter()
+    try:
+        result, outputs = handler(job['inputs'], job['options'])
+    except ValueError as e:
+        store.fail(job['id'], worker, str(e), retry=False)
+        logger.info('job %s rejected: %s', job['id'], e)
+        return
+    except Exception as e:
+        store.fail(job['id'], worker, f"{type(e).__name__}: {e}")
+        logger.exception('job %s attempt %d failed', job['id'], job['attempts'])
+        return
+    finally:
+        done.set()
+        beat.join()
+    store.complete(job['id'], worker, result, outputs)
+    logger.info('job %s done in %.2fs', job['id'], time.perf_counter() - start)
+
+
+class JobWorkers:
+    """
+    Worker processes draining a JobStore, spawned on demand.
+    Args:
+        store (JobStore): The queue; workers open their own store on its directory.
+        handler (str): "module:callable" run for each job (see work()).
+        count (int): Number of worker processes.
+        initializer (str): Optional "module:callable" each worker runs first.
+        initargs (tuple): Arguments of the initializer.
+    The cores are split evenly between the workers, so adding workers adds
+    throughput instead of oversubscribing the CPU.
+    """
+
+    def __init__(self, store, handler, count, initializer=None, initargs=()):
+        self.store_args = dict(
+            directory=store.directory,
+            max_attempts=store.max_attempts,
+            retry_seconds=store.retry_seconds,
+            lease_seconds=store.lease_seconds,
+            retention_seconds=store.retention_seconds,
+        )
+        self.handler = handler
+        self.count = count
+        self.initializer = initializer
+        self.initargs = initargs
+        self._context = multiprocessing.get_context('spawn')
+        self._stop = self._context.Event()
+        self._processes = []
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """Start the workers that are not running (not yet started, or died)"""
+        with self._lock:
+            self._processes = [p for p in self._processes if p.is_alive()]
+            threads = max(1, (os.cpu_count() or 1) // max(1, self.count))
+            for _ in range(self.count - len(self._processes)):
+                process = self._context.Process(
+                    target=work,
+                    args=(self.store_args, self.handler, self.initializer, self.initargs, threads, self._stop),
+                    name='job-worker',
+                    daemon=True,
+                )
+                process.start()
+                self._processes.append(process)
+
+    def alive(self):
+        with self._lock:
+            return sum(p.is_alive() for p in self._processes)
+
+    def stop(self, timeout=5.0):
+        """Ask the workers to stop after their current job; terminate them after timeout"""
+        self._stop.set()
+        with self._lock:
+            deadline = time.monotonic() + timeout
+            for process in self._processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+                if process.is_alive():
+                    # Its job is claimed again once the lease expires
+                    process.terminate()
+            self._processes = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run job workers outside the API server')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--handler', default='render:run_job')
+    parser.add_argument('--initializer', default='render:init_worker')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(processName)s %(message)s')
+
+    # The same settings as the server, read from the environment
+    from render import MATTING_WARM_MODES
+
+    workers = JobWorkers(default_store(), args.handler, args.workers, args.initializer, (MATTING_WARM_MODES,))
+    workers.ensure_running()
+    try:
+        while True:
+            time.sleep(PURGE_INTERVAL_SECONDS)
+            workers.ensure_running()
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""
+Background removal model access.
+
+The API server runs these functions inside dedicated worker processes (see
+pipeline.py), so each worker loads its own removers and requests never
+contend for a single model behind the GIL. The Streamlit app uses the same
+registry in its own process, so reruns reuse the loaded weights.
+
+Removers are loaded on first use and shared per (mode, device, jit): 'base'
+for quality, 'fast' for previews (a 384 px input). jit traces the model at
+the mode's fixed base size. At most MAX_LOADED_MODELS are kept per process,
+and with MODEL_IDLE_SECONDS set, removers unused for that long are unloaded.
+
+MATTING_BACKEND picks the inference backend: 'eager' (default) runs
+transparent_background's Remover on PyTorch, 'onnx' (experimental) runs its
+model exported to ONNX on ONNX Runtime, optionally int8 quantized (see
+onnx_backend.py).
+Set REMOVER_FACTORY to "module:callable" to use another remover, e.g. the
+deterministic stub in benchmarks/stub_remover.py for offline runs. Both are
+read by each worker process, so they apply to the whole pool.
+"""
+import collections
+import gc
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Removers kept loaded per process; the least recently used is unloaded first
+MAX_LOADED_MODELS = int(os.environ.get('MAX_LOADED_MODELS', 2))
+
+# Removers unused for this many seconds are unloaded; 0 keeps them loaded
+MODEL_IDLE_SECONDS = float(os.environ.get('MODEL_IDLE_SECONDS', 0))
+
+# Side of the blank image run through a newly loaded remover
+WARMUP_SIZE = 256
+
+# Inference backend of the removers: 'eager' or 'onnx'
+MATTING_BACKEND = os.environ.get('MATTING_BACKEND', 'eager')
+BACKENDS = ('eager', 'onnx')
+
+
+def _remover_class():
+    factory = os.environ.get('REMOVER_FACTORY')
+    if factory:
+        module, name = factory.split(':')
+        return getattr(importlib.import_module(module), name)
+    if MATTING_BACKEND not in BACKENDS:
+        raise ValueError(f"MATTING_BACKEND must be one of {', '.join(BACKENDS)}, not {MATTING_BACKEND!r}")
+    if MATTING_BACKEND == 'onnx':
+        from onnx_backend import OnnxRemover
+        return OnnxRemover
+    from transparent_background import Remover
+    return Remover
+
+
+def backend_key():
+    """MATTING_BACKEND, with -int8 for the quantized ONNX graph: the part of a matte cache key naming what made the matte"""
+    if MATTING_BACKEND == 'onnx':
+        from onnx_backend import ONNX_QUANTIZE
+        if ONNX_QUANTIZE:
+            return 'onnx-int8'
+    return MATTING_BACKEND
+
+
+class _Entry:
+    """A registry slot; its lock serializes loading of one key only"""
+
+    def __init__(self):
+        self.remover = None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """
+    Removers loaded on first use and shared per (mode, device, jit).
+    Args:
+        max_models (int): Loaded removers to keep; the least recently used
+            one is unloaded when another is loaded.
+        idle_seconds (float): Unload removers unused for this long; 0 never does.
+    """
+
+    def __init__(self, max_models=MAX_LOADED_MODELS, idle_seconds=MODEL_IDLE_SECONDS):
+        self.max_models = max_models
+        self.idle_seconds = idle_seconds
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._reaper = None
+        self.loads = 0
+        self.unloads = 0
+
+    def get(self, mode='base', device=None, jit=False):
+        """Return the remover for these settings, loading it if needed"""
+        key = (mode, device, jit)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+            self._entries.move_to_end(key)
+            entry.last_used = time.monotonic()
+        # Loading takes seconds: hold only this key's lock, not the registry's
+        with entry.lock:
+            if entry.remover is None:
+                start = time.perf_counter()
+                entry.remover = _remover_class()(mode=mode, jit=jit, device=device)
+                self.loads += 1
+                logger.info('loaded %s remover in %.1fs', mode, time.perf_counter() - start)
+                with self._lock:
+                    # Unloaded while it was loading: track it again
+                    self._entries.setdefault(key, entry)
+                self._evict(keep=key)
+                self._start_reaper()
+        return entry.remover
+
+    def warm_up(self, mode='base', device=None, jit=False):
+        """Load a remover and run one inference, so the first request does not pay for it"""
+        import numpy as np
+
+        remover = self.get(mode, device, jit)
+        start = time.perf_counter()
+        remover.process(np.zeros((WARMUP_SIZE, WARMUP_SIZE, 3), dtype=np.uint8), threshold=0.5)
+        logger.info('warmed up %s remover in %.1fs', mode, time.perf_counter() - start)
+        return remover
+
+    def unload_idle(self):
+        """Unload removers unused for idle_seconds; returns how many were unloaded"""
+        if not self.idle_seconds:
+            return 0
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if entry.last_used < cutoff]
+        return sum(self._unload(key) for key in idle)
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            loaded = [
+                {"mode": mode, "device": device, "jit": jit, "idle_seconds": round(now - entry.last_used, 1)}
+                for (mode, device, jit), entry in self._entries.items() if entry.remover is not None
+            ]
+        return {"backend": MATTING_BACKEND, "loaded": loaded, "loads": self.loads, "unloads": self.unloads}
+
+    def _evict(self, keep):
+        with self._lock:
+            loaded = [key for key, entry in self._entries.items() if entry.remover is not None]
+        # Oldest first; removers still in use elsewhere are freed once released
+        for key in loaded[:max(0, len(loaded) - self.max_models)]:
+            if key != keep:
+                self._unload(key)
+
+    def _unload(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is None or entry.remover is None:
+            return 0
+        entry.remover = None
+        self.unloads += 1
+        logger.info('unloaded %s remover', key[0])
+        gc.collect()
+        torch = sys.modules.get('torch')
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return 1
+
+    def _start_reaper(self):
+        if not self.idle_seconds:
+            return
+        with self._lock:
+            if self._reaper is None:
+                self._reaper = threading.Thread(target=self._reap, name='model-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap(self):
+        while True:
+            time.sleep(max(1.0, self.idle_seconds / 4))
+            self.unload_idle()
+            with self._lock:
+                if not self._entries:
+                    self._reaper = None
+                    return
+
+
+registry = ModelRegistry()
+
+
+def get_remover(mode='base', device=None, jit=False):
+    """Return this process's background remover for mode, loading it on first call"""
+    return registry.get(mode, device, jit)
+
+
+def init_worker(modes=('base',)):
+    """Process pool initializer: load and warm up the models before the first task arrives"""
+    for mode in modes:
+        registry.warm_up(mode)
+
+
+def model_stats():
+    """The loaded removers of this process"""
+    return registry.stats()
+
+
+def process(img_array, threshold, mode='base'):
+    """Run background removal on an RGB array and return the RGBA result"""
+    return get_remover(mode).process(img_array, threshold=threshold)
+
+
+def process_batch(img_arrays, threshold, mode='base'):
+    """
+    Run background removal on several RGB arrays with one forward pass.
+
+    Inputs go through the Remover's own transform of an array, which resizes
+    them to the model's fixed base size so they can be stacked, and each
+    predicted matte is resized back to its own input resolution, as
+    Remover.process does. Removers batching themselves (the ONNX backend) get
+    the whole batch. A single input, or a remover without the internals this
+    relies on (such as a stub, or another transparent_background version),
+    goes through process() per image.
+    Returns:
+        list: RGBA arrays in the same order as the inputs.
+    """
+    remover = get_remover(mode)
+    if hasattr(remover, 'process_batch'):
+        return remover.process_batch(img_arrays, threshold=threshold)
+    if len(img_arrays) > 1 and _can_forward_batch(remover):
+        outputs = _forward_batch(remover, img_arrays, threshold)
+        if outputs is not None:
+            return outputs
+    return [remover.process(a, threshold=threshold) for a in img_arrays]
+
+
+def normalize_pred(pred):
+    """
+    Rescale one image's prediction from a batched forward pass to [0, 1].
+
+    The model min-max normalizes its output over the whole batch. That is an
+    affine map, so normalizing each image's slice again gives what a forward
+    pass of that image alone would.
+    """
+    return (pred - pred.min()) / (pred.max() - pred.min() + 1e-8)
+
+
+def process_frames(frames, outputs, threshold, mode='base'):
+    """
+    process_batch over shared-memory frames (see frames.py), in place.
+
+    Reads each RGB input frame without copying it out of shared memory and
+    writes the RGBA results into the matching output frames, so no image is
+    pickled to or from this worker.
+    """
+    try:
+        results = process_batch([frame.array for frame in frames], threshold, mode)
+        for output, result in zip(outputs, results):
+            output.array[...] = result
+        del results
+    finally:
+        for frame in list(frames) + list(outputs):
+            frame.close()
+
+
+def _can_forward_batch(remover):
+    """Whether remover has the transparent_background internals _forward_batch uses"""
+    return (
+        callable(getattr(remover, 'model', None))
+        and callable(getattr(remover, 'cv2_transform', None))
+        and hasattr(remover, 'device')
+    )
+
+
+def _forward_batch(remover, img_arrays, threshold):
+    """One forward pass over img_arrays; None if the model's output is not what Remover.process expects"""
+    import numpy as np
+    import torch
+    import torch.nn.functional as F
+
+    # Remover.process's transform of an array; static resizing (the default)
+    # gives every input the same shape
+    tensors = [remover.cv2_transform(image=a)['image'] for a in img_arrays]
+    if len({tuple(x.shape) for x in tensors}) > 1:
+        return None
+    batch = torch.stack(tensors).to(remover.device)
+
+    with torch.no_grad():
+        preds = remover.model(batch)
+    if not isinstance(preds, torch.Tensor) or tuple(preds.shape[:2]) != (len(img_arrays), 1):
+        logger.warning('Unexpected model output for a batch; processing images one at a time')
+        return None
+
+    outputs = []
+    for a, pred in zip(img_arrays, preds):
+        pred = F.interpolate(normalize_pred(pred).unsqueeze(0), a.shape[:2], mode='bilinear', align_corners=True)
+        pred = pred.data.cpu().numpy().squeeze()
+        if threshold is not None:
+            pred = (pred > float(threshold)).astype(np.float64)
+        alpha = (pred * 255).astype(np.uint8)
+        outputs.append(np.dstack([a, alpha]))
+    return outputs
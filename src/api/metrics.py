@@ -0,0 +1,160 @@
+"""
+Prometheus-style metrics for the processing pipeline.
+
+Counters and histograms are registered at import and rendered in the
+Prometheus text exposition format by render(), which the server exposes on
+/metrics. timed(step) measures a block, or wraps a function, into the step
+histogram and into the current request's Breakdown. The breakdown follows the
+request into executor threads through a context variable, so the server can
+report per-step timings for a single request.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from a fast encode to a slow model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing count per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, _ = entry = self._values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            counts[index] += 1
+            entry[1] += value
+
+    def collect(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """All registered metrics in the Prometheus text format"""
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+STEP_SECONDS = Histogram('car_step_seconds', 'Time spent in each processing step', ('step',))
+STAGE_RUN_SECONDS = Histogram('car_stage_run_seconds', 'Time pipeline stage jobs ran in their executor', ('stage',))
+STAGE_WAIT_SECONDS = Histogram('car_stage_wait_seconds', 'Time pipeline stage jobs waited for an executor', ('stage',))
+REQUEST_SECONDS = Histogram('car_request_seconds', 'Request latency including the streamed body', ('endpoint',))
+SLOW_REQUESTS = Counter('car_slow_requests_total', 'Requests slower than PROFILE_SLOW_REQUEST_MS', ('endpoint',))
+
+
+class Breakdown:
+    """Seconds spent per step by one request; steps repeated by it add up"""
+
+    def __init__(self):
+        self.seconds = {}
+        self._lock = threading.Lock()
+
+    def add(self, step, seconds):
+        with self._lock:
+            self.seconds[step] = self.seconds.get(step, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        """The breakdown as a Server-Timing header value, in milliseconds"""
+        with self._lock:
+            items = list(self.seconds.items())
+        if total is not None:
+            items.append(('total', total))
+        return ', '.join(f"{step};dur={1000 * seconds:.1f}" for step, seconds in items)
+
+
+_breakdown = contextvars.ContextVar('breakdown', default=None)
+
+
+def start_breakdown():
+    """Collect the steps of the current context (a request) into a new Breakdown"""
+    breakdown = Breakdown()
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+def record(step, seconds):
+    STEP_SECONDS.observe(seconds, step=step)
+    breakdown = _breakdown.get()
+    if breakdown is not None:
+        breakdown.add(step, seconds)
+
+
+@contextmanager
+def timed(step):
+    """Time a block, or a function when used as a decorator, as one step"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(step, time.perf_counter() - start)
@@ -0,0 +1,212 @@
+"""
+Background removal on ONNX Runtime, from the Remover's model exported to ONNX.
+
+Selected with MATTING_BACKEND=onnx (see matting.py). Eager PyTorch picks
+its own kernels and threading for every call; an exported graph is optimized
+once, for a fixed input shape (the mode's base size, 1024 px for 'base' and
+384 px for 'fast'; only the batch dimension varies). int8 dynamic
+quantization makes the graph four times smaller, but so far it has been
+slower and less accurate than fp32 (see the README). Pre- and postprocessing
+are those Remover.process applies to an array (bilinear resize with OpenCV,
+ImageNet normalization, corner-aligned bilinear upsample of the matte,
+threshold), in NumPy.
+
+Experimental: fp32 mattes matched the eager Remover's in the parity run
+recorded in the README, which used random weights; check the real model on
+your own car photos with benchmarks/bench_backends.py before switching.
+
+Graphs are exported to ONNX_MODEL_DIR the first time a mode is loaded, or
+ahead of time with
+
+    python onnx_backend.py export --modes base fast [--quantize]
+
+Exporting needs torch (2.5 or later, with onnxscript) and
+transparent-background; running the graphs only needs onnxruntime
+(pip install onnx onnxscript onnxruntime). Settings:
+    ONNX_MODEL_DIR: Where exported graphs are kept.
+    ONNX_QUANTIZE: 1 runs the int8 dynamically quantized graph.
+    ONNX_INTRA_OP_THREADS: Threads per inference; defaults to OMP_NUM_THREADS,
+        else onnxruntime's default (one per physical core). With several
+        matting workers, set it to cores / workers.
+    ONNX_INTER_OP_THREADS: Threads running independent graph nodes (default 1).
+Compare latency, throughput and matte IoU with the eager Remover using
+benchmarks/bench_backends.py.
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+from matting import normalize_pred
+
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR') or os.path.join(tempfile.gettempdir(), 'car-onnx-models')
+ONNX_QUANTIZE = os.environ.get('ONNX_QUANTIZE', '0') != '0'
+ONNX_INTER_OP_THREADS = int(os.environ.get('ONNX_INTER_OP_THREADS', 1))
+
+# ONNX opset the graphs are exported with
+OPSET_VERSION = 18
+
+# Input normalization of transparent_background's Remover (ImageNet statistics)
+MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Alpha above this counts as car when comparing mattes
+IOU_ALPHA_THRESHOLD = 127
+
+
+def intra_op_threads():
+    """ONNX_INTRA_OP_THREADS, else OMP_NUM_THREADS (set per job worker), else 0 (onnxruntime decides)"""
+    return int(os.environ.get('ONNX_INTRA_OP_THREADS') or os.environ.get('OMP_NUM_THREADS') or 0)
+
+
+def model_path(mode, quantize=False, directory=ONNX_MODEL_DIR):
+    return os.path.join(directory, f"{mode}{'.int8' if quantize else ''}.onnx")
+
+
+def export(mode, directory=ONNX_MODEL_DIR, quantize=False):
+    """
+    Export the Remover's model for mode, and its int8 quantization if asked.
+    Returns:
+        str: Path of the graph to run (the quantized one when quantize is set).
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = model_path(mode, False, directory)
+    if not os.path.exists(path):
+        import torch
+        from transparent_background import Remover
+
+        remover = Remover(mode=mode, jit=False, device='cpu')
+        width, height = remover.meta.base_size
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with torch.no_grad():
+            # The dynamo exporter: the TorchScript one cannot export the
+            # Swin backbone's reshapes with a variable batch size
+            torch.onnx.export(
+                remover.model.eval(),
+                (torch.zeros(1, 3, height, width),),
+                tmp_path,
+                input_names=['image'],
+                output_names=['pred'],
+                # Fixed height and width; batches of any size
+                dynamic_shapes=({0: torch.export.Dim('batch', min=1)},),
+                opset_version=OPSET_VERSION,
+                dynamo=True,
+                external_data=False,
+            )
+        os.replace(tmp_path, path)
+    if not quantize:
+        return path
+
+    quantized_path = model_path(mode, True, directory)
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        tmp_path = f"{quantized_path}.{os.getpid()}.tmp"
+        quantize_dynamic(path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, quantized_path)
+    return quantized_path
+
+
+class OnnxRemover:
+    """
+    Drop-in for transparent_background.Remover running an exported graph on the CPU.
+    Args:
+        mode (str): Remover mode whose model is run; exported on first use.
+        jit, device: Accepted for compatibility with Remover; graphs always run on the CPU.
+        quantize (bool): Run the int8 graph; defaults to ONNX_QUANTIZE.
+        threads (int): Intra-op threads; defaults to intra_op_threads().
+    """
+
+    def __init__(self, mode='base', jit=False, device=None, quantize=None, threads=None):
+        import onnxruntime as ort
+
+        self.mode = mode
+        self.quantize = ONNX_QUANTIZE if quantize is None else quantize
+        self.path = export(mode, quantize=self.quantize)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads() if threads is None else threads
+        options.inter_op_num_threads = ONNX_INTER_OP_THREADS
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(self.path, options, providers=['CPUExecutionProvider'])
+        graph_input = self.session.get_inputs()[0]
+        self.input_name = graph_input.name
+        self.height, self.width = graph_input.shape[2:]
+
+    def process(self, img, type='rgba', threshold=None):
+        """Return the RGB image with the predicted matte as alpha, like Remover.process"""
+        return self.process_batch([img], threshold)[0]
+
+    def process_batch(self, imgs, threshold=None):
+        """process() for several images, with one run of the graph"""
+        rgbs = [np.asarray(Image.fromarray(np.asarray(img)).convert('RGB')) for img in imgs]
+        batch = np.stack([self._preprocess(rgb) for rgb in rgbs])
+        preds = self.session.run(None, {self.input_name: batch})[0]
+        return [self._postprocess(rgb, pred, threshold) for rgb, pred in zip(rgbs, preds)]
+
+    def _preprocess(self, rgb):
+        import cv2
+
+        # As the Remover's transform of an array: an OpenCV resize, then normalization
+        resized = cv2.resize(rgb, (self.width, self.height), interpolation=cv2.INTER_LINEAR)
+        x = (resized.astype(np.float32) - MEAN * 255) / (STD * 255)
+        return x.transpose(2, 0, 1)
+
+    def _postprocess(self, rgb, pred, threshold):
+        height, width = rgb.shape[:2]
+        pred = upsample_pred(normalize_pred(pred.squeeze().astype(np.float32)), width, height)
+        if threshold is not None:
+            pred = (pred > float(threshold)).astype(np.float32)
+        alpha = (np.clip(pred, 0, 1) * 255).astype(np.uint8)
+        return np.dstack([rgb, alpha])
+
+
+def upsample_pred(pred, width, height):
+    """
+    Bilinear resize of a prediction with the corner pixels aligned.
+
+    Remover.process upsamples with F.interpolate(..., align_corners=True),
+    which maps corner to corner; cv2.resize aligns pixel edges instead. An
+    inverse affine warp samples the same source points as the former.
+    """
+    import cv2
+
+    in_height, in_width = pred.shape
+    matrix = np.float32([
+        [(in_width - 1) / max(width - 1, 1), 0, 0],
+        [0, (in_height - 1) / max(height - 1, 1), 0],
+    ])
+    return cv2.warpAffine(
+        pred, matrix, (width, height),
+        flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+def matte_iou(a, b):
+    """Intersection over union of the car pixels of two RGBA results (1.0 when both are empty)"""
+    car_a = np.asarray(a)[..., 3] > IOU_ALPHA_THRESHOLD
+    car_b = np.asarray(b)[..., 3] > IOU_ALPHA_THRESHOLD
+    union = np.logical_or(car_a, car_b).sum()
+    if not union:
+        return 1.0
+    return float(np.logical_and(car_a, car_b).sum() / union)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export background removal models to ONNX')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help='export (and quantize) models to ONNX_MODEL_DIR')
+    export_parser.add_argument('--modes', nargs='+', default=['base'])
+    export_parser.add_argument('--quantize', action='store_true', help='also write the int8 graphs')
+    export_parser.add_argument('--directory', default=ONNX_MODEL_DIR)
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(export(mode, args.directory, args.quantize))
+
+
+if __name__ == '__main__':
+    main()
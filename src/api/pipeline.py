@@ -0,0 +1,143 @@
+"""
+Staged, non-blocking request pipeline for the API server.
+
+Each stage (decode, plate blur, matting, composite, encode) runs on its own
+executor so the event loop never blocks on image work. A stage can bound the
+number of jobs it accepts; once that many are queued or running, new work is
+rejected with StageBusy instead of waiting, which the server turns into a
+503 with a Retry-After hint.
+"""
+import asyncio
+import contextvars
+import math
+import time
+
+from metrics import STAGE_RUN_SECONDS, STAGE_WAIT_SECONDS
+
+
+class StageBusy(Exception):
+    """Raised when a bounded stage cannot accept more work"""
+
+    def __init__(self, stage, retry_after):
+        super().__init__(f"{stage} queue is full, retry in {retry_after}s")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args):
+    """Run fn in the executor and report how long it ran there"""
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+class Stage:
+    """
+    A named pipeline stage backed by an executor.
+    Args:
+        name (str): Stage name used in stats and errors.
+        executor_factory (callable): Creates the executor on first use, so
+            worker threads or processes are only started when needed.
+        workers (int): Number of workers the executor runs.
+        max_pending (int): Maximum number of queued plus running jobs, or None
+            for an unbounded queue.
+        copy_context (bool): Run jobs in a copy of the caller's context, so
+            per-request metrics follow them. Must be False for process pools.
+    """
+
+    def __init__(self, name, executor_factory, workers, max_pending=None, copy_context=True):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.copy_context = copy_context
+        self._executor_factory = executor_factory
+        self._executor = None
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.total_wait_seconds = 0.0
+        self.max_seconds = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    def full(self):
+        return self.max_pending is not None and self.pending >= self.max_pending
+
+    def retry_after(self):
+        """Estimate in seconds until a queued job would start"""
+        average = self.total_seconds / self.completed if self.completed else 1.0
+        return max(1, math.ceil(average * self.pending / self.workers))
+
+    def check_capacity(self):
+        if self.full():
+            self.rejected += 1
+            raise StageBusy(self.name, self.retry_after())
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on this stage's executor and await the result"""
+        self.check_capacity()
+        self.pending += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            call = (contextvars.copy_context().run, _timed_call) if self.copy_context else (_timed_call,)
+            result, run_seconds = await loop.run_in_executor(self.executor, *call, fn, args)
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+        elapsed = time.perf_counter() - start
+        self.completed += 1
+        self.total_seconds += elapsed
+        self.total_wait_seconds += max(0.0, elapsed - run_seconds)
+        self.max_seconds = max(self.max_seconds, elapsed)
+        STAGE_RUN_SECONDS.observe(run_seconds, stage=self.name)
+        STAGE_WAIT_SECONDS.observe(max(0.0, elapsed - run_seconds), stage=self.name)
+        return result
+
+    def stats(self):
+        completed = self.completed or 1
+        return {
+            "workers": self.workers,
+            "in_flight": self.pending,
+            "queued": max(0, self.pending - self.workers),
+            "max_pending": self.max_pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_latency_ms": round(1000 * self.total_seconds / completed, 2),
+            "avg_wait_ms": round(1000 * self.total_wait_seconds / completed, 2),
+            "max_latency_ms": round(1000 * self.max_seconds, 2),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+class Pipeline:
+    """A set of named stages; stage state is only touched from the event loop"""
+
+    def __init__(self, stages):
+        self.stages = {stage.name: stage for stage in stages}
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    async def run(self, name, fn, *args):
+        return await self.stages[name].run(fn, *args)
+
+    def stats(self):
+        return {name: stage.stats() for name, stage in self.stages.items()}
+
+    def shutdown(self):
+        for stage in self.stages.values():
+            stage.shutdown()
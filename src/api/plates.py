@@ -0,0 +1,113 @@
+"""
+License plate detection and blurring.
+
+The Haar cascade bundled next to this module is loaded once per thread and
+reused, and detection runs on a downscaled grayscale copy of the image with
+the boxes mapped back to full resolution. Only the detected regions are
+blurred, with a kernel proportional to the plate size.
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+CASCADE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'haarcascade_russian_plate_number.xml')
+
+# Longest image side used for detection; larger images are downscaled first
+DETECTION_MAX_SIDE = 1600
+
+_local = threading.local()
+
+
+def get_plate_cascade():
+    """Return the plate classifier, loading the bundled XML on first use.
+
+    OpenCV does not promise that concurrent detectMultiScale calls on one
+    classifier are safe, so each thread keeps its own instance.
+    """
+    cascade = getattr(_local, 'cascade', None)
+    if cascade is None:
+        cascade = cv2.CascadeClassifier(CASCADE_PATH)
+        if cascade.empty():
+            raise RuntimeError(f"Could not load plate cascade from {CASCADE_PATH}")
+        _local.cascade = cascade
+    return cascade
+
+
+def detect_plates(img_rgb, max_side=DETECTION_MAX_SIDE, scale_factor=1.1, min_neighbors=5, windows=None):
+    """
+    Detect license plates in an RGB array.
+    Args:
+        img_rgb (np.ndarray): Image with shape (height, width, 3).
+        max_side (int): Detect on a copy downscaled so its longest side is at
+            most this many pixels; None detects at full resolution.
+        scale_factor (float): detectMultiScale pyramid step.
+        min_neighbors (int): detectMultiScale candidate threshold.
+        windows (list): (x0, y0, x1, y1) regions to search instead of the
+            whole image, e.g. around plates found in a previous frame. They
+            are downscaled as the whole image would be, so a plate is found
+            in a window as it would be in the image.
+    Returns:
+        list: (x, y, w, h) boxes in full-resolution coordinates.
+    """
+    height, width = img_rgb.shape[:2]
+    scale = 1.0
+    if max_side and max(width, height) > max_side:
+        scale = max_side / max(width, height)
+
+    boxes = []
+    for x0, y0, x1, y1 in _merge_windows(windows) if windows is not None else [(0, 0, width, height)]:
+        x0, y0, x1, y1 = max(0, x0), max(0, y0), min(width, x1), min(height, y1)
+        if x1 <= x0 or y1 <= y0:
+            continue
+        gray = cv2.cvtColor(img_rgb[y0:y1, x0:x1], cv2.COLOR_RGB2GRAY)
+        if scale != 1.0:
+            size = (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale)))
+            gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+        plates = get_plate_cascade().detectMultiScale(gray, scaleFactor=scale_factor, minNeighbors=min_neighbors)
+
+        for (x, y, w, h) in plates:
+            # Map back to full resolution, rounding outwards so the plate stays covered
+            bx0, by0 = x0 + int(x / scale), y0 + int(y / scale)
+            bx1 = min(width, x0 + int(np.ceil((x + w) / scale)))
+            by1 = min(height, y0 + int(np.ceil((y + h) / scale)))
+            boxes.append((bx0, by0, bx1 - bx0, by1 - by0))
+    return boxes
+
+
+def _merge_windows(windows):
+    """Merge overlapping (x0, y0, x1, y1) windows, so no region is searched twice"""
+    merged = []
+    for window in windows:
+        window = list(window)
+        # Absorb every merged window this one overlaps, until none is left
+        overlapping = True
+        while overlapping:
+            overlapping = False
+            for other in merged:
+                if window[0] < other[2] and other[0] < window[2] and window[1] < other[3] and other[1] < window[3]:
+                    merged.remove(other)
+                    window = [min(window[0], other[0]), min(window[1], other[1]),
+                              max(window[2], other[2]), max(window[3], other[3])]
+                    overlapping = True
+                    break
+        merged.append(window)
+    return merged
+
+
+def blur_kernel_size(w, h):
+    """Odd Gaussian kernel size that fully smears text in a w x h plate"""
+    return max(3, min(w, h) // 2 * 2 + 1)
+
+
+def blur_regions(img, boxes):
+    """Blur each (x, y, w, h) box of img in place"""
+    for (x, y, w, h) in boxes:
+        roi = img[y:y+h, x:x+w]
+        if roi.size == 0:
+            continue
+        size = blur_kernel_size(w, h)
+        img[y:y+h, x:x+w] = cv2.GaussianBlur(roi, (size, size), size / 3)
+    return img
@@ -0,0 +1,53 @@
+"""
+Named output presets: the resolution results are rendered at and their encoding.
+
+A preset's max_side caps the longest side of the car image before plate blur
+and background removal, so the whole pipeline (matting, shadow, reflection,
+composite and encoding) runs at that scale; None keeps the upload's
+resolution. Set RENDER_PRESETS to a JSON object of name -> settings to change
+the defaults or add presets, e.g. {"web": {"max_side": 1280, "quality": 80}}.
+"""
+import json
+
+
+class Preset:
+    """
+    Resolution and encoding of rendered results.
+    Args:
+        name (str): Name requests select the preset by.
+        max_side (int): Longest side of the rendered images; None for full resolution.
+        output_format (str): png, webp or jpeg.
+        quality (int): WebP/JPEG quality, 1-100.
+        compress_level (int): PNG compression level, 0-9.
+    """
+
+    def __init__(self, name, max_side=None, output_format='png', quality=90, compress_level=6):
+        self.name = name
+        self.max_side = max_side
+        self.output_format = output_format
+        self.quality = quality
+        self.compress_level = compress_level
+
+    def as_dict(self):
+        return {
+            "max_side": self.max_side,
+            "output_format": self.output_format,
+            "quality": self.quality,
+            "compress_level": self.compress_level,
+        }
+
+
+DEFAULT_PRESETS = {preset.name: preset for preset in (
+    Preset('thumbnail', max_side=320, output_format='webp', quality=80),
+    Preset('web', max_side=1600, output_format='webp', quality=85),
+    Preset('print', max_side=None, output_format='png', compress_level=6),
+)}
+
+
+def load_presets(spec=None):
+    """The default presets, updated from a JSON object of name -> settings"""
+    presets = dict(DEFAULT_PRESETS)
+    for name, settings in json.loads(spec or '{}').items():
+        base = presets[name].as_dict() if name in presets else {}
+        presets[name] = Preset(name, **dict(base, **settings))
+    return presets
@@ -0,0 +1,102 @@
+"""
+Sampling profiler for slow requests.
+
+While at least one request is being recorded, a background thread samples the
+Python stacks of all threads every interval. When a request finishes slower
+than the threshold, the stacks sampled during it are written as "folded"
+stacks (one ``frame;frame;frame count`` line per distinct stack), which
+flamegraph.pl and speedscope read directly. Threads blocked in an idle wait
+are skipped. Samples of concurrent requests are not told apart, and the
+matting worker processes are not sampled.
+"""
+import collections
+import os
+import sys
+import threading
+import time
+
+# Innermost frames of idle threads: blocking waits in these modules, and
+# executor workers waiting for a job (which blocks in C)
+IDLE_MODULES = ('threading.py', 'queue.py', 'selectors.py')
+IDLE_FRAMES = ('thread.py:_worker',)
+
+
+def _is_idle(frame):
+    module = os.path.basename(frame.f_code.co_filename)
+    return module in IDLE_MODULES or f"{module}:{frame.f_code.co_name}" in IDLE_FRAMES
+
+
+def _folded_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Recording:
+    """Stack samples collected while one request runs"""
+
+    def __init__(self, label):
+        self.label = label
+        self.started = time.perf_counter()
+        self.stacks = collections.Counter()
+
+
+class SlowRequestProfiler:
+    """
+    Record stack samples per request and dump those of slow requests.
+    Args:
+        threshold (float): Requests taking at least this many seconds are dumped.
+        directory (str): Where profiles are written; created when needed.
+        interval (float): Seconds between samples.
+    """
+
+    def __init__(self, threshold, directory, interval=0.005):
+        self.threshold = threshold
+        self.directory = directory
+        self.interval = interval
+        self._recordings = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, label):
+        recording = Recording(label)
+        with self._lock:
+            self._recordings.add(recording)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='profiler', daemon=True)
+                self._thread.start()
+        return recording
+
+    def stop(self, recording):
+        """Stop recording; returns the dump path if the request was slow, else None"""
+        elapsed = time.perf_counter() - recording.started
+        with self._lock:
+            self._recordings.discard(recording)
+        if elapsed < self.threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{time.strftime('%Y%m%dT%H%M%S')}-{recording.label}-{round(1000 * elapsed)}ms.folded"
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            for stack, count in recording.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _sample(self):
+        me = threading.get_ident()
+        while True:
+            # Sample under the lock so stop() never sees a recording mid-update
+            with self._lock:
+                if not self._recordings:
+                    self._thread = None
+                    return
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me or _is_idle(frame):
+                        continue
+                    stack = _folded_stack(frame)
+                    for recording in self._recordings:
+                        recording.stacks[stack] += 1
+            time.sleep(self.interval)
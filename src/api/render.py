@@ -0,0 +1,297 @@
+"""
+The render steps of a car photo, shared by the API server, the job workers
+and the bulk command line.
+
+Decoding, plate blur, background removal, shadow, reflection, compositing
+and encoding, with the settings they read and the matte cache. Nothing here
+depends on the web framework, so job and bulk workers import this module
+rather than the server: server.py runs the same functions on its request
+pipeline, and run_job runs them one after the other in a worker process.
+"""
+import functools
+import logging
+import os
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+import ingest
+import matting
+from backgrounds import BackgroundStore, UnknownBackground
+from cache import MatteCache
+from compositor import Compositor, Layer
+from encoding import ALPHA_FORMATS, MEDIA_TYPES, encode_base64, encode_image
+from image import (
+    blur_license_plate,
+    car_bbox,
+    car_region_box,
+    create_ground_reflection_region,
+    create_realistic_shadow_region,
+    SHADOW_BLUR_RADIUS,
+    estimate_car_orientation,
+    reflection_offset,
+    resize_region,
+)
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+# Uploads with more pixels than this are rejected with 413 before decoding
+MAX_IMAGE_PIXELS = int(os.environ.get('MAX_IMAGE_PIXELS', 64_000_000))
+
+# Background removal settings; both are part of the matte cache key
+REMOVER_MODE = 'base'
+MATTE_THRESHOLD = 0.75
+
+# Faster, lower quality model for requests asking for a preview
+PREVIEW_REMOVER_MODE = os.environ.get('PREVIEW_REMOVER_MODE', 'fast')
+
+# Models each matting or job worker loads and runs once when it starts,
+# comma separated; other modes load on first use
+MATTING_WARM_MODES = tuple(os.environ.get('MATTING_WARM_MODES', REMOVER_MODE).split(','))
+
+# Blending math of the final composite: 'uint8' (matches PIL) or 'float32'
+COMPOSITE_PRECISION = os.environ.get('COMPOSITE_PRECISION', 'uint8')
+
+# Plate-blur and matte results keyed by upload content, so re-uploading the
+# same car to try another background skips the model entirely
+matte_cache = MatteCache(
+    max_bytes=int(os.environ.get('MATTE_CACHE_BYTES', 512 * 1024 * 1024)),
+    disk_dir=os.environ.get('MATTE_CACHE_DIR') or None,
+)
+
+compositor = Compositor(COMPOSITE_PRECISION)
+
+_background_store = None
+_background_store_lock = threading.Lock()
+
+
+def get_background_store():
+    """The registered backgrounds in BACKGROUNDS_DIR, opened on first use.
+
+    Backgrounds are prepared once per canvas size and shared by the server
+    and the job workers through the directory.
+    """
+    global _background_store
+    with _background_store_lock:
+        if _background_store is None:
+            _background_store = BackgroundStore(
+                os.environ.get('BACKGROUNDS_DIR') or os.path.join(tempfile.gettempdir(), 'car-backgrounds'),
+                max_bytes=int(os.environ.get('BACKGROUND_CACHE_BYTES', 512 * 1024 * 1024)),
+                max_pixels=MAX_IMAGE_PIXELS,
+                mmap=os.environ.get('BACKGROUND_MMAP', '1') != '0',
+            )
+        return _background_store
+
+
+def init_worker(modes=(REMOVER_MODE,)):
+    """Job and bulk worker initializer: set up the matte cache and warm up the models in modes.
+
+    A worker sees each image once, so its matte cache keeps only the disk
+    tier (MATTE_CACHE_DIR, shared with the server) rather than up to
+    MATTE_CACHE_BYTES of memory in every worker process.
+    """
+    matte_cache.max_bytes = 0
+    matting.init_worker(modes)
+
+
+def check_upload(source):
+    """Reject an unreadable or oversized upload (bytes or file) from its header alone; returns its size"""
+    return ingest.open_image(source, MAX_IMAGE_PIXELS).size
+
+
+@timed('decode')
+def decode_image(source, target_size=None, max_side=None):
+    """Decode an upload (bytes or file), upright and reduced towards target_size if given.
+
+    With max_side, the image is scaled down to fit it instead.
+    """
+    if max_side is not None:
+        return ingest.decode_fitted(source, MAX_IMAGE_PIXELS, max_side)
+    return ingest.decode_image(source, MAX_IMAGE_PIXELS, target_size)
+
+
+def render_scale(size, max_side):
+    """
+    How an upload of size is rendered under a preset's max_side.
+    Returns:
+        tuple: (max_side, scale factor), or (None, 1.0) when the upload
+            already fits and is rendered at full resolution.
+    """
+    fitted = ingest.fit_size(size, max_side)
+    if fitted == tuple(size):
+        return None, 1.0
+    return max_side, fitted[0] / size[0]
+
+
+@timed('background')
+def background_buffer(background_id, size):
+    """A registered background prepared for a canvas of size"""
+    return get_background_store().buffer(background_id, size)
+
+
+class OutputOptions:
+    """How result images are encoded; raises ValueError for invalid settings"""
+
+    RESPONSE_MODES = ('json', 'multipart')
+
+    def __init__(self, response_mode='json', output_format='png', quality=90, compress_level=6):
+        if response_mode not in self.RESPONSE_MODES:
+            raise ValueError(f"response_mode must be one of {', '.join(self.RESPONSE_MODES)}")
+        if output_format not in MEDIA_TYPES:
+            raise ValueError(f"output_format must be one of {', '.join(MEDIA_TYPES)}")
+        if not 1 <= quality <= 100 or not 0 <= compress_level <= 9:
+            raise ValueError("quality must be 1-100 and compress_level 0-9")
+        self.response_mode = response_mode
+        self.output_format = output_format
+        self.quality = quality
+        self.compress_level = compress_level
+
+    @classmethod
+    def for_preset(cls, preset, response_mode='json', output_format=None, quality=None, compress_level=None):
+        """Options from the form fields, with those not sent taken from preset"""
+        return cls(
+            response_mode,
+            preset.output_format if output_format is None else output_format,
+            preset.quality if quality is None else quality,
+            preset.compress_level if compress_level is None else compress_level,
+        )
+
+    def as_dict(self):
+        """The encoding options, as stored with a job"""
+        return {"output_format": self.output_format, "quality": self.quality, "compress_level": self.compress_level}
+
+    def format_for(self, alpha):
+        """Output format for an image; JPEG falls back to PNG when alpha is needed"""
+        if alpha and self.output_format not in ALPHA_FORMATS:
+            return 'png'
+        return self.output_format
+
+    def encoder(self, image, alpha, base64=False):
+        """Return a callable encoding image with these options, for the encode stage"""
+        encode = encode_base64 if base64 else encode_image
+        return timed('encode')(functools.partial(encode, image, self.format_for(alpha), self.quality, self.compress_level))
+
+
+def composite_car(foreground_removed, background_image, scale=1.0, car_orientation=None):
+    """Place a background-removed car on a background with shadow and reflection.
+
+    The background (an image, or a background_buffer of the car image's size)
+    is resized to the car image size. Returns the final image together with
+    the estimated car angle, orientation and its confidence. scale is how far
+    the car image was scaled down from the upload (see render_scale): the
+    shadow and reflection blur and offsets shrink with it, so a preview looks
+    like the full-resolution result. car_orientation, an (angle, orientation,
+    confidence) estimate such as a spin's smoothed one, replaces estimating it.
+
+    Only the region around the car's bounding box is resized, shadowed and
+    reflected, so apart from the output canvas itself, memory scales with the
+    car's footprint. The result matches doing the same on the full car image.
+    The background is resized strip by strip while the layers are composited.
+    """
+    size = foreground_removed.size
+    bbox = car_bbox(foreground_removed)
+    if bbox is None:
+        # Nothing left after background removal
+        with timed('composite'):
+            return compositor.render(background_image, size=size), 0, 'front', 0.0
+
+    # Resize foreground to be larger (95% of background height instead of 80%)
+    bg_w, bg_h = size
+    target_height = int(bg_h * 0.95)  # Increased from 0.8 to 0.95
+    car_scale = target_height / foreground_removed.size[1]
+    new_width = int(foreground_removed.size[0] * car_scale)
+
+    # Only resize the part of the car image holding the car (plus margin)
+    region = car_region_box(bbox, foreground_removed.size, (new_width, target_height))
+    with timed('resize_car'):
+        car_region = resize_region(foreground_removed, (new_width, target_height), region)
+    region_x, region_y = region[0], region[1]
+
+    # Center the car horizontally and adjust vertical position for larger car
+    paste_x = (bg_w - new_width) // 2
+    # Position car slightly higher since it's larger now
+    paste_y = (bg_h - target_height) // 2 - int(bg_h * 0.02)
+
+    # Car angle and orientation from the alpha matte within the car's box
+    if car_orientation is not None:
+        angle, orientation, confidence = car_orientation
+    else:
+        with timed('detect_car_angle'):
+            angle, orientation, confidence = estimate_car_orientation(foreground_removed, bbox=bbox)
+
+    # Create shadow and reflection
+    with timed('shadow'):
+        shadowed_car = create_realistic_shadow_region(
+            car_region, region_y, target_height, blur_radius=SHADOW_BLUR_RADIUS * scale, offset=round(5 * scale)
+        )
+
+    with timed('reflection'):
+        reflection = create_ground_reflection_region(
+            car_region,
+            target_height,
+            reflection_height_ratio=0.6,
+            fade_factor=0.6,
+            blur_radius=8 * scale,
+            opacity=0.35
+        )
+
+    offset, view = reflection_offset(angle)
+    offset = round(offset * scale)
+    reflection_y = paste_y + target_height - offset
+    logger.debug('%s angle: %s, reflection_y: %s', view, angle, reflection_y)
+
+    # Shadow and car, then the reflection at the position for the car's angle
+    with timed('composite'):
+        final_image = compositor.render(background_image, [
+            Layer(shadowed_car, (paste_x + region_x, paste_y + region_y)),
+            Layer(reflection, (paste_x + region_x, reflection_y)),
+        ], size=size)
+
+    return final_image, angle, orientation, confidence
+
+
+def run_job(inputs, options):
+    """Process a queued job inside a job (or bulk) worker process.
+
+    The same steps as ``/api/process-images``, run one after the other in the
+    worker rather than on the server's request pipeline, with the model
+    loaded in the worker itself. Mattes go through the matte cache, so with MATTE_CACHE_DIR
+    set a job and the server reuse each other's results. Returns the result
+    metadata and the encoded images.
+    """
+    output = OutputOptions('json', options['output_format'], options['quality'], options['compress_level'])
+    mode = PREVIEW_REMOVER_MODE if options['preview'] else REMOVER_MODE
+
+    with open(inputs['foreground'], 'rb') as f:
+        max_side, scale = render_scale(check_upload(f), options.get('max_side'))
+        cache_key = matte_cache.scaled_key(matte_cache.key(f, MATTE_THRESHOLD, mode, matting.backend_key()), max_side)
+        cached = matte_cache.get(cache_key)
+        if cached is None:
+            foreground_image = decode_image(f, None, max_side)
+    if cached is not None:
+        foreground_removed = cached[1]
+    else:
+        foreground_blurred = timed('plate_blur')(blur_license_plate)(foreground_image)
+        with timed('matting'):
+            foreground_removed = Image.fromarray(matting.process(np.array(foreground_blurred), MATTE_THRESHOLD, mode))
+        matte_cache.put(cache_key, foreground_blurred, foreground_removed)
+
+    result = {}
+    images = {"car_only": output.encoder(foreground_removed, True)()}
+    if 'background' in inputs or options.get('background_id'):
+        if options.get('background_id'):
+            try:
+                background_image = background_buffer(options['background_id'], foreground_removed.size)
+            except UnknownBackground:
+                # Deleted since the job was queued; retrying will not help
+                raise ValueError(f"No background {options['background_id']}")
+        else:
+            with open(inputs['background'], 'rb') as f:
+                background_image = decode_image(f, foreground_removed.size)
+        final_image, angle, orientation, confidence = composite_car(foreground_removed, background_image, scale)
+        images["final_image"] = output.encoder(final_image, False)()
+        result.update(car_angle=angle, car_orientation=orientation, car_orientation_confidence=confidence)
+    return result, images
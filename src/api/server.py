@@ -1,21 +1,61 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-import io
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List
+import asyncio
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
 import uvicorn
 from PIL import Image
-import base64
-from image import (
-    blur_license_plate,
-    create_checkerboard,
-    resize_and_center,
-    detect_car_angle,
-    create_realistic_shadow,
-    create_ground_reflection,
+import ingest
+import jobs
+import matting
+import metrics
+from backgrounds import UnknownBackground
+from batching import MicroBatcher
+from frames import FramePool
+from image import blur_license_plate, car_bbox, estimate_car_orientation
+from ingest import ImageTooLarge, InvalidImage
+from encoding import (
+    MEDIA_TYPES,
+    encode_png_strips,
+    multipart_boundary,
+    multipart_end,
+    multipart_json_part,
+    multipart_part,
+    multipart_part_header,
 )
-from transparent_background import Remover
+from metrics import timed
+from pipeline import Pipeline, Stage, StageBusy
+from presets import load_presets
+from profiling import SlowRequestProfiler
+from render import (
+    MATTE_THRESHOLD,
+    MATTING_WARM_MODES,
+    MAX_IMAGE_PIXELS,
+    PREVIEW_REMOVER_MODE,
+    REMOVER_MODE,
+    OutputOptions,
+    background_buffer,
+    check_upload,
+    composite_car,
+    decode_image,
+    get_background_store,
+    matte_cache,
+    render_scale,
+)
+from spins import AngleSmoother, PlateTracker, crop_region, open_video, reaches_crop_edge, read_video
 import numpy as np
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 
 # Add CORS middleware to allow requests from your React app
@@ -25,135 +65,1061 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
+)
+
+# Number of threads compositing results, shared by all requests
+COMPOSITE_WORKERS = int(os.environ.get('COMPOSITE_WORKERS', os.cpu_count() or 4))
+
+# Number of background-removal worker processes (each loads its own model)
+MATTING_WORKERS = int(os.environ.get('MATTING_WORKERS', 1))
+
+# Concurrent matting requests are grouped into batches of up to this many
+# images, waiting at most this long for a batch to fill. A batch size of 1
+# disables batching.
+MATTING_MAX_BATCH = int(os.environ.get('MATTING_MAX_BATCH', 1))
+MATTING_MAX_WAIT_MS = float(os.environ.get('MATTING_MAX_WAIT_MS', 10))
+
+# How many images may wait for or be in matting before requests get a 503
+MATTING_QUEUE_SIZE = int(os.environ.get('MATTING_QUEUE_SIZE', 4 * MATTING_WORKERS * MATTING_MAX_BATCH))
+
+# Images go to and from the matting workers in shared memory rather than
+# pickled; 0 pickles them (for hosts with a small /dev/shm). Up to
+# FRAME_POOL_BYTES of released frames are kept for reuse.
+MATTING_SHARED_MEMORY = os.environ.get('MATTING_SHARED_MEMORY', '1') != '0'
+FRAME_POOL_BYTES = int(os.environ.get('FRAME_POOL_BYTES', 256 * 1024 * 1024))
+
+# Requests declaring a larger body are rejected with 413 before it is read;
+# 0 (default) disables the check
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', 0))
+
+# Named resolution and encoding presets requests select with `preset`;
+# RENDER_PRESETS is a JSON object overriding or adding to the defaults
+# (thumbnail, web, print; see presets.py). Requests asking for a full_render
+# get a job rendering FULL_RENDER_PRESET queued alongside their preview.
+RENDER_PRESETS = load_presets(os.environ.get('RENDER_PRESETS'))
+FULL_RENDER_PRESET = RENDER_PRESETS[os.environ.get('FULL_RENDER_PRESET', 'print')]
+
+# MATTING_WARMUP=0 starts the matting workers on the first request instead
+# of at server startup (MATTING_WARM_MODES, in render.py, are the models
+# they load)
+MATTING_WARMUP = os.environ.get('MATTING_WARMUP', '1') != '0'
+
+# Requests sending this header get their per-step timings back in a
+# Server-Timing response header
+TIMINGS_HEADER = 'X-Debug-Timings'
+
+# Requests slower than this get a sampling profile written to PROFILE_DIR;
+# 0 (default) disables profiling
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get('PROFILE_SLOW_REQUEST_MS', 0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'car-profiles')
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+
+profiler = SlowRequestProfiler(
+    PROFILE_SLOW_REQUEST_MS / 1000, PROFILE_DIR, PROFILE_INTERVAL_MS / 1000
+) if PROFILE_SLOW_REQUEST_MS > 0 else None
+
+# Endpoints whose latency, step timings and profiles are recorded
+INSTRUMENTED_ENDPOINTS = ('/api/process-images', '/api/process-batch', '/api/process-spin', '/api/jobs')
+
+# Asynchronous jobs (the queue settings are in jobs.py). JOB_WORKERS
+# processes (each with its own model) are started with the first job, or at
+# startup if jobs are left over; 0 leaves them to `python jobs.py`.
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 1))
+
+# Longest a status request may wait for its job to finish, and how often it checks
+JOB_MAX_WAIT_SECONDS = 30
+JOB_WAIT_POLL_SECONDS = 0.25
+
+# Spin sets (see spins.py): plates are detected in full every
+# SPIN_KEYFRAME_INTERVAL frames and tracked in between, and car angles are
+# smoothed over SPIN_ANGLE_WINDOW frames. Longer spins are rejected.
+SPIN_KEYFRAME_INTERVAL = int(os.environ.get('SPIN_KEYFRAME_INTERVAL', 4))
+SPIN_ANGLE_WINDOW = int(os.environ.get('SPIN_ANGLE_WINDOW', 5))
+SPIN_MAX_FRAMES = int(os.environ.get('SPIN_MAX_FRAMES', 120))
+
+# How often a spin waiting for room in the matting queue checks again
+SPIN_BUSY_POLL_SECONDS = 0.05
+
+# Plate-blurred images and their mattes, shared with the matting workers
+frame_pool = FramePool(shared=MATTING_SHARED_MEMORY, max_idle_bytes=FRAME_POOL_BYTES)
+
+background_store = get_background_store()
+
+job_store = jobs.default_store()
+job_workers = jobs.JobWorkers(
+    job_store,
+    'render:run_job',
+    JOB_WORKERS,
+    initializer='render:init_worker',
+    initargs=(MATTING_WARM_MODES if MATTING_WARMUP else (),),
 )
 
-# Initialize the background remover once
-remover = Remover(mode='base')
+
+def _matting_executor():
+    # Spawned rather than forked: workers start from a clean interpreter and
+    # load torch and the model weights themselves, once
+    return ProcessPoolExecutor(
+        max_workers=MATTING_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=matting.init_worker,
+        initargs=(MATTING_WARM_MODES,),
+    )
+
+
+def _thread_executor(name, workers):
+    return lambda: ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+
+
+# Request stages; executors are started on first use, the matting workers at
+# startup unless MATTING_WARMUP=0
+pipeline = Pipeline([
+    Stage('decode', _thread_executor('decode', COMPOSITE_WORKERS), COMPOSITE_WORKERS),
+    Stage('plate_blur', _thread_executor('plate_blur', COMPOSITE_WORKERS), COMPOSITE_WORKERS),
+    Stage('matting', _matting_executor, MATTING_WORKERS, copy_context=False),
+    Stage('composite', _thread_executor('composite', COMPOSITE_WORKERS), COMPOSITE_WORKERS),
+    Stage('encode', _thread_executor('encode', COMPOSITE_WORKERS), COMPOSITE_WORKERS),
+])
+
+
+async def _matte_batch(items):
+    """Matte (RGB frame, mode) items into RGBA images, with one batched call per mode"""
+    indexes_by_mode = {}
+    for index, (_, mode) in enumerate(items):
+        indexes_by_mode.setdefault(mode, []).append(index)
+    results = [None] * len(items)
+
+    async def run(mode, indexes):
+        # The batch owns the input frames: requests may be gone by the time it runs
+        inputs = [items[i][0] for i in indexes]
+        try:
+            if not frame_pool.shared:
+                arrays = await pipeline.run(
+                    'matting', matting.process_batch, [f.array for f in inputs], MATTE_THRESHOLD, mode
+                )
+                for index, array in zip(indexes, arrays):
+                    results[index] = Image.fromarray(array)
+                return
+            # The workers read the inputs and write the mattes in shared memory;
+            # the results are views of it, recycled once they are collected
+            outputs = [frame_pool.acquire(f.shape[:2] + (4,)) for f in inputs]
+            try:
+                await pipeline.run('matting', matting.process_frames, inputs, outputs, MATTE_THRESHOLD, mode)
+            except BaseException:
+                for output in outputs:
+                    frame_pool.release(output)
+                raise
+            for index, output in zip(indexes, outputs):
+                results[index] = frame_pool.image(output, 'RGBA')
+        finally:
+            for frame in inputs:
+                frame_pool.release(frame)
+
+    await asyncio.gather(*(run(mode, indexes) for mode, indexes in indexes_by_mode.items()))
+    return results
+
+
+# Admission control for matting is done per image by the batcher
+matting_batcher = MicroBatcher(
+    'matting',
+    _matte_batch,
+    max_batch_size=MATTING_MAX_BATCH,
+    max_wait=MATTING_MAX_WAIT_MS / 1000,
+    max_pending=MATTING_QUEUE_SIZE,
+    workers=MATTING_WORKERS,
+)
+
+
+@app.on_event("startup")
+def start_matting_workers():
+    """Spawn the matting workers, which load and warm up their models before the first request"""
+    if MATTING_WARMUP:
+        executor = pipeline['matting'].executor
+        # With no idle worker to take it, each task spawns another process
+        for _ in range(MATTING_WORKERS):
+            executor.submit(matting.model_stats).add_done_callback(_log_worker_start)
+
+
+@app.on_event("startup")
+def resume_jobs():
+    """Start the job workers if jobs were left queued or running by a previous run"""
+    counts = job_store.counts()
+    if JOB_WORKERS and (counts[jobs.QUEUED] or counts[jobs.RUNNING]):
+        job_workers.ensure_running()
+
+
+def _log_worker_start(future):
+    if future.exception() is not None:
+        logger.error('matting worker failed to start: %s', future.exception())
+    else:
+        logger.info('matting worker ready: %s', future.result())
+
+
+@app.on_event("shutdown")
+def shutdown_pipeline():
+    pipeline.shutdown()
+    job_workers.stop()
+    frame_pool.close()
+
+
+def get_preset(name):
+    """The render preset called name, or a 400 for an unknown one"""
+    if name not in RENDER_PRESETS:
+        raise HTTPException(status_code=400, detail=f"preset must be one of {', '.join(RENDER_PRESETS)}")
+    return RENDER_PRESETS[name]
+
+
+@timed('resize_matte')
+def scale_matte(blurred, removed, max_side):
+    """Full-resolution plate blur and matte results scaled down to fit max_side"""
+    size = ingest.fit_size(blurred.size, max_side)
+    return (
+        blurred.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0),
+        removed.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0),
+    )
+
+
+def check_background_id(background_id):
+    """Reject an unknown background id before any work is done"""
+    if background_store.info(background_id) is None:
+        raise HTTPException(status_code=404, detail=f"No background {background_id}")
+
+
+async def remove_background(foreground_content, mode=REMOVER_MODE, max_side=None):
+    """Blur the license plate and remove the background of a car image.
+
+    This is the expensive, per-car part of the pipeline. Takes the upload, as
+    bytes or the file it was spooled to, and returns the blurred foreground
+    and the RGBA car with a transparent background, served from the matte
+    cache when possible. mode selects the background removal model. With
+    max_side, the upload is scaled down to fit it first, so both steps run on
+    the smaller image; a cached full-resolution result is scaled down instead.
+    Raises StageBusy if the matting queue is full.
+    """
+    # Hashing reads the whole upload, so it runs off the event loop
+    full_key = await pipeline.run(
+        'decode', matte_cache.key, foreground_content, MATTE_THRESHOLD, mode, matting.backend_key()
+    )
+    cache_key = matte_cache.scaled_key(full_key, max_side)
+    cached = matte_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    if max_side is not None:
+        cached = matte_cache.get(full_key)
+        if cached is not None:
+            scaled = await pipeline.run('decode', scale_matte, *cached, max_side)
+            matte_cache.put(cache_key, *scaled)
+            return scaled
+
+    # Reject before doing any work if the model workers are saturated
+    matting_batcher.check_capacity()
+
+    foreground_image = await pipeline.run('decode', decode_image, foreground_content, None, max_side)
+
+    # Step 1: Blur license plate, straight into the frame the matting workers read
+    frame = frame_pool.acquire((foreground_image.height, foreground_image.width, 3))
+    try:
+        foreground_blurred = await pipeline.run(
+            'plate_blur', timed('plate_blur')(blur_license_plate), foreground_image, frame.array
+        )
+        # Rejected before it was queued; once queued, its batch releases the frame
+        matting_batcher.check_capacity()
+    except BaseException:
+        frame_pool.release(frame)
+        raise
+
+    # Step 2: Remove background (timed until the matte is back, batching included)
+    with timed('matting'):
+        foreground_removed = await matting_batcher.submit((frame, mode))
+
+    matte_cache.put(cache_key, foreground_blurred, foreground_removed)
+    return foreground_blurred, foreground_removed
+
+
+def output_options(preset, response_mode='json', output_format=None, quality=None, compress_level=None):
+    """OutputOptions from the request form fields (see OutputOptions.for_preset), or a 400 for invalid ones"""
+    try:
+        return OutputOptions.for_preset(preset, response_mode, output_format, quality, compress_level)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _busy(e):
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Record latency, step timings and slow-request profiles of the processing endpoints.
+
+    Latency includes streaming the body. The Server-Timing header is built when
+    the headers are sent, so for streamed responses it only covers the work
+    done before streaming started.
+    """
+    endpoint = request.url.path
+    if endpoint not in INSTRUMENTED_ENDPOINTS:
+        return await call_next(request)
+
+    breakdown = metrics.start_breakdown()
+    recording = profiler.start(endpoint.rsplit('/', 1)[-1]) if profiler else None
+    start = time.perf_counter()
+
+    def finish():
+        elapsed = time.perf_counter() - start
+        metrics.REQUEST_SECONDS.observe(elapsed, endpoint=endpoint)
+        if recording is not None:
+            path = profiler.stop(recording)
+            if path:
+                metrics.SLOW_REQUESTS.inc(endpoint=endpoint)
+                logger.warning('%s took %.0f ms, profile written to %s', endpoint, 1000 * elapsed, path)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        finish()
+        raise
+    if request.headers.get(TIMINGS_HEADER):
+        response.headers['Server-Timing'] = breakdown.server_timing(time.perf_counter() - start)
+
+    body = response.body_iterator
+
+    async def body_then_finish():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish()
+
+    response.body_iterator = body_then_finish()
+    return response
+
+
+@app.middleware("http")
+async def limit_request_size(request: Request, call_next):
+    """Reject bodies declared larger than MAX_REQUEST_BYTES before they are received"""
+    length = request.headers.get('content-length', '')
+    if MAX_REQUEST_BYTES and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+        return JSONResponse(
+            status_code=413, content={"detail": f"Request body is larger than {MAX_REQUEST_BYTES} bytes"}
+        )
+    return await call_next(request)
+
 
 @app.post("/api/process-images")
-def process_images(
+async def process_images(
     foreground: UploadFile = File(...),
     background: UploadFile = File(None),
+    response_mode: str = Form('json'),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    preview: bool = Form(False),
+    background_id: str = Form(None),
+    preset: str = Form('print'),
+    full_render: bool = Form(False),
 ):
+    """Blur the plate, remove the background and optionally composite the car.
+
+    With ``response_mode=json`` (default) images are base64 data URIs in the
+    JSON body. With ``response_mode=multipart`` the response is a streamed
+    ``multipart/mixed`` body: a JSON ``metadata`` part followed by one binary
+    part per image, so no base64 or JSON copy of the pixels is made.
+    ``output_format`` (png, webp, jpeg) applies to both images, except that
+    ``car_only`` stays PNG when JPEG is requested since it needs alpha.
+    ``preview=true`` removes the background with the faster
+    PREVIEW_REMOVER_MODE model, for quick previews before the full render.
+    ``background_id`` composites onto a registered background instead of an
+    uploaded one.
+
+    ``preset`` (thumbnail, web, print or one from RENDER_PRESETS) sets the
+    resolution the whole pipeline runs at and the default encoding; explicit
+    encoding fields override it. With ``full_render=true`` a reduced preview
+    is returned straight away and a job rendering FULL_RENDER_PRESET is
+    queued: ``full_render`` in the response is its status, as returned by
+    ``/api/jobs``, or null when the response already is the full render.
+    """
+    render_preset = get_preset(preset)
+    options = output_options(render_preset, response_mode, output_format, quality, compress_level)
+    mode = PREVIEW_REMOVER_MODE if preview else REMOVER_MODE
+    if background and background_id:
+        raise HTTPException(status_code=400, detail="Send either background or background_id, not both")
+    if background_id:
+        check_background_id(background_id)
     try:
-        # Read the foreground image
-        foreground_content = foreground.file.read()
-        foreground_image = Image.open(io.BytesIO(foreground_content))
-        
-        # Step 1: Blur license plate
-        foreground_blurred = blur_license_plate(foreground_image)
-        
-        # Step 2: Remove background
-        img_array = np.array(foreground_blurred)
-        output = remover.process(img_array, threshold=0.75)
-        foreground_removed = Image.fromarray(output)
-        
-        # Create a response object with the processed images
-        response = {
-            "success": True,
-            "car_only": image_to_base64(foreground_removed)
-        }
-        
-        # If background is provided, create the final composite
+        # Check both headers before any decoding or matting; the uploads are
+        # then read from the files they were spooled to, not copied into memory
+        size = await pipeline.run('decode', check_upload, foreground.file)
         if background:
-            background_content = background.file.read()
-            background_image = Image.open(io.BytesIO(background_content))
-            background_image = background_image.convert('RGBA')
-            background_image = background_image.resize(foreground_blurred.size, Image.Resampling.LANCZOS)
-            
-            # Resize foreground to be larger (95% of background height instead of 80%)
-            bg_w, bg_h = background_image.size
-            target_height = int(bg_h * 0.95)  # Increased from 0.8 to 0.95
-            scale = target_height / foreground_removed.size[1]
-            new_width = int(foreground_removed.size[0] * scale)
-            
-            foreground_resized = foreground_removed.resize(
-                (new_width, target_height),
-                Image.Resampling.LANCZOS
+            await pipeline.run('decode', check_upload, background.file)
+        max_side, scale = render_scale(size, render_preset.max_side)
+
+        foreground_blurred, foreground_removed = await remove_background(foreground.file, mode, max_side)
+
+        # Create a response object with the processed images
+        response = {"success": True, "preset": render_preset.name}
+        if full_render:
+            response["full_render"] = await _queue_full_render(
+                foreground, background, background_id, size, (max_side, mode, options.as_dict())
             )
-            
-            # Center the car horizontally and adjust vertical position for larger car
-            paste_x = (bg_w - new_width) // 2
-            # Position car slightly higher since it's larger now
-            paste_y = (bg_h - target_height) // 2 - int(bg_h * 0.02)
-            
-            # Detect car angle and orientation
-            angle, orientation = detect_car_angle(foreground_removed)
-            
-            # Create shadow and reflection
-            shadowed_car = create_realistic_shadow(foreground_resized)
-            
-            reflection = create_ground_reflection(
-                foreground_resized, 
-                reflection_height_ratio=0.6,
-                fade_factor=0.6,
-                blur_radius=8,
-                opacity=0.35
+        # name -> (image, whether it needs an alpha channel)
+        images = {"car_only": (foreground_removed, True)}
+
+        # If background is provided, create the final composite
+        if background or background_id:
+            if background_id:
+                # Prepared once per size; after that this is a lookup
+                background_image = await pipeline.run('decode', background_buffer, background_id, foreground_removed.size)
+            else:
+                # Decoded at a reduced scale when it is larger than the composite
+                background_image = await pipeline.run('decode', decode_image, background.file, foreground_removed.size)
+
+            final_image, angle, orientation, confidence = await pipeline.run(
+                'composite', composite_car, foreground_removed, background_image, scale
             )
-            
-            # Create final composite
-            final_image = background_image.copy()
-            
-            # Paste shadow and car
-            final_image.paste(shadowed_car, (paste_x, paste_y), shadowed_car)
-            
-            # Paste reflection with position based on car angle
-            # Log the angle for debugging
-            print(f'Car angle: {angle}')
-            
-            # Clear logical ranges for reflection positioning
-            if angle == 0:
-                reflection_y = paste_y + target_height - 200
-                print(f'Front view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle > 0 and angle < 5:
-                reflection_y = paste_y + target_height - 180
-                print(f'Front view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 5 and angle < 10:  # Very small angles (front view)
-                reflection_y = paste_y + target_height - 390
-                print(f'Front view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 10 and angle < 12:  # Special case for angles between 10-12
-                reflection_y = paste_y + target_height - 440
-                print(f'Special case angle 10-12: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 12 and angle < 70:  # Medium angles
-                reflection_y = paste_y + target_height - 490
-                print(f'Medium angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 70 and angle < 80:  # Side view angles
-                reflection_y = paste_y + target_height - 190
-                print(f'Side view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 80 and angle < 85:  # Side view angles
-                reflection_y = paste_y + target_height - 370
-                print(f'Side view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 85 and angle < 90:  # Side view angles
-                reflection_y = paste_y + target_height - 120
-                print(f'Side view angle: {angle}, reflection_y: {reflection_y}')
-            elif angle >= 90 and angle < 110:  # Side view angles
-                reflection_y = paste_y + target_height - 150
-                print(f'Side view angle: {angle}, reflection_y: {reflection_y}')    
-            else:  # angle >= 110, large angles
-                reflection_y = paste_y + target_height - 400
-                print(f'Large angle: {angle}, reflection_y: {reflection_y}')
-                
-            final_image.paste(reflection, (paste_x, reflection_y), reflection)
-            
-            # Apply final enhancements
-            final_image = Image.fromarray(np.array(final_image))
-            
-            # Add final image to response
-            response["final_image"] = image_to_base64(final_image)
+
+            images["final_image"] = (final_image, False)
             response["car_angle"] = angle
             response["car_orientation"] = orientation
-        
+            response["car_orientation_confidence"] = confidence
+
+        if options.response_mode == 'multipart':
+            return _multipart_response(response, images, options)
+
+        # Add images to response
+        for name, (image, alpha) in images.items():
+            response[name] = await pipeline.run('encode', options.encoder(image, alpha, base64=True))
+
         return response
-        
+
+    except StageBusy as e:
+        raise _busy(e)
+    except UnknownBackground:
+        raise HTTPException(status_code=404, detail=f"No background {background_id}")
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def image_to_base64(image):
-    """Convert PIL Image to base64 string"""
-    buffered = io.BytesIO()
-    image.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    return f"data:image/png;base64,{img_str}"
+
+def _timed_chunks(step, chunks):
+    """Yield from chunks, recording the time spent producing all of them as one step"""
+    seconds = 0.0
+    while True:
+        start = time.perf_counter()
+        chunk = next(chunks, None)
+        seconds += time.perf_counter() - start
+        if chunk is None:
+            break
+        yield chunk
+    metrics.record(step, seconds)
+
+
+def _multipart_response(metadata, images, options):
+    """Stream metadata and images as multipart/mixed, encoding each image as it is sent"""
+    boundary = multipart_boundary()
+    metadata = dict(metadata, parts=[
+        {"name": name, "content_type": MEDIA_TYPES[options.format_for(alpha)]} for name, (_, alpha) in images.items()
+    ])
+
+    async def generate():
+        for chunk in multipart_json_part(boundary, metadata):
+            yield chunk
+        for name, (image, alpha) in images.items():
+            if options.format_for(alpha) == 'png':
+                # Compress and send one strip of rows at a time, so the encoded
+                # PNG is never held in memory as a whole
+                yield multipart_part_header(boundary, MEDIA_TYPES['png'], name, f"{name}.png")
+                strips = _timed_chunks('encode', encode_png_strips(image, options.compress_level))
+                while (chunk := await pipeline.run('encode', next, strips, None)) is not None:
+                    yield chunk
+                yield b"\r\n"
+                continue
+            content, media_type = await pipeline.run('encode', options.encoder(image, alpha))
+            extension = 'jpg' if media_type == 'image/jpeg' else media_type.split('/')[1]
+            for chunk in multipart_part(boundary, content, media_type, name, f"{name}.{extension}"):
+                yield chunk
+            del content
+        yield multipart_end(boundary)
+
+    return StreamingResponse(generate(), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+async def _composite_result(foreground_index, background_index, foreground_removed, background_image, options, scale):
+    """Run one composite of a batch and describe it as a result line"""
+    result = {"foreground": foreground_index, "background": background_index}
+    try:
+        if isinstance(background_image, str):
+            background_image = await pipeline.run('decode', background_buffer, background_image, foreground_removed.size)
+        final_image, angle, orientation, confidence = await pipeline.run(
+            'composite', composite_car, foreground_removed, background_image, scale
+        )
+        final_base64 = await pipeline.run('encode', options.encoder(final_image, False, base64=True))
+    except Exception as e:
+        result.update(success=False, error=str(e))
+        return result
+    result.update(
+        success=True,
+        final_image=final_base64,
+        car_angle=angle,
+        car_orientation=orientation,
+        car_orientation_confidence=confidence,
+    )
+    return result
+
+
+def _spool(directory, name, upload):
+    """Copy an upload to directory/name, so it can be read after the request returns; returns the path"""
+    path = os.path.join(directory, name)
+    upload.file.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(upload.file, f)
+    return path
+
+
+def _ndjson(item):
+    return (json.dumps(item) + "\n").encode('utf-8')
+
+
+@app.post("/api/process-batch")
+async def process_batch(
+    foregrounds: List[UploadFile] = File(...),
+    backgrounds: List[UploadFile] = File(None),
+    background_ids: List[str] = Form(None),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    preset: str = Form('print'),
+):
+    """Composite every foreground onto every background.
+
+    Plate blur and background removal run once per foreground; only the
+    compositing stage is repeated for each (foreground, background) pair.
+    Results are streamed as newline-delimited JSON in the order they finish:
+    one ``car_only`` line per foreground, then one ``final_image`` line per
+    pair, each tagged with the ``foreground`` and ``background`` indexes of
+    the uploads. A foreground rejected because the matting queue is full gets
+    an error line with ``retry_after`` seconds. Images are encoded as with
+    ``/api/process-images`` in JSON mode. Registered ``background_ids`` are
+    indexed after the uploaded backgrounds. ``preset`` applies to every car.
+    """
+    render_preset = get_preset(preset)
+    options = output_options(render_preset, 'json', output_format, quality, compress_level)
+    for background_id in background_ids or []:
+        check_background_id(background_id)
+    if matting_batcher.full():
+        raise _busy(StageBusy('matting', matting_batcher.retry_after()))
+    # The uploads are closed once we return: the cars are copied to disk and
+    # read from there one at a time, rather than all held in memory
+    directory = tempfile.mkdtemp(prefix='batch-')
+    try:
+        foreground_paths = [
+            await pipeline.run('decode', _spool, directory, f"foreground-{i:04d}", f)
+            for i, f in enumerate(foregrounds)
+        ]
+        background_images = [
+            await pipeline.run('decode', decode_image, b.file) for b in backgrounds or []
+        ]
+        # Registered backgrounds are looked up at each car's size when composited
+        background_images += background_ids or []
+    except BaseException as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        if isinstance(e, ImageTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, InvalidImage):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+
+    async def generate():
+        pending = set()
+        try:
+            for i, foreground_path in enumerate(foreground_paths):
+                try:
+                    with open(foreground_path, 'rb') as foreground:
+                        size = await pipeline.run('decode', check_upload, foreground)
+                        max_side, scale = render_scale(size, render_preset.max_side)
+                        _, foreground_removed = await remove_background(foreground, REMOVER_MODE, max_side)
+                    car_only = await pipeline.run('encode', options.encoder(foreground_removed, True, base64=True))
+                except StageBusy as e:
+                    yield _ndjson({"foreground": i, "success": False, "error": str(e), "retry_after": e.retry_after})
+                    continue
+                except Exception as e:
+                    yield _ndjson({"foreground": i, "success": False, "error": str(e)})
+                    continue
+                yield _ndjson({"foreground": i, "success": True, "car_only": car_only})
+
+                for j, background_image in enumerate(background_images):
+                    pending.add(asyncio.ensure_future(
+                        _composite_result(i, j, foreground_removed, background_image, options, scale)
+                    ))
+
+                # Flush composites that finished while this car was being matted
+                done = {task for task in pending if task.done()}
+                pending -= done
+                for task in done:
+                    yield _ndjson(task.result())
+
+            for next_done in asyncio.as_completed(pending):
+                yield _ndjson(await next_done)
+            pending = set()
+        finally:
+            # The client went away; drop composites nobody will read
+            for task in pending:
+                task.cancel()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def _spool_spin(directory, frames, video, background):
+    """Copy a spin's uploads to directory, after checking the image headers.
+
+    Returns the paths of the frames (or the video) and of the background.
+    """
+    for upload in frames + ([background] if background else []):
+        check_upload(upload.file)
+    uploads = [(f"frame-{i:04d}", upload) for i, upload in enumerate(frames)]
+    if video:
+        uploads.append(('video' + os.path.splitext(video.filename or '')[1], video))
+    if background:
+        uploads.append(('background', background))
+    paths = [_spool(directory, name, upload) for name, upload in uploads]
+    frame_paths = paths[:len(frames)]
+    video_path = paths[len(frames)] if video else None
+    if video_path is not None:
+        open_video(video_path).release()
+    background_path = paths[-1] if background else None
+    return frame_paths, video_path, background_path
+
+
+def _decode_path(path, target_size=None, max_side=None):
+    """decode_image for an upload copied to path"""
+    with open(path, 'rb') as f:
+        return decode_image(f, target_size, max_side)
+
+
+def _spin_frames(frame_paths, video_path, count, max_side):
+    """Yield (frame, scale) for each frame of a spin, fitted to the preset's max_side"""
+    if video_path is None:
+        for path in frame_paths:
+            with open(path, 'rb') as f:
+                fitted_side, scale = render_scale(check_upload(f), max_side)
+                yield decode_image(f, None, fitted_side), scale
+        return
+    for image in read_video(video_path, count):
+        if image.width * image.height > MAX_IMAGE_PIXELS:
+            raise ImageTooLarge(f"Video frames of {image.width}x{image.height} are too large")
+        fitted_side, scale = render_scale(image.size, max_side)
+        if fitted_side is not None:
+            image = image.resize(ingest.fit_size(image.size, fitted_side), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        yield image, scale
+
+
+@timed('plate_blur')
+def _blur_spin_chunk(tracker, images):
+    """RGB arrays of consecutive spin frames, with their plates blurred"""
+    arrays = [np.array(image.convert('RGB')) for image in images]
+    tracker.blur_chunk(arrays)
+    return arrays
+
+
+@timed('detect_car_angle')
+def _spin_estimate(foreground_removed):
+    """The car box of a spin frame's matte and its (angle, orientation, confidence) estimate"""
+    bbox = car_bbox(foreground_removed)
+    if bbox is None:
+        return None, (0, 'front', 0.0)
+    return bbox, estimate_car_orientation(foreground_removed, bbox=bbox)
+
+
+async def _matte_spin_frame(blurred, region, mode, counts):
+    """Remove the background of a plate-blurred spin frame, within region only.
+
+    region (x0, y0, x1, y1) is where the car was in the previous frames, or
+    None for the whole frame. A matte reaching an edge of the region inside
+    the frame may be cut off, so the frame is matted again in full. Unlike a
+    single image, a spin waits for room in the matting queue instead of
+    failing frames.
+    """
+    height, width = blurred.shape[:2]
+    x0, y0, x1, y1 = region or (0, 0, width, height)
+    frame = frame_pool.acquire((y1 - y0, x1 - x0, 3))
+    try:
+        frame.array[...] = blurred[y0:y1, x0:x1]
+        while matting_batcher.full():
+            await asyncio.sleep(SPIN_BUSY_POLL_SECONDS)
+    except BaseException:
+        frame_pool.release(frame)
+        raise
+    with timed('matting'):
+        matte = await matting_batcher.submit((frame, mode))
+    alpha = np.asarray(matte)[..., 3]
+    if region is not None and reaches_crop_edge(alpha, region, (width, height)):
+        counts['rematted'] += 1
+        return await _matte_spin_frame(blurred, None, mode, counts)
+    counts['cropped_mattes' if region is not None else 'full_mattes'] += 1
+
+    rgba = np.zeros((height, width, 4), dtype=np.uint8)
+    rgba[..., :3] = blurred
+    rgba[y0:y1, x0:x1, 3] = alpha
+    return Image.fromarray(rgba, 'RGBA')
+
+
+async def _spin_result(index, foreground_removed, scale, raw, smoothed, background, options):
+    """Composite and encode one frame of a spin, with its smoothed angle, as a result line"""
+    result = {"frame": index}
+    try:
+        car_only = await pipeline.run('encode', options.encoder(foreground_removed, True, base64=True))
+        if background is not None:
+            background_image = await background(foreground_removed.size)
+            final_image, _, _, _ = await pipeline.run(
+                'composite', composite_car, foreground_removed, background_image, scale, smoothed
+            )
+            result["final_image"] = await pipeline.run('encode', options.encoder(final_image, False, base64=True))
+    except Exception as e:
+        result.update(success=False, error=str(e))
+        return result
+    angle, orientation, confidence = smoothed
+    result.update(
+        success=True,
+        car_only=car_only,
+        car_angle=angle,
+        car_orientation=orientation,
+        car_orientation_confidence=confidence,
+        raw_car_angle=raw[0],
+    )
+    return result
+
+
+@app.post("/api/process-spin")
+async def process_spin(
+    frames: List[UploadFile] = File(None),
+    video: UploadFile = File(None),
+    video_frames: int = Form(36),
+    background: UploadFile = File(None),
+    background_id: str = Form(None),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    preview: bool = Form(False),
+    preset: str = Form('print'),
+):
+    """Process the frames of a 360 degree spin as one sequence.
+
+    Takes the ``frames`` in order, or a ``video`` of which ``video_frames``
+    evenly spaced frames are used. Plates are detected in full on keyframes
+    and tracked in between, each frame is matted within the region the car
+    occupied in the frames before it, and car angles are smoothed across
+    frames (see spins.py), so a spin costs much less than its frames sent to
+    ``/api/process-images`` one by one, and its reflections do not jump.
+
+    Results are streamed as newline-delimited JSON, one line per frame in
+    order, tagged with its ``frame`` index: ``car_only``, ``final_image``
+    with a ``background`` or ``background_id``, and the smoothed
+    ``car_angle``, ``car_orientation`` and ``car_orientation_confidence``
+    along with the frame's own ``raw_car_angle``. A last ``summary`` line
+    counts the work done. Encoding, ``preview`` and ``preset`` are as for
+    ``/api/process-images`` and apply to every frame.
+    """
+    render_preset = get_preset(preset)
+    options = output_options(render_preset, 'json', output_format, quality, compress_level)
+    mode = PREVIEW_REMOVER_MODE if preview else REMOVER_MODE
+    if bool(frames) == bool(video):
+        raise HTTPException(status_code=400, detail="Send either frames or a video")
+    count = len(frames) if frames else video_frames
+    if not 1 <= count <= SPIN_MAX_FRAMES:
+        raise HTTPException(status_code=400, detail=f"A spin must have 1-{SPIN_MAX_FRAMES} frames")
+    if background and background_id:
+        raise HTTPException(status_code=400, detail="Send either background or background_id, not both")
+    if background_id:
+        check_background_id(background_id)
+    if matting_batcher.full():
+        raise _busy(StageBusy('matting', matting_batcher.retry_after()))
+
+    # The uploads are closed once we return; frames are decoded one chunk at
+    # a time from copies on disk rather than all held in memory
+    directory = tempfile.mkdtemp(prefix='spin-')
+    try:
+        frame_paths, video_path, background_path = await pipeline.run(
+            'decode', _spool_spin, directory, frames or [], video, background
+        )
+    except BaseException as e:
+        shutil.rmtree(directory, ignore_errors=True)
+        if isinstance(e, ImageTooLarge):
+            raise HTTPException(status_code=413, detail=str(e))
+        if isinstance(e, InvalidImage):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise
+
+    backgrounds = {}
+
+    def background_for(size):
+        """The background prepared for frames of size, decoded once per size"""
+        if size not in backgrounds:
+            if background_id:
+                load = pipeline.run('decode', background_buffer, background_id, size)
+            else:
+                load = pipeline.run('decode', _decode_path, background_path, size)
+            backgrounds[size] = asyncio.ensure_future(load)
+        return asyncio.shield(backgrounds[size])
+
+    async def generate():
+        tracker = PlateTracker(SPIN_KEYFRAME_INTERVAL)
+        smoother = AngleSmoother(SPIN_ANGLE_WINDOW)
+        counts = collections.Counter(cropped_mattes=0, full_mattes=0, rematted=0)
+        # Enough frames in flight to fill every matting batch, without one
+        # spin taking over the whole queue
+        matting_slots = asyncio.Semaphore(max(1, MATTING_WORKERS * MATTING_MAX_BATCH))
+        source = _spin_frames(frame_paths, video_path, count, render_preset.max_side)
+        use_background = background_for if background_path or background_id else None
+        held = {}
+        pending = []
+        region, region_size = None, None
+        index = 0
+
+        async def matte(blurred):
+            usable = region if region_size == blurred.shape[1::-1] else None
+            async with matting_slots:
+                return await _matte_spin_frame(blurred, usable, mode, counts)
+
+        try:
+            # The first frame is a chunk on its own, so the following ones
+            # have a car region to be matted in
+            chunk_size = 1
+            while True:
+                chunk = []
+                while len(chunk) < chunk_size and (item := await pipeline.run('decode', next, source, None)) is not None:
+                    chunk.append(item)
+                if not chunk:
+                    break
+                chunk_size = tracker.keyframe_interval
+                scales = [scale for _, scale in chunk]
+                blurred = await pipeline.run('plate_blur', _blur_spin_chunk, tracker, [image for image, _ in chunk])
+                del chunk
+                mattes = await asyncio.gather(*(matte(array) for array in blurred))
+                bboxes = []
+                for foreground_removed, scale in zip(mattes, scales):
+                    bbox, estimate = await pipeline.run('composite', _spin_estimate, foreground_removed)
+                    bboxes.append(bbox)
+                    held[index] = (foreground_removed, scale, estimate)
+                    index += 1
+                    for ready, smoothed in smoother.push(estimate):
+                        pending.append(asyncio.ensure_future(
+                            _spin_result(ready, *held.pop(ready), smoothed, use_background, options)
+                        ))
+                region_size = blurred[-1].shape[1::-1]
+                region = crop_region(bboxes, region_size)
+                del blurred, mattes
+
+                # Send the frames finished so far, in order
+                while pending and pending[0].done():
+                    yield _ndjson(pending.pop(0).result())
+
+            for ready, smoothed in smoother.flush():
+                pending.append(asyncio.ensure_future(
+                    _spin_result(ready, *held.pop(ready), smoothed, use_background, options)
+                ))
+            while pending:
+                yield _ndjson(await pending[0])
+                pending.pop(0)
+            yield _ndjson({"summary": dict(frames=index, **tracker.stats(), **counts)})
+        except Exception as e:
+            # A frame that cannot be decoded or processed ends the spin
+            yield _ndjson({"frame": index, "success": False, "error": str(e)})
+        finally:
+            # The client went away or the spin failed; drop work nobody will read
+            for task in pending + list(backgrounds.values()):
+                task.cancel()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+def _job_status(job):
+    status = {
+        "job_id": job['id'],
+        "status": job['status'],
+        "attempts": job['attempts'],
+        "created_at": job['created_at'],
+        "updated_at": job['updated_at'],
+    }
+    if job['error']:
+        status["error"] = job['error']
+    if job['status'] == jobs.DONE:
+        status.update(job['result'])
+        status["results"] = {name: f"/api/jobs/{job['id']}/{name}" for name in job['outputs']}
+    return status
+
+
+async def _queue_job(inputs, options):
+    """Submit a job, starting the job workers if it needs them; returns (job, whether it is new)"""
+    # Copying and hashing the uploads reads them in full, so it runs off the event loop
+    job, created = await pipeline.run('decode', job_store.submit, inputs, options)
+    if JOB_WORKERS and job['status'] in (jobs.QUEUED, jobs.RUNNING):
+        job_workers.ensure_running()
+    return job, created
+
+
+async def _queue_full_render(foreground, background, background_id, size, rendered):
+    """Queue the FULL_RENDER_PRESET render of a request and return the job status.
+
+    rendered is the (max_side, mode, encoding options) the request itself used;
+    if they are the full render's, nothing is queued and None is returned.
+    """
+    max_side, _ = render_scale(size, FULL_RENDER_PRESET.max_side)
+    encoding = OutputOptions.for_preset(FULL_RENDER_PRESET).as_dict()
+    if rendered == (max_side, REMOVER_MODE, encoding):
+        return None
+    options = dict(encoding, preview=False)
+    if FULL_RENDER_PRESET.max_side:
+        options["max_side"] = FULL_RENDER_PRESET.max_side
+    if background_id:
+        options["background_id"] = background_id
+    inputs = {"foreground": foreground.file}
+    if background:
+        inputs["background"] = background.file
+    job, _ = await _queue_job(inputs, options)
+    return _job_status(job)
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    response: Response,
+    foreground: UploadFile = File(...),
+    background: UploadFile = File(None),
+    output_format: str = Form(None),
+    quality: int = Form(None),
+    compress_level: int = Form(None),
+    preview: bool = Form(False),
+    background_id: str = Form(None),
+    preset: str = Form('print'),
+):
+    """Queue a car for processing by the job workers and return its job id.
+
+    Takes the same fields as ``/api/process-images``, apart from the response
+    mode and full_render. The job id is derived from the uploads and options,
+    so submitting the same request again returns the existing job (200
+    instead of 202) without redoing the work.
+    """
+    render_preset = get_preset(preset)
+    output = output_options(render_preset, 'json', output_format, quality, compress_level)
+    if background and background_id:
+        raise HTTPException(status_code=400, detail="Send either background or background_id, not both")
+    if background_id:
+        check_background_id(background_id)
+    inputs = {"foreground": foreground.file}
+    if background:
+        inputs["background"] = background.file
+    try:
+        for source in inputs.values():
+            await pipeline.run('decode', check_upload, source)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    options = dict(output.as_dict(), preview=preview)
+    # Only set when it scales, so full-resolution jobs keep their ids
+    if render_preset.max_side:
+        options["max_side"] = render_preset.max_side
+    if background_id:
+        options["background_id"] = background_id
+    job, created = await _queue_job(inputs, options)
+    if not created:
+        response.status_code = 200
+    return _job_status(job)
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Status of a job; with ``wait``, hold the request up to that many seconds until it finishes"""
+    deadline = time.monotonic() + min(max(wait, 0), JOB_MAX_WAIT_SECONDS)
+    while True:
+        # SQLite queries block, so they run off the event loop
+        job = await pipeline.run('decode', job_store.get, job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="No such job")
+        if job['status'] in (jobs.DONE, jobs.FAILED) or time.monotonic() >= deadline:
+            return _job_status(job)
+        await asyncio.sleep(JOB_WAIT_POLL_SECONDS)
+
+
+@app.get("/api/jobs/{job_id}/{name}")
+def get_job_result(job_id: str, name: str):
+    """One result image of a finished job"""
+    job = job_store.get(job_id)
+    if job is None or job['status'] != jobs.DONE or name not in job['outputs']:
+        raise HTTPException(status_code=404, detail="No such result")
+    return FileResponse(job_store.output_path(job_id, name), media_type=job['outputs'][name])
+
+
+@app.get("/api/job-stats")
+def job_stats():
+    """Jobs in each state and the number of job workers running in this server"""
+    return {"jobs": job_store.counts(), "workers": job_workers.alive()}
+
+
+@app.post("/api/backgrounds")
+async def register_background(response: Response, background: UploadFile = File(...)):
+    """Register a background once, for requests to refer to by ``background_id``.
+
+    The id is derived from the image content: registering the same image again
+    returns the existing id (200 instead of 201).
+    """
+    try:
+        info, created = await pipeline.run('decode', background_store.register, background.file)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    response.status_code = 201 if created else 200
+    return info
+
+
+@app.get("/api/backgrounds/{background_id}")
+def get_background(background_id: str):
+    """Id, width and height of a registered background"""
+    info = background_store.info(background_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail=f"No background {background_id}")
+    return info
+
+
+@app.delete("/api/backgrounds/{background_id}", status_code=204)
+def delete_background(background_id: str):
+    """Forget a registered background and its prepared sizes"""
+    if not background_store.delete(background_id):
+        raise HTTPException(status_code=404, detail=f"No background {background_id}")
+    return Response(status_code=204)
+
+
+@app.get("/api/background-stats")
+def background_stats():
+    """Hit/miss/eviction counters of the prepared background buffers"""
+    return background_store.stats()
+
+
+@app.get("/api/pipeline-stats")
+def pipeline_stats():
+    """Queue depth and latency of each request stage"""
+    stats = pipeline.stats()
+    stats["matting"]["batching"] = matting_batcher.stats()
+    stats["matting"]["frames"] = frame_pool.stats()
+    return stats
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Step, stage and request latency histograms in the Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/cache-stats")
+def cache_stats():
+    """Hit/miss/eviction counters of the matte cache"""
+    return matte_cache.stats()
+
 
 if __name__ == "__main__":
     uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,244 @@
+"""
+Spin sets: ordered frames of a car turning, processed as one sequence.
+
+Dealers shoot 24-72 frame 360 degree spins. Consecutive frames differ by a
+few degrees, which processing them one by one ignores:
+
+- Plates are detected on the whole image only on keyframes, every
+  keyframe_interval frames. The frames in between are searched only around
+  the plates of the previous frame and of the next keyframe, which also
+  catches a plate coming into view. A tracked plate the window search misses
+  is interpolated towards its keyframe position, so it stays blurred.
+- Matting runs on the region the car occupied in the previous frames
+  (their mattes grown by a margin) rather than on the whole frame. A matte
+  reaching the edge of its region, where the car may continue, is redone
+  on the whole frame.
+- Angle estimates are smoothed over a centred window of frames, weighted by
+  their confidence, so the reflection does not jump between frames.
+"""
+import collections
+import math
+
+import numpy as np
+from PIL import Image
+
+import ingest
+from plates import blur_regions, detect_plates
+
+# Plates are searched for within their box grown by this share of its size on each side
+PLATE_SEARCH_MARGIN = 1.0
+
+# A tracked plate matches a keyframe plate whose centre is within this many plate widths
+PLATE_MATCH_DISTANCE = 1.5
+
+# The matting region is the previous frames' car boxes grown by this share of the frame on each side
+CROP_MARGIN = 0.08
+
+# Added to every confidence when smoothing, so frames with none still count a little
+MIN_ANGLE_WEIGHT = 0.05
+
+# estimate_car_orientation's angles repeat every 90 degrees (a rectangle's sides swap)
+ANGLE_PERIOD = 90.0
+
+
+class PlateTracker:
+    """
+    Plate detection and blurring across the frames of a spin, in chunks.
+    Args:
+        keyframe_interval (int): Frames per chunk; the last frame of each chunk
+            is a keyframe, detected in full. 1 detects every frame in full.
+    """
+
+    def __init__(self, keyframe_interval=4):
+        self.keyframe_interval = max(1, keyframe_interval)
+        self.previous = []
+        self.keyframes = 0
+        self.tracked_frames = 0
+        self.interpolated = 0
+
+    def blur_chunk(self, frames):
+        """
+        Blur the plates of consecutive RGB frames in place; the last one is the keyframe.
+        Returns:
+            list: The (x, y, w, h) plate boxes of each frame.
+        """
+        key_boxes = detect_plates(frames[-1])
+        self.keyframes += 1
+        boxes = []
+        for position, frame in enumerate(frames[:-1]):
+            found = self._track(frame, key_boxes, steps_to_key=len(frames) - 1 - position)
+            boxes.append(found)
+            self.previous = found
+        boxes.append(key_boxes)
+        self.previous = key_boxes
+        for frame, frame_boxes in zip(frames, boxes):
+            blur_regions(frame, frame_boxes)
+        return boxes
+
+    def stats(self):
+        return {
+            "plate_keyframes": self.keyframes,
+            "plate_tracked_frames": self.tracked_frames,
+            "plates_interpolated": self.interpolated,
+        }
+
+    def _track(self, frame, key_boxes, steps_to_key):
+        self.tracked_frames += 1
+        height, width = frame.shape[:2]
+        candidates = self.previous + key_boxes
+        if not candidates:
+            return []
+        found = detect_plates(frame, windows=[_grow(box, PLATE_SEARCH_MARGIN, (width, height)) for box in candidates])
+        # Plates of the previous frame still present at the keyframe but missed
+        # here move towards their keyframe position instead of going unblurred
+        for box in self.previous:
+            if any(_overlaps(box, other) for other in found):
+                continue
+            target = _nearest(box, key_boxes)
+            if target is None:
+                continue
+            found.append(tuple(round(a + (b - a) / steps_to_key) for a, b in zip(box, target)))
+            self.interpolated += 1
+        return found
+
+
+def _grow(box, margin, size):
+    """An (x, y, w, h) box grown by margin times its size on each side, as a clamped (x0, y0, x1, y1) window"""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    return max(0, x - dx), max(0, y - dy), min(size[0], x + w + dx), min(size[1], y + h + dy)
+
+
+def _overlaps(a, b):
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def _nearest(box, boxes):
+    """The box of boxes closest to box, if its centre is within PLATE_MATCH_DISTANCE plate widths"""
+    cx, cy = box[0] + box[2] / 2, box[1] + box[3] / 2
+    best, best_distance = None, PLATE_MATCH_DISTANCE * box[2]
+    for other in boxes:
+        distance = math.hypot(other[0] + other[2] / 2 - cx, other[1] + other[3] / 2 - cy)
+        if distance <= best_distance:
+            best, best_distance = other, distance
+    return best
+
+
+def crop_region(bboxes, size, margin=CROP_MARGIN):
+    """
+    Region to matte the next frames in: the union of the previous frames' car
+    boxes (x0, y0, x1, y1), grown by margin times the frame size on each side.
+    Returns:
+        tuple: (x0, y0, x1, y1), or None when no frame had a car.
+    """
+    bboxes = [box for box in bboxes if box is not None]
+    if not bboxes:
+        return None
+    width, height = size
+    dx, dy = int(width * margin), int(height * margin)
+    return (
+        max(0, min(box[0] for box in bboxes) - dx),
+        max(0, min(box[1] for box in bboxes) - dy),
+        min(width, max(box[2] for box in bboxes) + dx),
+        min(height, max(box[3] for box in bboxes) + dy),
+    )
+
+
+def reaches_crop_edge(alpha, region, size):
+    """Whether a matte of region reaches one of its edges that is not also an edge of the frame"""
+    x0, y0, x1, y1 = region
+    width, height = size
+    car = alpha > 0
+    return bool(
+        (x0 > 0 and car[:, 0].any()) or (x1 < width and car[:, -1].any())
+        or (y0 > 0 and car[0].any()) or (y1 < height and car[-1].any())
+    )
+
+
+class AngleSmoother:
+    """
+    Confidence-weighted smoothing of per-frame (angle, orientation, confidence)
+    estimates over a centred window of frames. Results lag the input by half
+    the window.
+    Args:
+        window (int): Frames averaged, centred on each frame; 1 disables smoothing.
+    """
+
+    def __init__(self, window=5):
+        self.half = max(0, window // 2)
+        self.estimates = []
+        self._next = 0
+
+    def push(self, estimate):
+        """Add the next frame's estimate; returns the (index, smoothed estimate) pairs now final"""
+        self.estimates.append(estimate)
+        ready = []
+        while self._next + self.half < len(self.estimates):
+            ready.append((self._next, self._smooth(self._next)))
+            self._next += 1
+        return ready
+
+    def flush(self):
+        """The remaining (index, smoothed estimate) pairs, once all frames were pushed"""
+        ready = [(index, self._smooth(index)) for index in range(self._next, len(self.estimates))]
+        self._next = len(self.estimates)
+        return ready
+
+    def _smooth(self, index):
+        window = self.estimates[max(0, index - self.half):index + self.half + 1]
+        weights = [confidence + MIN_ANGLE_WEIGHT for _, _, confidence in window]
+        angle = circular_mean([angle for angle, _, _ in window], weights, ANGLE_PERIOD)
+        votes = collections.Counter()
+        for (_, orientation, _), weight in zip(window, weights):
+            votes[orientation] += weight
+        confidence = sum(c * w for (_, _, c), w in zip(window, weights)) / sum(weights)
+        return round(angle, 1), votes.most_common(1)[0][0], round(confidence, 3)
+
+
+def circular_mean(angles, weights, period):
+    """Weighted mean of angles that wrap around every period, in (0, period]"""
+    x = sum(w * math.cos(2 * math.pi * a / period) for a, w in zip(angles, weights))
+    y = sum(w * math.sin(2 * math.pi * a / period) for a, w in zip(angles, weights))
+    mean = math.atan2(y, x) * period / (2 * math.pi) % period
+    return mean if mean > 0 else period
+
+
+def open_video(path):
+    """A cv2.VideoCapture of a video file; raises InvalidImage if it cannot be read"""
+    import cv2
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ingest.InvalidImage("Upload is not a readable video")
+    return capture
+
+
+def read_video(path, count):
+    """
+    Decode count frames evenly spaced through a video file.
+    Args:
+        path (str): The video file.
+        count (int): Frames to return; fewer if the video is shorter.
+    Yields:
+        PIL.Image.Image: RGB frames in order.
+    """
+    import cv2
+
+    capture = open_video(path)
+    try:
+        total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        # Without a reliable frame count, take the first count frames
+        wanted = set(np.linspace(0, total - 1, count).round().astype(int)) if total > 0 else set(range(count))
+        last = max(wanted)
+        for index in range(last + 1):
+            # Frames that are not kept are only grabbed, not converted
+            if not capture.grab():
+                break
+            if index not in wanted:
+                continue
+            ok, bgr = capture.retrieve()
+            if not ok:
+                break
+            yield Image.fromarray(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    finally:
+        capture.release()
@@ -1,6 +1,23 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import ImageUploader from './ImageUploader';
-import { processImages, ProcessedImages } from '../api/imageApi';
+import { processImages, ProcessedImages, waitForFullRender } from '../api/imageApi';
+
+// Resolution shown while the full-resolution render is in progress
+const PREVIEW_PRESET = 'web';
+
+// File extension of a result: from the content type of a full render's blob,
+// or from the data URI of a preview
+const extensionOf = (images: ProcessedImages, name: 'car_only' | 'final_image') =>
+  images.extensions?.[name] || images[name]?.match(/^data:image\/(\w+)/)?.[1] || 'png';
+
+// Free the object URLs of a full render that is no longer shown
+const revokeFullRender = (images: ProcessedImages | null) => {
+  [images?.car_only, images?.final_image].forEach((url) => {
+    if (url?.startsWith('blob:')) {
+      URL.revokeObjectURL(url);
+    }
+  });
+};
 
 const ImageProcessor: React.FC = () => {
   const [foregroundImage, setForegroundImage] = useState<File | null>(null);
@@ -11,11 +28,27 @@ const ImageProcessor: React.FC = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   const [error, setError] = useState<string | null>(null);
   const [showOriginal, setShowOriginal] = useState(false);
+  const [isRendering, setIsRendering] = useState(false);
+  // Cancels waiting for a full render that is no longer wanted
+  const fullRender = useRef<AbortController | null>(null);
+
+  // Release the shown images' object URLs when they are replaced or on unmount
+  useEffect(() => () => revokeFullRender(processedImages), [processedImages]);
+
+  // Stop waiting for a full render on unmount
+  useEffect(() => () => fullRender.current?.abort(), []);
+
+  const cancelFullRender = () => {
+    fullRender.current?.abort();
+    fullRender.current = null;
+    setIsRendering(false);
+  };
 
   const handleForegroundSelected = (file: File) => {
     setForegroundImage(file);
     setForegroundPreview(URL.createObjectURL(file));
     // Reset processed images when a new foreground is selected
+    cancelFullRender();
     setProcessedImages(null);
   };
 
@@ -26,6 +59,7 @@ const ImageProcessor: React.FC = () => {
     }
     setForegroundImage(null);
     setForegroundPreview(null);
+    cancelFullRender();
     setProcessedImages(null);
   };
 
@@ -33,6 +67,7 @@ const ImageProcessor: React.FC = () => {
     setBackgroundImage(file);
     setBackgroundPreview(URL.createObjectURL(file));
     // Reset processed images when a new background is selected
+    cancelFullRender();
     setProcessedImages(null);
   };
 
@@ -43,6 +78,7 @@ const ImageProcessor: React.FC = () => {
     }
     setBackgroundImage(null);
     setBackgroundPreview(null);
+    cancelFullRender();
     setProcessedImages(null);
   };
 
@@ -52,18 +88,50 @@ const ImageProcessor: React.FC = () => {
       return;
     }
 
+    cancelFullRender();
     setIsProcessing(true);
     setError(null);
 
+    let result: ProcessedImages;
     try {
-      const result = await processImages(foregroundImage, backgroundImage || undefined);
+      // A quick preview first; the full resolution result replaces it when ready
+      result = await processImages(foregroundImage, backgroundImage || undefined, {
+        preset: PREVIEW_PRESET,
+        fullRender: true,
+      });
       setProcessedImages(result);
     } catch (err) {
       setError('Failed to process images. Please try again.');
       console.error(err);
+      return;
     } finally {
       setIsProcessing(false);
     }
+
+    if (!result.full_render) {
+      return;
+    }
+    const controller = new AbortController();
+    fullRender.current = controller;
+    setIsRendering(true);
+    try {
+      const full = await waitForFullRender(result.full_render, controller.signal);
+      if (controller.signal.aborted) {
+        revokeFullRender(full);
+      } else {
+        setProcessedImages(full);
+      }
+    } catch (err) {
+      // The preview stays; only report failures of renders still wanted
+      if (!controller.signal.aborted) {
+        console.error(err);
+      }
+    } finally {
+      if (fullRender.current === controller) {
+        fullRender.current = null;
+        setIsRendering(false);
+      }
+    }
   };
 
   const handleDownload = (imageUrl: string, fileName: string) => {
@@ -129,6 +197,9 @@ const ImageProcessor: React.FC = () => {
         {processedImages?.final_image ? (
           <div>
             <h3 className="text-lg font-medium mb-3">Final Composite</h3>
+            {isRendering && (
+              <p className="text-sm text-gray-600 mb-2">Preview shown, rendering full resolution...</p>
+            )}
             {processedImages.car_angle !== undefined && processedImages.car_orientation && (
               <p className="text-sm text-gray-600 mb-2">
                 Car Angle: {processedImages.car_orientation.charAt(0).toUpperCase() + 
@@ -181,14 +252,14 @@ const ImageProcessor: React.FC = () => {
             
             <div className="flex gap-3">
               <button
-                onClick={() => processedImages.final_image && handleDownload(processedImages.final_image, 'final_image.png')}
+                onClick={() => processedImages.final_image && handleDownload(processedImages.final_image, `final_image.${extensionOf(processedImages, 'final_image')}`)}
                 className="px-4 py-2 bg-green-600 text-white rounded hover:bg-green-700 transition-colors"
               >
                 Download Final Image
               </button>
               
               <button
-                onClick={() => processedImages.car_only && handleDownload(processedImages.car_only, 'car_only.png')}
+                onClick={() => processedImages.car_only && handleDownload(processedImages.car_only, `car_only.${extensionOf(processedImages, 'car_only')}`)}
                 className="px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700 transition-colors"
               >
                 Download Car Only